@@ -0,0 +1,179 @@
+# batch_renderer.py
+"""
+تولید دسته‌ای PDF صورتحساب‌ها (مثلاً اجرای آخر ماه) روی چند پروسه.
+شناسه‌ها در بسته‌های کوچک بین پروسه‌های یک ProcessPoolExecutor پخش می‌شوند؛ هر پروسه کارگر یک
+InvoiceGenerator و یک InvoiceManager (با اتصال دیتابیس خودش) دارد و هر صورتحساب را با یک RenderContext
+تازه رندر می‌کند، پس کارها هیچ وضعیت مشترکی ندارند و سرعت با تعداد هسته‌ها بالا می‌رود.
+
+مثال:
+    python batch_renderer.py --from 1403/12/01 --to 1403/12/30
+    python batch_renderer.py --ids 12 13 14 --template-id 2 --output-dir out --workers 4
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from invoice_manager import InvoiceManager
+from invoice_template_manager import InvoiceTemplateManager
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.expanduser("~"), "Documents", "EasyInvoice_Invoices", "Batch")
+_UNSAFE_FILENAME_CHARS = re.compile(r'[\\/:*?"<>|\s]+')
+
+# وضعیت هر پروسه کارگر (در _init_worker یک بار ساخته می‌شود)
+_worker_generator = None
+_worker_invoice_manager = None
+_worker_template = None
+
+
+def invoice_pdf_filename(invoice):
+    """ نام فایل PDF یک صورتحساب (مثل save_and_print_invoice)، بدون کاراکترهای غیرمجاز در نام فایل """
+    name = f"Invoice_{invoice.invoice_number}_{(invoice.issue_date or '').replace('/', '-')}"
+    return _UNSAFE_FILENAME_CHARS.sub("_", name) + ".pdf"
+
+
+def _init_worker(invoice_template):
+    """ راه‌اندازی پروسه کارگر: ثبت فونت‌ها و ساخت مدیرها فقط یک بار برای هر پروسه """
+    global _worker_generator, _worker_invoice_manager, _worker_template
+    from invoice_generator import InvoiceGenerator
+    from settings_manager import SettingsManager
+    _worker_invoice_manager = InvoiceManager()
+    _worker_generator = InvoiceGenerator(SettingsManager())
+    _worker_template = invoice_template
+
+
+def _render_chunk(invoice_ids, output_dir, skip_existing):
+    """ رندر یک بسته از صورتحساب‌ها در پروسه کارگر؛ خروجی: [(invoice_id, success, مسیر فایل یا پیام خطا)] """
+    results = []
+    for invoice_id in invoice_ids:
+        try:
+            bundle, message = _worker_invoice_manager.get_invoice_bundle(invoice_id)
+            if not bundle:
+                results.append((invoice_id, False, message))
+                continue
+            output_path = os.path.join(output_dir, invoice_pdf_filename(bundle.invoice))
+            if skip_existing and os.path.exists(output_path):
+                results.append((invoice_id, True, output_path))
+                continue
+            success, detail = _worker_generator.create_invoice_pdf_from_bundle(bundle, output_path, _worker_template)
+            results.append((invoice_id, success, detail))
+        except Exception as e:
+            results.append((invoice_id, False, f"خطا در تولید PDF: {e}"))
+    return results
+
+
+class BatchInvoiceRenderer:
+    """
+    رندر دسته‌ای صورتحساب‌ها در output_dir با max_workers پروسه (پیش‌فرض: تعداد هسته‌ها).
+    progress(done, total, invoice_id, success, detail) در نخ فراخواننده و بعد از رسیدن نتیجه هر بسته
+    صدا زده می‌شود؛ رابط کاربری باید render را در یک نخ پس‌زمینه اجرا کند و پیشرفت را با after() نمایش دهد.
+    """
+    MAX_CHUNK_SIZE = 25 # حداکثر تعداد صورتحساب در هر کار (کمتر = پخش بار بهتر، بیشتر = سربار IPC کمتر)
+    CHUNKS_PER_WORKER = 4 # برای لیست‌های کوچک‌تر، بسته‌ها آن‌قدر کوچک می‌شوند که هر پروسه حداقل این تعداد کار بگیرد
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR, invoice_template=None, max_workers=None, skip_existing=False):
+        self.output_dir = output_dir
+        self.invoice_template = invoice_template
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.skip_existing = skip_existing
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """ توقف بعد از بسته‌های در حال اجرا (از هر نخی قابل فراخوانی است) """
+        self._cancel_event.set()
+
+    def render_date_range(self, start_date=None, end_date=None, progress=None):
+        """ رندر همه صورتحساب‌های صادر شده در بازه تاریخ (شمسی، YYYY/MM/DD) """
+        invoice_ids, message = InvoiceManager().get_invoice_ids(start_date, end_date)
+        if not invoice_ids:
+            return [], f"صورتحسابی در این بازه یافت نشد. {message}"
+        return self.render(invoice_ids, progress)
+
+    def render(self, invoice_ids, progress=None):
+        """
+        رندر صورتحساب‌های داده شده.
+        خروجی: (results, message) که results لیست (invoice_id, success, مسیر فایل یا پیام خطا) به ترتیب
+        invoice_ids است؛ خطای یک صورتحساب بقیه را متوقف نمی‌کند.
+        """
+        invoice_ids = list(dict.fromkeys(invoice_ids))
+        if not invoice_ids:
+            return [], "صورتحسابی برای تولید وجود ندارد."
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+        except OSError as e:
+            return [], f"خطا در ساخت پوشه خروجی: {e}"
+        self._cancel_event.clear()
+
+        workers = min(self.max_workers, len(invoice_ids))
+        chunk_size = max(1, min(self.MAX_CHUNK_SIZE, math.ceil(len(invoice_ids) / (workers * self.CHUNKS_PER_WORKER))))
+        chunks = [invoice_ids[i:i + chunk_size] for i in range(0, len(invoice_ids), chunk_size)]
+        results = {}
+        # spawn: پروسه‌های کارگر استخر اتصال SQLite پروسه اصلی را به ارث نمی‌برند (و رفتار مثل ویندوز است)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(self.invoice_template,)) as executor:
+            futures = {executor.submit(_render_chunk, chunk, self.output_dir, self.skip_existing): chunk
+                       for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    chunk_results = future.result()
+                except Exception as e: # مثلاً از کار افتادن یک پروسه کارگر
+                    chunk_results = [(invoice_id, False, f"خطا در پروسه کارگر: {e}") for invoice_id in futures[future]]
+                for invoice_id, success, detail in chunk_results:
+                    results[invoice_id] = (success, detail)
+                    if progress:
+                        progress(len(results), len(invoice_ids), invoice_id, success, detail)
+                if self._cancel_event.is_set():
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    break
+
+        ordered = [(invoice_id,) + results[invoice_id] for invoice_id in invoice_ids if invoice_id in results]
+        failed = sum(1 for _, success, _ in ordered if not success)
+        message = f"{len(ordered) - failed} از {len(invoice_ids)} صورتحساب در {self.output_dir} تولید شد."
+        if failed:
+            message += f" {failed} صورتحساب با خطا مواجه شد."
+        if len(ordered) < len(invoice_ids):
+            message += " عملیات لغو شد."
+        return ordered, message
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render EasyInvoice PDFs in parallel.")
+    parser.add_argument("--from", dest="start_date", help="first issue date (YYYY/MM/DD, Jalali)")
+    parser.add_argument("--to", dest="end_date", help="last issue date (YYYY/MM/DD, Jalali)")
+    parser.add_argument("--ids", type=int, nargs="+", help="explicit invoice ids (instead of a date range)")
+    parser.add_argument("--template-id", type=int, help="invoice template to render with")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: CPU count)")
+    parser.add_argument("--skip-existing", action="store_true", help="keep PDFs that already exist in the output dir")
+    args = parser.parse_args(argv)
+
+    invoice_template = None
+    if args.template_id is not None:
+        invoice_template, message = InvoiceTemplateManager().get_template_by_id(args.template_id)
+        if invoice_template is None:
+            print(f"Template {args.template_id} not found. {message}")
+            return 1
+
+    renderer = BatchInvoiceRenderer(args.output_dir, invoice_template, args.workers, args.skip_existing)
+
+    def report(done, total, invoice_id, success, detail):
+        if not success:
+            print(f"invoice {invoice_id}: {detail}")
+        if done == total or done % 100 == 0:
+            print(f"{done}/{total}")
+
+    if args.ids:
+        results, message = renderer.render(args.ids, report)
+    else:
+        results, message = renderer.render_date_range(args.start_date, args.end_date, report)
+    print(message)
+    return 0 if results and all(success for _, success, _ in results) else 1
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
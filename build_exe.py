@@ -16,6 +16,15 @@ DIST_FOLDER_NAME = "dist"
 # --- نام فایل EXE نهایی (بدون ورژن) ---
 BASE_EXE_NAME = "EasyInvoice"
 
+# --- ماژول‌هایی که main_app با importlib (به صورت تنبل) ایمپورت می‌کند و PyInstaller خودش پیدا نمی‌کند ---
+# باید با PAGE_FACTORIES و PRELOAD_MODULES در main_app.py هماهنگ بماند
+HIDDEN_IMPORTS = [
+    "settings_ui", "customer_ui", "contract_ui", "invoice_manager_ui",
+    "invoice_main_ui", "invoice_list_ui", "invoice_details_window", "invoice_generator",
+    "jdatetime", "PIL.Image", "PIL.ImageTk", "fitz",
+    "reportlab.pdfbase.pdfmetrics", "reportlab.pdfbase.ttfonts", "bs4",
+]
+
 def _read_version_data_for_build():
     """ مقادیر ورژن را از فایل version.ini می‌خواند. """
     config = configparser.ConfigParser()
@@ -108,6 +117,7 @@ def run_pyinstaller():
             f"--add-data={os.path.join(os.path.dirname(os.path.abspath(__file__)), VERSION_CONFIG_FILE)};.", # اضافه کردن version.ini به root برنامه
             f"--add-data=assets;assets", # اگر پوشه assets دارید (آیکون‌ها، تمپلیت‌ها و...)
             # f"--icon=app_icon.ico", # اگر فایل آیکون دارید (نیاز به یک فایل .ico در روت پروژه)
+            *[f"--hidden-import={module_name}" for module_name in HIDDEN_IMPORTS],
             MAIN_APP_SCRIPT
         ]
         
@@ -0,0 +1,80 @@
+# change_events.py
+import threading
+
+# نوع موجودیت‌هایی که مدیرها برایشان رویداد تغییر منتشر می‌کنند
+CUSTOMER = "customer"
+CONTRACT = "contract"
+SERVICE = "service"
+INVOICE = "invoice"
+INVOICE_TEMPLATE = "invoice_template"
+
+# نوع تغییر
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+
+
+class ChangeEvent:
+    """ یک تغییر در داده‌ها: نوع موجودیت، شناسه آن و نوع عملیات """
+    def __init__(self, entity, entity_id, operation):
+        self.entity = entity
+        self.entity_id = entity_id
+        self.operation = operation
+
+    def __repr__(self):
+        return f"ChangeEvent({self.entity!r}, {self.entity_id!r}, {self.operation!r})"
+
+
+class ChangeEventBus:
+    """
+    باس رویداد تغییرات داده‌ها در سطح مدیرها (مشترک در کل پروسه).
+    مدیرها بعد از هر افزودن/ویرایش/حذف موفق publish می‌کنند تا لیست‌ها و کش‌ها به جای بارگذاری دوباره
+    کل جدول، فقط ردیف تغییر کرده را به‌روز کنند. مشترک‌ها در همان نخی که تغییر را انجام داده (در برنامه
+    همان نخ Tk) فراخوانی می‌شوند.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {} # entity -> [callback]
+
+    @classmethod
+    def shared(cls):
+        """ نمونه مشترک باس در کل پروسه """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def subscribe(self, entity, callback):
+        """ ثبت callback(event) برای تغییرات یک نوع موجودیت """
+        with self._lock:
+            self._subscribers.setdefault(entity, []).append(callback)
+        return callback
+
+    def unsubscribe(self, entity, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(entity, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def subscribe_widget(self, widget, entity, callback):
+        """ مانند subscribe، اما با از بین رفتن ویجت (رویداد <Destroy>) اشتراک خودکار لغو می‌شود """
+        self.subscribe(entity, callback)
+        def on_destroy(event):
+            if event.widget is widget:
+                self.unsubscribe(entity, callback)
+        widget.bind("<Destroy>", on_destroy, add="+")
+        return callback
+
+    def publish(self, entity, entity_id, operation):
+        """ اطلاع دادن یک تغییر به همه مشترک‌های آن نوع موجودیت """
+        event = ChangeEvent(entity, entity_id, operation)
+        with self._lock:
+            callbacks = list(self._subscribers.get(entity, ()))
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error handling {event}: {e}")
@@ -3,21 +3,33 @@ import os
 import sqlite3
 import random 
 import json # برای serializing/deserializing لیست scanned_pages
-from db_manager import DBManager, DATABASE_NAME
+from text_normalizer import normalize_search_text
+from db_manager import (DBManager, DATABASE_NAME, CONTRACT_FTS_COLUMNS, CONTRACT_FTS_DEFAULT_COLUMNS,
+                        CONTRACT_FTS_WEIGHTS, fts_phrase, like_pattern, keyset_clause)
 from models import Contract
+from change_events import ChangeEventBus, CONTRACT, INSERT, UPDATE, DELETE
 import sys 
 
 
 class ContractManager:
+    _INSERT_QUERY = """
+    INSERT INTO Contracts (
+        customer_id, contract_number, contract_date, total_amount, description, title, payment_method, scanned_pages
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
     def __init__(self):
         db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATABASE_NAME)
         self.db_manager = DBManager(db_path)
+        self._fts_enabled = None
         # self.persian_alphabet_parts = ["الف", "ب", "ت", "ج", "ح", "د", "ر", "ز", "س", "ش", "ص", "ط"] # دیگر نیازی نیست
 
     # get_next_contract_number حذف شد
 
-    def add_contract(self, contract: Contract):
-        """ اضافه کردن یک قرارداد جدید به دیتابیس. """
+    def add_contract(self, contract: Contract | list[Contract]):
+        """ اضافه کردن یک قرارداد جدید (یا لیستی از قراردادها به صورت دسته‌ای) به دیتابیس. """
+        if isinstance(contract, list):
+            return self._add_contracts_batch(contract)
         if not self.db_manager.connect():
             return False, "خطا در اتصال به دیتابیس." 
         try:
@@ -28,19 +40,19 @@ class ContractManager:
             # تبدیل لیست scanned_pages به رشته JSON برای ذخیره در دیتابیس
             scanned_pages_json = json.dumps(contract.scanned_pages)
 
-            query = """
-            INSERT INTO Contracts (
-                customer_id, contract_number, contract_date, total_amount, description, title, payment_method, scanned_pages
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """ 
             params = (
                 contract.customer_id, contract.contract_number, contract.contract_date,
                 contract.total_amount, contract.description, contract.title, contract.payment_method, scanned_pages_json # استفاده از رشته JSON
             )
             
-            cursor = self.db_manager.execute_query(query, params) 
+            with self.db_manager.transaction():
+                cursor = self.db_manager.execute_query(self._INSERT_QUERY, params)
+                if cursor:
+                    self.db_manager.refresh_contract_search_index([cursor.lastrowid])
             self.db_manager.close()
             if cursor:
+                contract.id = cursor.lastrowid
+                ChangeEventBus.shared().publish(CONTRACT, contract.id, INSERT)
                 return True, "قرارداد با موفقیت اضافه شد." 
             else:
                 return False, "خطا در اضافه کردن قرارداد." 
@@ -54,6 +66,43 @@ class ContractManager:
             self.db_manager.close()
             return False, f"خطای ناشناخته در اضافه کردن قرارداد: {e}" 
 
+    def _add_contracts_batch(self, contracts):
+        """ درج دسته‌ای قراردادها با executemany در یک تراکنش؛ شناسه‌های جدید روی آبجکت‌ها ست می‌شوند. """
+        if not contracts:
+            return True, "قراردادی برای افزودن وجود ندارد."
+        if any(not contract.contract_number for contract in contracts):
+            return False, "شماره قرارداد نمی‌تواند خالی باشد."
+        if not self.db_manager.connect():
+            return False, "خطا در اتصال به دیتابیس."
+        try:
+            params_seq = [
+                (
+                    contract.customer_id, contract.contract_number, contract.contract_date,
+                    contract.total_amount, contract.description, contract.title, contract.payment_method,
+                    json.dumps(contract.scanned_pages)
+                )
+                for contract in contracts
+            ]
+            with self.db_manager.transaction():
+                new_ids = self.db_manager.insert_many(self._INSERT_QUERY, params_seq)
+                self.db_manager.refresh_contract_search_index(new_ids)
+            for contract, new_id in zip(contracts, new_ids):
+                contract.id = new_id
+            self.db_manager.close()
+            bus = ChangeEventBus.shared()
+            for new_id in new_ids:
+                bus.publish(CONTRACT, new_id, INSERT)
+            return True, f"{len(contracts)} قرارداد با موفقیت اضافه شد."
+        except sqlite3.IntegrityError as e:
+            self.db_manager.close()
+            if "UNIQUE constraint failed: Contracts.contract_number" in str(e):
+                return False, "شماره قرارداد تکراری است. لطفاً شماره دیگری را وارد کنید."
+            else:
+                return False, f"خطای تکراری بودن داده: {e}"
+        except Exception as e:
+            self.db_manager.close()
+            return False, f"خطای ناشناخته در اضافه کردن قرارداد: {e}"
+
     def get_all_contracts(self):
         """ بازیابی تمام قراردادها از دیتابیس (با اطلاعات مشتری) """
         if not self.db_manager.connect():
@@ -81,6 +130,221 @@ class ContractManager:
         self.db_manager.close()
         return contracts, "قراردادها با موفقیت بازیابی شدند." 
 
+    _LIST_COLUMNS = """
+        c.id, c.customer_id, c.contract_number, c.contract_date,
+        c.total_amount, c.description, c.title, c.payment_method, c.scanned_pages,
+        cust.name as customer_name"""
+    _LIST_FROM = """
+    FROM Contracts c
+    JOIN Customers cust ON c.customer_id = cust.id
+    """
+    _LIST_SELECT = f"SELECT {_LIST_COLUMNS} {_LIST_FROM}"
+
+    @staticmethod
+    def _contract_from_row(row):
+        contract_data = dict(row)
+        contract_obj = Contract.from_dict(contract_data)
+        contract_obj.customer_name = contract_data['customer_name']
+        return contract_obj
+
+    def list_contracts(self, after=None, limit=500):
+        """
+        صفحه‌بندی keyset قراردادها به ترتیب contract_date نزولی و سپس id نزولی (مثل get_all_contracts).
+        after: (contract_date, id) آخرین قرارداد صفحه قبل یا None برای صفحه اول.
+        قراردادهای بدون تاریخ در انتهای لیست و به ترتیب id نزولی می‌آیند.
+        """
+        if not self.db_manager.connect():
+            return [], "خطا در اتصال به دیتابیس."
+
+        contracts = []
+        if after is None or after[0] is not None:
+            if after is None:
+                where, params = "c.contract_date IS NOT NULL", ()
+            else:
+                where, params = "(c.contract_date, c.id) < (?, ?)", tuple(after)
+            cursor = self.db_manager.execute_query(
+                f"{self._LIST_SELECT} WHERE {where} ORDER BY c.contract_date DESC, c.id DESC LIMIT ?",
+                params + (limit,)
+            )
+            if cursor:
+                contracts.extend(self._contract_from_row(row) for row in cursor.fetchall())
+        if len(contracts) < limit:
+            # بخش بدون تاریخ؛ جدا خوانده می‌شود تا هر دو بخش از ایندکس استفاده کنند
+            if after is not None and after[0] is None:
+                where, params = "c.contract_date IS NULL AND c.id < ?", (after[1],)
+            else:
+                where, params = "c.contract_date IS NULL", ()
+            cursor = self.db_manager.execute_query(
+                f"{self._LIST_SELECT} WHERE {where} ORDER BY c.id DESC LIMIT ?",
+                params + (limit - len(contracts),)
+            )
+            if cursor:
+                contracts.extend(self._contract_from_row(row) for row in cursor.fetchall())
+        self.db_manager.close()
+        return contracts, "قراردادها با موفقیت بازیابی شدند."
+
+    def iter_contracts(self, batch_size=500):
+        """ پیمایش جریانی همه قراردادها (با fetchmany) بدون نگه داشتن کل جدول در حافظه """
+        query = f"{self._LIST_SELECT} ORDER BY c.contract_date DESC, c.id DESC"
+        for row in self.db_manager.iter_query(query, batch_size=batch_size):
+            yield self._contract_from_row(row)
+
+    # ستون‌های قابل مرتب‌سازی در page_contracts و عبارت SQL هر کدام (بدون NULL، برای مقایسه keyset)
+    SORT_COLUMNS = {
+        "id": "c.id", "contract_number": "c.contract_number", "contract_date": "IFNULL(c.contract_date, '')",
+        "customer_name": "cust.name COLLATE NOCASE", "title": "IFNULL(c.title, '')",
+        "description": "IFNULL(c.description, '')", "total_amount": "IFNULL(c.total_amount, 0)",
+        "payment_method": "IFNULL(c.payment_method, '')",
+    }
+
+    def count_contracts(self):
+        """ تعداد کل قراردادها (همان ردیف‌هایی که لیست قراردادها نشان می‌دهد) """
+        if not self.db_manager.connect():
+            return 0, "خطا در اتصال به دیتابیس."
+        cursor = self.db_manager.execute_query(f"SELECT COUNT(*) {self._LIST_FROM}")
+        count = cursor.fetchone()[0] if cursor else 0
+        self.db_manager.close()
+        return count, "تعداد قراردادها با موفقیت بازیابی شد."
+
+    def page_contracts(self, sort="contract_date", descending=True, after=None, before=None, offset=0, limit=200):
+        """
+        یک صفحه از قراردادها با مرتب‌سازی دلخواه (برای لیست مجازی)، به صورت keyset.
+        after/before: کلید آخرین ردیف صفحه قبل / اولین ردیف صفحه بعد؛ offset: تعداد ردیف‌هایی که بعد از آن رد می‌شوند.
+        خروجی: ([(key, Contract)], پیام) که key کلید keyset همان ردیف است.
+        """
+        return self.page_search(None, sort, descending, after, before, offset, limit)
+
+    def page_search(self, query, sort="contract_date", descending=True, after=None, before=None, offset=0, limit=200):
+        """
+        یک صفحه از قراردادهایی که با query (مثل search) جور هستند، با مرتب‌سازی دلخواه و به صورت keyset
+        (مثل page_contracts، نه به ترتیب رتبه search). query خالی یا None یعنی همه قراردادها.
+        """
+        if sort not in self.SORT_COLUMNS:
+            return [], f"ستون مرتب‌سازی نامعتبر: {sort}"
+        sort_expr = self.SORT_COLUMNS[sort]
+        terms, message = self._search_terms(query)
+        if terms is None:
+            return [], message
+        if not self.db_manager.connect():
+            return [], "خطا در اتصال به دیتابیس."
+        join, where, where_params, _ = self._search_filter(terms)
+        clause, params, reverse = keyset_clause(sort_expr, "c.id", descending, after, before, offset, limit,
+                                                where, where_params)
+        cursor = self.db_manager.execute_query(
+            f"SELECT {sort_expr} AS sort_key, {self._LIST_COLUMNS} {self._LIST_FROM} {join} {clause}", params
+        )
+        rows = []
+        if cursor:
+            for row in cursor.fetchall():
+                contract_data = dict(row)
+                sort_key = contract_data.pop('sort_key')
+                rows.append(((sort_key, contract_data['id']), self._contract_from_row(contract_data)))
+        self.db_manager.close()
+        if reverse:
+            rows.reverse()
+        return rows, "قراردادها با موفقیت بازیابی شدند."
+
+    def count_search(self, query):
+        """ تعداد قراردادهایی که با query (مثل search) جور هستند """
+        terms, message = self._search_terms(query)
+        if terms is None:
+            return 0, message
+        if not self.db_manager.connect():
+            return 0, "خطا در اتصال به دیتابیس."
+        join, where, params, _ = self._search_filter(terms)
+        cursor = self.db_manager.execute_query(
+            f"SELECT COUNT(*) {self._LIST_FROM} {join} {f'WHERE {where}' if where else ''}", params)
+        count = cursor.fetchone()[0] if cursor else 0
+        self.db_manager.close()
+        return count, "تعداد قراردادها با موفقیت بازیابی شد."
+
+    # ستون‌های قابل جستجو در search و عبارت SQL هر کدام برای مقایسه با LIKE وقتی FTS5 در دسترس نیست
+    SEARCH_COLUMNS = {
+        "contract_number": "c.contract_number", "title": "c.title", "description": "c.description",
+        "contract_date": "c.contract_date", "customer_name": "cust.name",
+        "total_amount": "c.total_amount", "payment_method": "c.payment_method",
+    }
+
+    def search(self, query, limit=100):
+        """
+        جستجوی زیررشته‌ای قراردادها با رتبه‌بندی (bm25 وزن‌دار: شماره قرارداد، عنوان، نام مشتری، تاریخ، شرح).
+        query: رشته برای جستجو در شماره، عنوان، شرح، تاریخ و نام مشتری، یا دیکشنری {نام ستون: عبارت}
+        که همه شرط‌هایش باید برقرار باشند. عبارت‌های سه حرفی و بیشتر از ایندکس ContractsFTS استفاده می‌کنند؛
+        بقیه (و وقتی FTS5 در دسترس نیست) با LIKE بررسی و به ترتیب تاریخ قرارداد برگردانده می‌شوند.
+        عبارت‌ها مثل متن ذخیره شده در ایندکس با normalize_search_text نرمال می‌شوند؛ همه SEARCH_COLUMNS در
+        ایندکس هستند و فقط بدون FTS5 مقایسه با متن خام جدول انجام می‌شود.
+        برای نمایش همه نتایج در لیست مجازی از count_search و page_search استفاده می‌شود.
+        """
+        terms, message = self._search_terms(query)
+        if terms is None:
+            return [], message
+        if not self.db_manager.connect():
+            return [], "خطا در اتصال به دیتابیس."
+        join, where, params, matched = self._search_filter(terms)
+        order_params = ()
+        if matched:
+            weights = ", ".join(str(weight) for weight in CONTRACT_FTS_WEIGHTS)
+            # شماره قرارداد دقیقاً برابر یا شروع شده با عبارت، قبل از بقیه نتایج bm25 می‌آید
+            number_term = terms.get(None, terms.get("contract_number"))
+            number_rank = ""
+            if number_term is not None:
+                number_rank = "CASE WHEN f.contract_number = ? THEN 0 WHEN f.contract_number LIKE ? ESCAPE '\\' THEN 1 ELSE 2 END, "
+                order_params = (number_term, like_pattern(number_term, prefix=True))
+            order = f"{number_rank}bm25(ContractsFTS, {weights}), c.contract_date DESC, c.id DESC"
+        else:
+            order = "c.contract_date DESC, c.id DESC"
+        query_sql = f"{self._LIST_SELECT} {join} {f'WHERE {where}' if where else ''} ORDER BY {order} LIMIT ?"
+        cursor = self.db_manager.execute_query(query_sql, params + order_params + (limit,))
+        contracts = []
+        if cursor:
+            contracts = [self._contract_from_row(row) for row in cursor.fetchall()]
+        self.db_manager.close()
+        return contracts, "قراردادها با موفقیت بازیابی شدند."
+
+    def _search_terms(self, query):
+        """ عبارت‌های نرمال شده query به صورت {نام ستون یا None: عبارت}؛ برای ستون نامعتبر (None، پیام خطا) """
+        if query is None:
+            return {}, "بدون عبارت جستجو."
+        terms = {None: query} if isinstance(query, str) else dict(query)
+        terms = {column: normalize_search_text(term) for column, term in terms.items() if term is not None}
+        terms = {column: term for column, term in terms.items() if term}
+        for column in terms:
+            if column is not None and column not in self.SEARCH_COLUMNS:
+                return None, f"ستون جستجوی نامعتبر: {column}"
+        return terms, "عبارت‌های جستجو نرمال شدند."
+
+    def _search_filter(self, terms):
+        """
+        بخش JOIN و شرط WHERE جستجوی terms (خروجی _search_terms) روی قراردادهای _LIST_FROM (مشترک بین search،
+        page_search و count_search). باید بعد از connect صدا زده شود.
+        خروجی: (join, where, params, matched) که matched یعنی شرط MATCH روی ContractsFTS دارد (برای رتبه‌بندی bm25).
+        """
+        if terms and self._fts_enabled is None:
+            cursor = self.db_manager.execute_query("SELECT 1 FROM sqlite_master WHERE name = 'ContractsFTS'")
+            self._fts_enabled = bool(cursor and cursor.fetchone())
+
+        match_parts, conditions, params = [], [], []
+        uses_fts = False
+        for column, term in terms.items():
+            in_fts = self._fts_enabled and column in (None,) + CONTRACT_FTS_COLUMNS
+            uses_fts = uses_fts or in_fts
+            if in_fts and len(term) >= 3:
+                columns = column or " ".join(CONTRACT_FTS_DEFAULT_COLUMNS)
+                match_parts.append(f"{{{columns}}} : {fts_phrase(term)}")
+                continue
+            if in_fts:
+                # عبارت کوتاه با متن نرمال شده خود ایندکس مقایسه می‌شود
+                columns = [f"f.{col}" for col in CONTRACT_FTS_DEFAULT_COLUMNS] if column is None else [f"f.{column}"]
+            else:
+                columns = [self.SEARCH_COLUMNS[col] for col in CONTRACT_FTS_DEFAULT_COLUMNS] if column is None else [self.SEARCH_COLUMNS[column]]
+            conditions.append("(" + " OR ".join(f"CAST({col} AS TEXT) LIKE ? ESCAPE '\\'" for col in columns) + ")")
+            params.extend([like_pattern(term)] * len(columns))
+        if match_parts:
+            conditions.insert(0, "ContractsFTS MATCH ?")
+            params.insert(0, " AND ".join(match_parts))
+        join = "JOIN ContractsFTS f ON f.rowid = c.id" if uses_fts else ""
+        return join, " AND ".join(conditions), tuple(params), bool(match_parts)
+
     def get_contract_by_id(self, contract_id: int):
         """ بازیابی یک قرارداد بر اساس شناسه """
         if not self.db_manager.connect():
@@ -127,9 +391,13 @@ class ContractManager:
                 contract.total_amount, contract.description, contract.title, contract.payment_method, scanned_pages_json, # استفاده از رشته JSON
                 contract.id 
             )
-            cursor = self.db_manager.execute_query(query, params) 
+            with self.db_manager.transaction():
+                cursor = self.db_manager.execute_query(query, params)
+                if cursor and cursor.rowcount > 0:
+                    self.db_manager.refresh_contract_search_index([contract.id])
             self.db_manager.close()
             if cursor and cursor.rowcount > 0:
+                ChangeEventBus.shared().publish(CONTRACT, contract.id, UPDATE)
                 return True, "قرارداد با موفقیت بروزرسانی شد." 
             else:
                 return False, "قرارداد مورد نظر یافت نشد یا تغییری اعمال نشد." 
@@ -150,6 +418,7 @@ class ContractManager:
         cursor = self.db_manager.execute_query("DELETE FROM Contracts WHERE id = ?", (contract_id,)) 
         self.db_manager.close()
         if cursor and cursor.rowcount > 0:
+            ChangeEventBus.shared().publish(CONTRACT, contract_id, DELETE)
             return True, "قرارداد با موفقیت حذف شد." 
         else:
             return False, "قرارداد مورد نظر یافت نشد." 
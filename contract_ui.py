@@ -4,13 +4,14 @@ from tkinter import messagebox, filedialog, ttk
 import os
 import json
 import jdatetime
-from PIL import Image, ImageTk 
-import fitz # (PyMuPDF) برای کار با PDF
 import subprocess # برای باز کردن فایل‌ها
 
 from contract_manager import ContractManager
 from customer_manager import CustomerManager
 from models import Contract 
+from live_filter import LiveFilterController, load_in_background
+from change_events import ChangeEventBus, CONTRACT, CUSTOMER, INSERT
+from virtual_list import VirtualTreeview, KeysetPageSource
 
 
 class CalendarWidget(ctk.CTkToplevel):
@@ -164,6 +165,8 @@ class ImageViewer(ctk.CTkToplevel):
         image_frame.grid_columnconfigure(0, weight=1)
 
         # نمایش عکس
+        from PIL import Image # PIL و PyMuPDF فقط هنگام نمایش پیش‌نمایش بارگذاری می‌شوند
+        import fitz
         try:
             image_pil = None
             if self.image_path.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".bmp")):
@@ -232,6 +235,18 @@ class ImageViewer(ctk.CTkToplevel):
 
 
 class ContractUI(ctk.CTkFrame):
+    # نگاشت شناسه ستون‌های جدول به ستون‌های قابل جستجوی ContractManager.search
+    FILTER_COLUMN_MAP = {
+        "Description": "description", "TotalAmount": "total_amount", "ContractDate": "contract_date",
+        "CustomerName": "customer_name", "ContractNumber": "contract_number", "Title": "title",
+        "PaymentMethod": "payment_method",
+    }
+    # ستون‌های جدول (فیلدهای حذف شده برداشته شدند)
+    TABLE_COLUMNS = ("ScannedPagesCount", "PaymentMethod", "Title", "Description", "TotalAmount",
+                     "ContractDate", "CustomerName", "ContractNumber", "ID")
+    # ستون جدول -> ستون مرتب‌سازی ContractManager.page_contracts (تعداد اسکن فقط در نتایج فیلتر مرتب می‌شود)
+    SORT_COLUMN_MAP = {**FILTER_COLUMN_MAP, "ID": "id"}
+
     def __init__(self, parent, db_manager, ui_colors, base_font, heading_font, button_font, nav_button_font):
         super().__init__(parent, fg_color="transparent")
         self.parent = parent
@@ -262,6 +277,8 @@ class ContractUI(ctk.CTkFrame):
         self.scanned_image_references = [] 
 
         self.customer_data_map = {}
+        self._customer_load_sequence = 0 # فقط نتیجه آخرین بارگذاری دراپ‌داون مشتری اعمال می‌شود
+        self._customer_reload_id = None
 
         self.is_filter_row_visible = False
 
@@ -524,10 +541,8 @@ class ContractUI(ctk.CTkFrame):
         self.tree_scrollbar = ctk.CTkScrollbar(table_frame)
         self.tree_scrollbar.pack(side="right", fill="y")
         
-        # تعریف ستون‌ها (فیلدهای حذف شده برداشته شدند)
-        column_identifiers = ("ScannedPagesCount", "PaymentMethod", "Title", "Description", "TotalAmount", "ContractDate", "CustomerName", "ContractNumber", "ID") 
         self.contract_table = ttk.Treeview(table_frame, 
-                                           columns=column_identifiers, 
+                                           columns=self.TABLE_COLUMNS, 
                                            show="headings", 
                                            yscrollcommand=self.tree_scrollbar.set)
         self.contract_table.pack(fill="both", expand=True)
@@ -559,7 +574,7 @@ class ContractUI(ctk.CTkFrame):
         # ایجاد فیلدهای جستجو برای هر ستون
         self.filter_entries = {}
         self.filter_vars = {}
-        for col_id in column_identifiers:
+        for col_id in self.TABLE_COLUMNS:
             if col_id == "ID" or col_id == "ScannedPagesCount": 
                 self.filter_vars[col_id] = ctk.StringVar(value="")
                 self.filter_entries[col_id] = None
@@ -587,6 +602,14 @@ class ContractUI(ctk.CTkFrame):
         tree_style.configure("Treeview.Heading", font=self.button_font)
         tree_style.layout("Treeview", [('Treeview.treearea', {'sticky': 'nsew'})])
 
+        # فقط ردیف‌های قابل مشاهده در جدول درج می‌شوند؛ فیلتر و بارگذاری در پس‌زمینه منبع داده جدید می‌سازند
+        self.contract_view = VirtualTreeview(self.contract_table, self.tree_scrollbar)
+        self.filter_controller = LiveFilterController(self.contract_table, self.fetch_contract_source,
+                                                      on_result=self.contract_view.set_source)
+        # بعد از افزودن/ویرایش/حذف فقط ردیف تغییر کرده به‌روز می‌شود؛ نام مشتری هم در ردیف‌ها نمایش داده می‌شود
+        bus = ChangeEventBus.shared()
+        bus.subscribe_widget(self.contract_table, CONTRACT, self.on_contract_changed)
+        bus.subscribe_widget(self.contract_table, CUSTOMER, self.on_customer_changed)
         self.load_contracts_to_table()
         
         return table_frame
@@ -623,88 +646,97 @@ class ContractUI(ctk.CTkFrame):
             self.on_treeview_configure(None)
 
     def apply_live_filter(self, event=None):
-        """ اعمال فیلتر زنده بر اساس ورودی کاربر در فیلدهای جستجو """
-        search_terms = {col_id: self.filter_vars[col_id].get().strip().lower() 
-                        for col_id in self.filter_vars if self.filter_vars[col_id].get().strip()}
-        
-        all_contracts, _ = self.contract_manager.get_all_contracts()
-        
-        for item in self.contract_table.get_children():
-            self.contract_table.delete(item)
-
-        filtered_contracts = []
-        for contract in all_contracts:
-            match = True
-            contract_values_for_filter = {
-                "Description": str(contract.description).lower(),
-                "TotalAmount": str(contract.total_amount).lower(),
-                "ContractDate": str(contract.contract_date).lower() if contract.contract_date else '',
-                "CustomerName": str(contract.customer_name).lower(),
-                "ContractNumber": str(contract.contract_number).lower(),
-                "Title": str(contract.title).lower(),
-                "PaymentMethod": str(contract.payment_method).lower(),
-            }
-
-            for col_id, term in search_terms.items():
-                if col_id in contract_values_for_filter:
-                    if term not in contract_values_for_filter[col_id]:
-                        match = False
-                        break
-                else:
-                    match = False
-                    break
-
-            if match:
-                filtered_contracts.append(contract)
-        
-        self.insert_contracts_into_table(filtered_contracts)
+        """ اعمال فیلتر زنده بر اساس ورودی کاربر در فیلدهای جستجو (جستجو در دیتابیس با ایندکس متنی) """
+        search_terms = {self.FILTER_COLUMN_MAP[col_id]: self.filter_vars[col_id].get().strip()
+                        for col_id in self.filter_vars
+                        if col_id in self.FILTER_COLUMN_MAP and self.filter_vars[col_id].get().strip()}
+        # فیلتر خالی هم از همین مسیر (با debounce) کل لیست را برمی‌گرداند
+        self.filter_controller.request(search_terms)
+
+    def fetch_contract_source(self, search_terms):
+        """
+        منبع داده جدول برای فیلتر داده شده (در نخ کارگر LiveFilterController اجرا می‌شود).
+        با فیلتر یا بدون آن، صفحه‌بندی keyset روی همه ردیف‌های جور (بدون سقف تعداد نتایج)؛ صفحه اول همین‌جا خوانده می‌شود.
+        """
+        if search_terms:
+            total, _ = self.contract_manager.count_search(search_terms)
+            fetch_page = lambda *args, **kwargs: self.contract_manager.page_search(search_terms, *args, **kwargs)
+        else:
+            total, _ = self.contract_manager.count_contracts()
+            fetch_page = self.contract_manager.page_contracts
+        source = KeysetPageSource(fetch_page, total,
+                                  lambda contract: (contract.id, self.contract_row_values(contract)),
+                                  self.SORT_COLUMN_MAP, ("contract_date", True), sort=self.contract_view.sort,
+                                  filtered=bool(search_terms))
+        source.get_rows(0, KeysetPageSource.PAGE_SIZE)
+        return source
+
+    def on_contract_changed(self, event):
+        """ اعمال یک رویداد تغییر قرارداد روی جدول بدون بارگذاری دوباره کل لیست """
+        def load_values():
+            contract, _ = self.contract_manager.get_contract_by_id(event.entity_id)
+            return self.contract_row_values(contract) if contract else None
+        if not self.contract_view.apply_change(event.operation, event.entity_id, load_values):
+            self.apply_live_filter() # نتایج جستجوی فعلی دوباره گرفته می‌شوند
+
+    def on_customer_changed(self, event):
+        """ تغییر مشتری‌ها: دراپ‌داون مشتری دوباره بارگذاری و نام مشتری در ردیف‌های جدول به‌روز می‌شود """
+        if self._customer_reload_id is None: # رویدادهای پشت سر هم (مثلاً درج دسته‌ای) یک بار بارگذاری می‌شوند
+            self._customer_reload_id = self.after_idle(self.load_customers_to_dropdown)
+        if event.operation != INSERT and not self.contract_view.invalidate():
+            self.apply_live_filter()
 
     def load_customers_to_dropdown(self):
-        """ بارگذاری مشتریان در دراپ‌داون انتخاب مشتری """
-        customers, _ = self.customer_manager.get_all_customers()
-        customers.sort(key=lambda c: c.name)
-        customer_names = []
-        self.customer_data_map = {}
-        for cust in customers:
-            customer_names.append(cust.name)
-            self.customer_data_map[cust.name] = cust.id
+        """ بارگذاری مشتریان در دراپ‌داون انتخاب مشتری (کوئری در پس‌زمینه اجرا می‌شود) """
+        self._customer_reload_id = None
+        self._customer_load_sequence += 1
+        sequence = self._customer_load_sequence
+        def fetch_customers():
+            customers, _ = self.customer_manager.get_all_customers()
+            return sorted(((cust.name, cust.id) for cust in customers), key=lambda item: item[0])
+        load_in_background(self, fetch_customers,
+                           lambda customers: self._apply_customers_to_dropdown(sequence, customers))
+
+    def _apply_customers_to_dropdown(self, sequence, customers):
+        if sequence != self._customer_load_sequence:
+            return # نتیجه یک بارگذاری قدیمی‌تر
+        customer_names = [name for name, _ in customers]
+        current_name = self.customer_dropdown_var.get()
+        current_id = self.customer_data_map.get(current_name)
+        self.customer_data_map = dict(customers)
         self.customer_dropdown.configure(values=customer_names)
         self.customer_dropdown.configure(font=self.base_font)
-        if customer_names:
-            self.customer_dropdown_var.set(customer_names[0])
-            self.on_customer_selected(customer_names[0]) 
+        if current_name in self.customer_data_map:
+            return # انتخاب کاربر در این فاصله حفظ می‌شود
+        # مشتری انتخاب شده تغییر نام داده (همان شناسه با نام جدید) یا حذف شده (انتخاب اولین مشتری)
+        renamed = next((name for name, cust_id in customers if cust_id == current_id), None) if current_id else None
+        selected = renamed or (customer_names[0] if customer_names else "")
+        self.customer_dropdown_var.set(selected)
+        if selected:
+            self.on_customer_selected(selected)
 
     def on_customer_selected(self, choice):
         """ تابعی که هنگام انتخاب مشتری از دراپ‌داون فراخوانی می‌شود. """
         pass
 
     def load_contracts_to_table(self):
-        """ بارگذاری قراردادها از دیتابیس به جدول """
-        for item in self.contract_table.get_children():
-            self.contract_table.delete(item)
-
-        contracts, message = self.contract_manager.get_all_contracts()
-        if not contracts:
-            pass
-
-        self.insert_contracts_into_table(contracts)
-
-    def insert_contracts_into_table(self, contracts):
-        """ توابع کمکی برای درج قراردادها در جدول (برای فیلتر و بارگذاری اولیه) """
-        for contract in contracts:
-            formatted_amount = f"{int(contract.total_amount):,}" if contract.total_amount is not None else ""
-            scanned_pages_count = len(contract.scanned_pages) if contract.scanned_pages else 0
-
-            self.contract_table.insert("", "end", iid=contract.id,
-                                     values=(scanned_pages_count,
-                                             str(contract.payment_method) if contract.payment_method else '',
-                                             str(contract.title) if contract.title else '',
-                                             str(contract.description) if contract.description else '',
-                                             formatted_amount,
-                                             str(contract.contract_date) if contract.contract_date else '',
-                                             str(contract.customer_name) if hasattr(contract, 'customer_name') and contract.customer_name else '',
-                                             str(contract.contract_number) if contract.contract_number else '',
-                                             contract.id))
+        """ بارگذاری قراردادها از دیتابیس به جدول (در پس‌زمینه؛ جدول فقط ردیف‌های قابل مشاهده را نگه می‌دارد) """
+        self.filter_controller.refresh({})
+
+    @staticmethod
+    def contract_row_values(contract):
+        """ مقادیر یک ردیف جدول به ترتیب ستون‌های تعریف شده در Treeview """
+        formatted_amount = f"{int(contract.total_amount):,}" if contract.total_amount is not None else ""
+        scanned_pages_count = len(contract.scanned_pages) if contract.scanned_pages else 0
+        return (scanned_pages_count,
+                str(contract.payment_method) if contract.payment_method else '',
+                str(contract.title) if contract.title else '',
+                str(contract.description) if contract.description else '',
+                formatted_amount,
+                str(contract.contract_date) if contract.contract_date else '',
+                str(contract.customer_name) if hasattr(contract, 'customer_name') and contract.customer_name else '',
+                str(contract.contract_number) if contract.contract_number else '',
+                contract.id)
 
 
     def clear_contract_form(self):
@@ -722,7 +754,11 @@ class ContractUI(ctk.CTkFrame):
         self.clear_scanned_page_previews()
 
         self.delete_contract_button.configure(state="disabled")
-        self.load_customers_to_dropdown()
+        # لیست مشتریان با رویدادهای تغییر مشتری به‌روز می‌ماند و لازم نیست هر بار دوباره خوانده شود
+        customer_names = self.customer_dropdown.cget("values")
+        if customer_names:
+            self.customer_dropdown_var.set(customer_names[0])
+            self.on_customer_selected(customer_names[0])
 
     def save_contract_from_ui(self):
         """ اطلاعات وارد شده در UI را دریافت کرده و اعتبارسنجی کرده و در دیتابیس ذخیره می‌کند. """
@@ -787,7 +823,6 @@ class ContractUI(ctk.CTkFrame):
         if success:
             messagebox.showinfo("موفقیت", message, master=self)
             self.clear_contract_form()
-            self.load_contracts_to_table()
         else:
             messagebox.showerror("خطا", message, master=self)
 
@@ -800,7 +835,6 @@ class ContractUI(ctk.CTkFrame):
                 if success:
                     messagebox.showinfo("موفقیت", message, master=self)
                     self.clear_contract_form()
-                    self.load_contracts_to_table()
                 else:
                     messagebox.showerror("خطا", message, master=self)
         else:
@@ -971,6 +1005,8 @@ class ContractUI(ctk.CTkFrame):
             preview_frame.grid_columnconfigure(0, weight=1)
             
             img_to_display = None
+            from PIL import Image
+            import fitz
             try:
                 image_pil = None
                 if file_path.lower().endswith((".png", ".jpg", ".jpeg", ".gif", ".bmp")):
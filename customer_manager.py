@@ -1,13 +1,27 @@
 # customer_manager.py
 import os
 import sqlite3
-from db_manager import DBManager, DATABASE_NAME
+from text_normalizer import normalize_search_text
+from db_manager import (DBManager, DATABASE_NAME, CUSTOMER_FTS_COLUMNS, CUSTOMER_FTS_DEFAULT_COLUMNS,
+                        fts_phrase, like_pattern, keyset_clause)
 from models import Customer
+from change_events import ChangeEventBus, CUSTOMER, INSERT, UPDATE, DELETE
 
 class CustomerManager:
+    _INSERT_QUERY = """
+    INSERT INTO Customers (
+        customer_code, name, customer_type, address, 
+        phone, phone2, mobile, email, tax_id, postal_code, notes
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    # ستون‌هایی که search روی آن‌ها فیلتر می‌کند (همه با متن نرمال شده در CustomersFTS هستند)
+    SEARCH_COLUMNS = CUSTOMER_FTS_COLUMNS
+
     def __init__(self):
         db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATABASE_NAME)
         self.db_manager = DBManager(db_path)
+        self._fts_enabled = None
 
     def get_next_customer_code(self):
         """ بازیابی بزرگترین کد مشتری ذخیره شده و بازگرداندن کد بعدی (شروع از 2001) """
@@ -24,8 +38,10 @@ class CustomerManager:
         self.db_manager.close()
         return next_code
 
-    def add_customer(self, customer: Customer):
-        """ اضافه کردن یک مشتری جدید به دیتابیس """
+    def add_customer(self, customer: Customer | list[Customer]):
+        """ اضافه کردن یک مشتری جدید (یا لیستی از مشتریان به صورت دسته‌ای) به دیتابیس """
+        if isinstance(customer, list):
+            return self._add_customers_batch(customer)
         if not self.db_manager.connect():
             return False, "خطا در اتصال به دیتابیس."
         try:
@@ -37,36 +53,78 @@ class CustomerManager:
                 if not self.db_manager.connect(): # اتصال مجدد
                      return False, "خطا در اتصال مجدد به دیتابیس برای تولید کد مشتری."
             
-            query = """
-            INSERT INTO Customers (
-                customer_code, name, customer_type, address, 
-                phone, phone2, mobile, email, tax_id, postal_code, notes
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
             params = (
                 final_customer_code, customer.name, customer.customer_type,  
                 customer.address, customer.phone, customer.phone2, customer.mobile, 
                 customer.email, customer.tax_id, customer.postal_code, customer.notes
             )
             
-            cursor = self.db_manager.execute_query(query, params)
+            with self.db_manager.transaction():
+                cursor = self.db_manager.execute_query(self._INSERT_QUERY, params)
+                if cursor:
+                    self.db_manager.refresh_customer_search_index([cursor.lastrowid])
             self.db_manager.close()
             if cursor:
+                customer.id = cursor.lastrowid
+                ChangeEventBus.shared().publish(CUSTOMER, customer.id, INSERT)
                 return True, "مشتری با موفقیت اضافه شد."
             else:
                 return False, "خطا در اضافه کردن مشتری."
         except sqlite3.IntegrityError as e:
             self.db_manager.close()
-            if "UNIQUE constraint failed: Customers.name" in str(e):
-                return False, "نام مشتری تکراری است. لطفاً نام دیگری را وارد کنید."
-            elif "UNIQUE constraint failed: Customers.customer_code" in str(e):
-                return False, "کد مشتری تکراری است. لطفاً کد دیگری را وارد کنید یا آن را خالی بگذارید."
-            elif "UNIQUE constraint failed: Customers.tax_id" in str(e):
-                return False, "شناسه ملی/شماره ملی وارد شده تکراری است."
-            elif "UNIQUE constraint failed: Customers.email" in str(e):
-                return False, "ایمیل وارد شده تکراری است."
-            else:
-                return False, f"خطای تکراری بودن داده: {e}"
+            return False, self._add_integrity_error_message(e)
+        except Exception as e:
+            self.db_manager.close()
+            return False, f"خطای ناشناخته در اضافه کردن مشتری: {e}"
+
+    def _add_integrity_error_message(self, e):
+        """ پیام کاربرپسند برای خطای UNIQUE هنگام افزودن مشتری """
+        if "UNIQUE constraint failed: Customers.name" in str(e):
+            return "نام مشتری تکراری است. لطفاً نام دیگری را وارد کنید."
+        elif "UNIQUE constraint failed: Customers.customer_code" in str(e):
+            return "کد مشتری تکراری است. لطفاً کد دیگری را وارد کنید یا آن را خالی بگذارید."
+        elif "UNIQUE constraint failed: Customers.tax_id" in str(e):
+            return "شناسه ملی/شماره ملی وارد شده تکراری است."
+        elif "UNIQUE constraint failed: Customers.email" in str(e):
+            return "ایمیل وارد شده تکراری است."
+        else:
+            return f"خطای تکراری بودن داده: {e}"
+
+    def _add_customers_batch(self, customers):
+        """
+        درج دسته‌ای مشتریان با executemany در یک تراکنش.
+        برای مشتریان بدون کد، کدها پشت سر هم تولید می‌شوند و شناسه‌های جدید روی آبجکت‌ها ست می‌شوند.
+        """
+        if not customers:
+            return True, "مشتری‌ای برای افزودن وجود ندارد."
+        if not self.db_manager.connect():
+            return False, "خطا در اتصال به دیتابیس."
+        try:
+            with self.db_manager.transaction():
+                row = self.db_manager.execute("SELECT MAX(customer_code) FROM Customers").fetchone()
+                next_code = int(row[0]) + 1 if row and row[0] is not None else 2001
+                params_seq = []
+                for customer in customers:
+                    if customer.customer_code is None:
+                        customer.customer_code = next_code
+                        next_code += 1
+                    params_seq.append((
+                        customer.customer_code, customer.name, customer.customer_type,
+                        customer.address, customer.phone, customer.phone2, customer.mobile,
+                        customer.email, customer.tax_id, customer.postal_code, customer.notes
+                    ))
+                new_ids = self.db_manager.insert_many(self._INSERT_QUERY, params_seq)
+                self.db_manager.refresh_customer_search_index(new_ids)
+            for customer, new_id in zip(customers, new_ids):
+                customer.id = new_id
+            self.db_manager.close()
+            bus = ChangeEventBus.shared()
+            for new_id in new_ids:
+                bus.publish(CUSTOMER, new_id, INSERT)
+            return True, f"{len(customers)} مشتری با موفقیت اضافه شد."
+        except sqlite3.IntegrityError as e:
+            self.db_manager.close()
+            return False, self._add_integrity_error_message(e)
         except Exception as e:
             self.db_manager.close()
             return False, f"خطای ناشناخته در اضافه کردن مشتری: {e}"
@@ -83,6 +141,158 @@ class CustomerManager:
         self.db_manager.close()
         return customers, "مشتریان با موفقیت بازیابی شدند."
 
+    def list_customers(self, after=None, limit=500):
+        """
+        صفحه‌بندی keyset مشتریان به ترتیب نام (بدون حساسیت به حروف) و سپس id.
+        after: (name, id) آخرین مشتری صفحه قبل یا None برای صفحه اول.
+        """
+        if not self.db_manager.connect():
+            return [], "خطا در اتصال به دیتابیس."
+        if after is None:
+            where, params = "", ()
+        else:
+            # شرط اول محدوده ایندکس idx_customers_name_nocase را مشخص می‌کند و شرط دوم نام‌های برابر را با id جدا می‌کند
+            name, last_id = after
+            where = "WHERE name >= ? COLLATE NOCASE AND (name > ? COLLATE NOCASE OR id > ?)"
+            params = (name, name, last_id)
+        cursor = self.db_manager.execute_query(
+            f"SELECT * FROM Customers {where} ORDER BY name COLLATE NOCASE ASC, id ASC LIMIT ?",
+            params + (limit,)
+        )
+        customers = []
+        if cursor:
+            customers = [Customer.from_dict(dict(row)) for row in cursor.fetchall()]
+        self.db_manager.close()
+        return customers, "مشتریان با موفقیت بازیابی شدند."
+
+    def iter_customers(self, batch_size=500):
+        """ پیمایش جریانی همه مشتریان (با fetchmany) بدون نگه داشتن کل جدول در حافظه """
+        query = "SELECT * FROM Customers ORDER BY name COLLATE NOCASE ASC, id ASC"
+        for row in self.db_manager.iter_query(query, batch_size=batch_size):
+            yield Customer.from_dict(dict(row))
+
+    # ستون‌های قابل مرتب‌سازی در page_customers و عبارت SQL هر کدام (بدون NULL، برای مقایسه keyset)
+    SORT_COLUMNS = {
+        "id": "c.id", "customer_code": "IFNULL(c.customer_code, 0)", "name": "c.name COLLATE NOCASE",
+        "customer_type": "c.customer_type", "address": "IFNULL(c.address, '')", "phone": "IFNULL(c.phone, '')",
+        "phone2": "IFNULL(c.phone2, '')", "mobile": "IFNULL(c.mobile, '')", "email": "IFNULL(c.email, '')",
+        "tax_id": "IFNULL(c.tax_id, '')", "postal_code": "IFNULL(c.postal_code, '')", "notes": "IFNULL(c.notes, '')",
+    }
+
+    def count_customers(self):
+        """ تعداد کل مشتریان """
+        if not self.db_manager.connect():
+            return 0, "خطا در اتصال به دیتابیس."
+        cursor = self.db_manager.execute_query("SELECT COUNT(*) FROM Customers")
+        count = cursor.fetchone()[0] if cursor else 0
+        self.db_manager.close()
+        return count, "تعداد مشتریان با موفقیت بازیابی شد."
+
+    def page_customers(self, sort="name", descending=False, after=None, before=None, offset=0, limit=200):
+        """
+        یک صفحه از مشتریان با مرتب‌سازی دلخواه (برای لیست مجازی)، به صورت keyset.
+        after/before: کلید آخرین ردیف صفحه قبل / اولین ردیف صفحه بعد؛ offset: تعداد ردیف‌هایی که بعد از آن رد می‌شوند.
+        خروجی: ([(key, Customer)], پیام) که key کلید keyset همان ردیف است.
+        """
+        return self.page_search(None, sort, descending, after, before, offset, limit)
+
+    def page_search(self, query, sort="name", descending=False, after=None, before=None, offset=0, limit=200):
+        """
+        یک صفحه از مشتریانی که با query (مثل search) جور هستند، با مرتب‌سازی دلخواه و به صورت keyset
+        (مثل page_customers). query خالی یا None یعنی همه مشتریان.
+        """
+        if sort not in self.SORT_COLUMNS:
+            return [], f"ستون مرتب‌سازی نامعتبر: {sort}"
+        sort_expr = self.SORT_COLUMNS[sort]
+        terms, message = self._search_terms(query)
+        if terms is None:
+            return [], message
+        if not self.db_manager.connect():
+            return [], "خطا در اتصال به دیتابیس."
+        join, where, where_params = self._search_filter(terms)
+        clause, params, reverse = keyset_clause(sort_expr, "c.id", descending, after, before, offset, limit,
+                                                where, where_params)
+        cursor = self.db_manager.execute_query(f"SELECT {sort_expr} AS sort_key, c.* FROM Customers c {join} {clause}", params)
+        rows = []
+        if cursor:
+            for row in cursor.fetchall():
+                customer_data = dict(row)
+                sort_key = customer_data.pop('sort_key')
+                rows.append(((sort_key, customer_data['id']), Customer.from_dict(customer_data)))
+        self.db_manager.close()
+        if reverse:
+            rows.reverse()
+        return rows, "مشتریان با موفقیت بازیابی شدند."
+
+    def count_search(self, query):
+        """ تعداد مشتریانی که با query (مثل search) جور هستند """
+        terms, message = self._search_terms(query)
+        if terms is None:
+            return 0, message
+        if not self.db_manager.connect():
+            return 0, "خطا در اتصال به دیتابیس."
+        join, where, params = self._search_filter(terms)
+        cursor = self.db_manager.execute_query(
+            f"SELECT COUNT(*) FROM Customers c {join} {f'WHERE {where}' if where else ''}", params)
+        count = cursor.fetchone()[0] if cursor else 0
+        self.db_manager.close()
+        return count, "تعداد مشتریان با موفقیت بازیابی شد."
+
+    def search(self, query, limit=200):
+        """
+        جستجوی زیررشته‌ای مشتریان (بدون حساسیت به حروف) به ترتیب نام.
+        query: رشته برای جستجو در CUSTOMER_FTS_DEFAULT_COLUMNS، یا دیکشنری {نام ستون: عبارت} که همه
+        شرط‌هایش باید برقرار باشند. عبارت‌های سه حرفی و بیشتر از ایندکس CustomersFTS استفاده می‌کنند و
+        عبارت‌های کوتاه‌تر (یا وقتی FTS5 در دسترس نیست) با LIKE بررسی می‌شوند.
+        عبارت‌ها با normalize_search_text نرمال می‌شوند (ی/ک عربی، ارقام فارسی، نیم‌فاصله) و با متن نرمال
+        شده‌ای که در ایندکس ذخیره شده مقایسه می‌شوند (بدون FTS5 مقایسه با متن خام جدول است).
+        برای نمایش همه نتایج در لیست مجازی از count_search و page_search استفاده می‌شود.
+        """
+        rows, message = self.page_search(query, limit=limit)
+        return [customer for _, customer in rows], message
+
+    def _search_terms(self, query):
+        """ عبارت‌های نرمال شده query به صورت {نام ستون یا None: عبارت}؛ برای ستون نامعتبر (None، پیام خطا) """
+        if query is None:
+            return {}, "بدون عبارت جستجو."
+        terms = {None: query} if isinstance(query, str) else dict(query)
+        terms = {column: normalize_search_text(term) for column, term in terms.items() if term is not None}
+        terms = {column: term for column, term in terms.items() if term}
+        for column in terms:
+            if column is not None and column not in self.SEARCH_COLUMNS:
+                return None, f"ستون جستجوی نامعتبر: {column}"
+        return terms, "عبارت‌های جستجو نرمال شدند."
+
+    def _search_filter(self, terms):
+        """
+        بخش JOIN و شرط WHERE جستجوی terms (خروجی _search_terms) روی Customers c (مشترک بین page_search و
+        count_search). باید بعد از connect صدا زده شود. خروجی: (join, where, params)
+        """
+        if terms and self._fts_enabled is None:
+            cursor = self.db_manager.execute_query("SELECT 1 FROM sqlite_master WHERE name = 'CustomersFTS'")
+            self._fts_enabled = bool(cursor and cursor.fetchone())
+
+        match_parts, conditions, params = [], [], []
+        uses_fts = False
+        for column, term in terms.items():
+            in_fts = self._fts_enabled and column in (None,) + CUSTOMER_FTS_COLUMNS
+            uses_fts = uses_fts or in_fts
+            if in_fts and len(term) >= 3:
+                columns = column or " ".join(CUSTOMER_FTS_DEFAULT_COLUMNS)
+                match_parts.append(f"{{{columns}}} : {fts_phrase(term)}")
+                continue
+            pattern = like_pattern(term)
+            columns = CUSTOMER_FTS_DEFAULT_COLUMNS if column is None else (column,)
+            # عبارت کوتاه روی ستون‌های ایندکس با متن نرمال شده خود ایندکس مقایسه می‌شود
+            source = "f" if in_fts else "c"
+            conditions.append("(" + " OR ".join(f"CAST({source}.{col} AS TEXT) LIKE ? ESCAPE '\\'" for col in columns) + ")")
+            params.extend([pattern] * len(columns))
+        if match_parts:
+            conditions.insert(0, "CustomersFTS MATCH ?")
+            params.insert(0, " AND ".join(match_parts))
+        join = "JOIN CustomersFTS f ON f.rowid = c.id" if uses_fts else ""
+        return join, " AND ".join(conditions), tuple(params)
+
     def get_customer_by_id(self, customer_id: int):
         """ بازیابی یک مشتری بر اساس شناسه """
         if not self.db_manager.connect():
@@ -114,9 +324,15 @@ class CustomerManager:
                 customer.email, customer.tax_id, customer.postal_code, customer.notes,
                 customer.id
             )
-            cursor = self.db_manager.execute_query(query, params)
+            with self.db_manager.transaction():
+                cursor = self.db_manager.execute_query(query, params)
+                if cursor and cursor.rowcount > 0:
+                    # نام مشتری در ایندکس قراردادهایش هم نگه داشته می‌شود
+                    self.db_manager.refresh_customer_search_index([customer.id])
+                    self.db_manager.refresh_contract_search_index(customer_ids=[customer.id])
             self.db_manager.close()
             if cursor and cursor.rowcount > 0:
+                ChangeEventBus.shared().publish(CUSTOMER, customer.id, UPDATE)
                 return True, "مشتری با موفقیت بروزرسانی شد."
             else:
                 return False, "مشتری مورد نظر یافت نشد یا تغییری اعمال نشد."
@@ -143,6 +359,7 @@ class CustomerManager:
         cursor = self.db_manager.execute_query("DELETE FROM Customers WHERE id = ?", (customer_id,))
         self.db_manager.close()
         if cursor and cursor.rowcount > 0:
+            ChangeEventBus.shared().publish(CUSTOMER, customer_id, DELETE)
             return True, "مشتری با موفقیت حذف شد."
         else:
             return False, "مشتری مورد نظر یافت نشد."
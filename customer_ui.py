@@ -6,9 +6,24 @@ from datetime import datetime
 
 from customer_manager import CustomerManager
 from models import Customer
+from live_filter import LiveFilterController
+from change_events import ChangeEventBus, CUSTOMER
+from virtual_list import VirtualTreeview, KeysetPageSource
 from db_manager import DBManager, DATABASE_NAME
 
 class CustomerUI(ctk.CTkFrame):
+    # نگاشت شناسه ستون‌های جدول به ستون‌های قابل جستجوی CustomerManager.search
+    FILTER_COLUMN_MAP = {
+        "Notes": "notes", "PostalCode": "postal_code", "TaxID": "tax_id", "Email": "email",
+        "Mobile": "mobile", "Phone2": "phone2", "Phone": "phone", "Address": "address",
+        "Type": "customer_type", "Name": "name", "Code": "customer_code",
+    }
+    # ستون‌های جدول به ترتیب معکوس نمایش (آخرین ستون در لیست، اولین ستون در نمایش)؛ ID همیشه آخر
+    TABLE_COLUMNS = ("Notes", "PostalCode", "TaxID", "Email", "Mobile",
+                     "Phone2", "Phone", "Address", "Type", "Name", "Code", "ID")
+    # ستون جدول -> ستون مرتب‌سازی CustomerManager.page_customers
+    SORT_COLUMN_MAP = {**FILTER_COLUMN_MAP, "ID": "id"}
+
     def __init__(self, parent, db_manager, ui_colors, base_font, heading_font, button_font, nav_button_font):
         super().__init__(parent, fg_color="transparent")
         self.parent = parent
@@ -274,12 +289,8 @@ class CustomerUI(ctk.CTkFrame):
         self.tree_scrollbar = ctk.CTkScrollbar(table_frame)
         self.tree_scrollbar.pack(side="right", fill="y")
         
-        # تعریف ستون‌ها به ترتیب معکوس نمایش (آخرین ستون در لیست، اولین ستون در نمایش)
-        # ID همیشه آخرین ستون در این لیست داخلی Treeview باشد
-        column_identifiers = ("Notes", "PostalCode", "TaxID", "Email", "Mobile", 
-                              "Phone2", "Phone", "Address", "Type", "Name", "Code", "ID")
         self.customer_table = ttk.Treeview(table_frame, 
-                                           columns=column_identifiers, 
+                                           columns=self.TABLE_COLUMNS, 
                                            show="headings", 
                                            yscrollcommand=self.tree_scrollbar.set)
         self.customer_table.pack(fill="both", expand=True)
@@ -315,7 +326,7 @@ class CustomerUI(ctk.CTkFrame):
         self.customer_table.column("ID", width=0, stretch=False) # شناسه - مخفی
 
         # ایجاد فیلدهای جستجو برای هر ستون
-        for col_id in column_identifiers:
+        for col_id in self.TABLE_COLUMNS:
             if col_id == "ID": # برای ID فیلتر نمی‌خواهیم
                 self.filter_vars[col_id] = ctk.StringVar(value="")
                 self.filter_entries[col_id] = None # placeholder
@@ -342,6 +353,12 @@ class CustomerUI(ctk.CTkFrame):
         tree_style.configure("Treeview.Heading", font=self.button_font)
         tree_style.layout("Treeview", [('Treeview.treearea', {'sticky': 'nsew'})])
 
+        # فقط ردیف‌های قابل مشاهده در جدول درج می‌شوند؛ فیلتر و بارگذاری در پس‌زمینه منبع داده جدید می‌سازند
+        self.customer_view = VirtualTreeview(self.customer_table, self.tree_scrollbar)
+        self.filter_controller = LiveFilterController(self.customer_table, self.fetch_customer_source,
+                                                      on_result=self.customer_view.set_source)
+        # بعد از افزودن/ویرایش/حذف فقط ردیف تغییر کرده به‌روز می‌شود (نه بارگذاری دوباره کل لیست)
+        ChangeEventBus.shared().subscribe_widget(self.customer_table, CUSTOMER, self.on_customer_changed)
         self.load_customers_to_table()
         
         return table_frame
@@ -388,63 +405,55 @@ class CustomerUI(ctk.CTkFrame):
             self.on_treeview_configure(None) # فراخوانی دستی برای تنظیم اولیه ابعاد
 
     def apply_live_filter(self, event=None):
-        """ اعمال فیلتر زنده بر اساس ورودی کاربر در فیلدهای جستجو """
-        search_terms = {col_id: self.filter_vars[col_id].get().strip().lower() 
-                        for col_id in self.filter_vars if self.filter_vars[col_id].get().strip()}
-        
-        all_customers, _ = self.customer_manager.get_all_customers()
-        
-        # پاک کردن آیتم‌های فعلی جدول
-        for item in self.customer_table.get_children():
-            self.customer_table.delete(item)
-
-        filtered_customers = []
-        for customer in all_customers:
-            match = True
-            # باید مطمئن شویم که داده‌های customer به ترتیب و نام صحیح ستون‌ها در Treeview مپ می‌شوند
-            # به ترتیب: Notes, PostalCode, TaxID, Email, Mobile, Phone2, Phone, Address, Type, Name, Code, ID
-            customer_values_for_filter = {
-                "Notes": str(customer.notes).lower(),
-                "PostalCode": str(customer.postal_code).lower(),
-                "TaxID": str(customer.tax_id).lower(),
-                "Email": str(customer.email).lower(),
-                "Mobile": str(customer.mobile).lower(),
-                "Phone2": str(customer.phone2).lower(),
-                "Phone": str(customer.phone).lower(),
-                "Address": str(customer.address).lower(),
-                "Type": str(customer.customer_type).lower(),
-                "Name": str(customer.name).lower(),
-                "Code": str(customer.customer_code).lower(),
-                # "ID": str(customer.id).lower() # ID فیلتر نمی‌شود
-            }
-
-            for col_id, term in search_terms.items():
-                if col_id in customer_values_for_filter:
-                    if term not in customer_values_for_filter[col_id]:
-                        match = False
-                        break
-                else: # اگر ستون مورد جستجو در customer_values_for_filter نبود
-                    match = False
-                    break # یا می‌توانید اینجا یک پیام هشدار بدهید که ستون نامعتبر است
-
-            if match:
-                filtered_customers.append(customer)
-        
-        for customer in filtered_customers:
-            self.customer_table.insert("", "end", iid=customer.id,
-                                     values=(str(customer.notes) if customer.notes else '',
-                                             str(customer.postal_code) if customer.postal_code else '',
-                                             str(customer.tax_id) if customer.tax_id else '',
-                                             str(customer.email) if customer.email else '',
-                                             str(customer.mobile) if customer.mobile else '',
-                                             str(customer.phone2) if customer.phone2 else '',
-                                             str(customer.phone) if customer.phone else '',
-                                             str(customer.address) if customer.address else '',
-                                             str(customer.customer_type) if customer.customer_type else '',
-                                             str(customer.name) if customer.name else '',
-                                             str(customer.customer_code) if customer.customer_code else '',
-                                             customer.id))
-
+        """ اعمال فیلتر زنده بر اساس ورودی کاربر در فیلدهای جستجو (جستجو در دیتابیس با ایندکس متنی) """
+        search_terms = {self.FILTER_COLUMN_MAP[col_id]: self.filter_vars[col_id].get().strip()
+                        for col_id in self.filter_vars
+                        if col_id in self.FILTER_COLUMN_MAP and self.filter_vars[col_id].get().strip()}
+        # فیلتر خالی هم از همین مسیر (با debounce) کل لیست را برمی‌گرداند
+        self.filter_controller.request(search_terms)
+
+    def fetch_customer_source(self, search_terms):
+        """
+        منبع داده جدول برای فیلتر داده شده (در نخ کارگر LiveFilterController اجرا می‌شود).
+        با فیلتر یا بدون آن، صفحه‌بندی keyset روی همه ردیف‌های جور (بدون سقف تعداد نتایج)؛ صفحه اول همین‌جا خوانده می‌شود.
+        """
+        if search_terms:
+            total, _ = self.customer_manager.count_search(search_terms)
+            fetch_page = lambda *args, **kwargs: self.customer_manager.page_search(search_terms, *args, **kwargs)
+        else:
+            total, _ = self.customer_manager.count_customers()
+            fetch_page = self.customer_manager.page_customers
+        source = KeysetPageSource(fetch_page, total,
+                                  lambda customer: (customer.id, self.customer_row_values(customer)),
+                                  self.SORT_COLUMN_MAP, ("name", False), sort=self.customer_view.sort,
+                                  filtered=bool(search_terms))
+        source.get_rows(0, KeysetPageSource.PAGE_SIZE)
+        return source
+
+    @staticmethod
+    def customer_row_values(customer):
+        """ مقادیر یک ردیف جدول به ترتیب ستون‌های تعریف شده در Treeview """
+        return (str(customer.notes) if customer.notes else '',
+                str(customer.postal_code) if customer.postal_code else '',
+                str(customer.tax_id) if customer.tax_id else '',
+                str(customer.email) if customer.email else '',
+                str(customer.mobile) if customer.mobile else '',
+                str(customer.phone2) if customer.phone2 else '',
+                str(customer.phone) if customer.phone else '',
+                str(customer.address) if customer.address else '',
+                str(customer.customer_type) if customer.customer_type else '',
+                str(customer.name) if customer.name else '',
+                str(customer.customer_code) if customer.customer_code else '',
+                customer.id)
+
+
+    def on_customer_changed(self, event):
+        """ اعمال یک رویداد تغییر مشتری روی جدول بدون بارگذاری دوباره کل لیست """
+        def load_values():
+            customer, _ = self.customer_manager.get_customer_by_id(event.entity_id)
+            return self.customer_row_values(customer) if customer else None
+        if not self.customer_view.apply_change(event.operation, event.entity_id, load_values):
+            self.apply_live_filter() # نتایج جستجوی فعلی دوباره گرفته می‌شوند
 
     def on_customer_type_select(self):
         """ تغییر لیبل شناسه ملی/شماره ملی بر اساس نوع مشتری """
@@ -456,29 +465,8 @@ class CustomerUI(ctk.CTkFrame):
                 self.tax_id_label.configure(text="شماره ملی")
 
     def load_customers_to_table(self):
-        """ بارگذاری مشتریان از دیتابیس به جدول """
-        for item in self.customer_table.get_children():
-            self.customer_table.delete(item)
-
-        customers, message = self.customer_manager.get_all_customers()
-        if not customers:
-            pass
-
-        for customer in customers:
-            # هنگام درج، مقادیر را به ترتیب ستون‌های تعریف شده در Treeview بدهید
-            self.customer_table.insert("", "end", iid=customer.id,
-                                     values=(str(customer.notes) if customer.notes else '',
-                                             str(customer.postal_code) if customer.postal_code else '',
-                                             str(customer.tax_id) if customer.tax_id else '',
-                                             str(customer.email) if customer.email else '',
-                                             str(customer.mobile) if customer.mobile else '',
-                                             str(customer.phone2) if customer.phone2 else '',
-                                             str(customer.phone) if customer.phone else '',
-                                             str(customer.address) if customer.address else '',
-                                             str(customer.customer_type) if customer.customer_type else '',
-                                             str(customer.name) if customer.name else '',
-                                             str(customer.customer_code) if customer.customer_code else '',
-                                             customer.id))
+        """ بارگذاری مشتریان از دیتابیس به جدول (در پس‌زمینه؛ جدول فقط ردیف‌های قابل مشاهده را نگه می‌دارد) """
+        self.filter_controller.refresh({})
 
     def clear_customer_form(self):
         """ پاک کردن فیلدهای فرم مشتری و غیرفعال کردن دکمه حذف """
@@ -566,7 +554,6 @@ class CustomerUI(ctk.CTkFrame):
         if success:
             messagebox.showinfo("موفقیت", message, master=self)
             self.clear_customer_form()
-            self.load_customers_to_table()
         else:
             messagebox.showerror("خطا", message, master=self)
 
@@ -579,7 +566,6 @@ class CustomerUI(ctk.CTkFrame):
                 if success:
                     messagebox.showinfo("موفقیت", message, master=self)
                     self.clear_customer_form()
-                    self.load_customers_to_table()
                 else:
                     messagebox.showerror("خطا", message, master=self)
         else:
@@ -2,46 +2,444 @@
 import sqlite3
 import os
 import sys
+import threading
+from contextlib import contextmanager
+from text_normalizer import normalize_search_text
 
 DATABASE_NAME = "easy_invoice.db"
-DATABASE_SCHEMA_VERSION = 15 # افزایش یافت به 15
+DATABASE_SCHEMA_VERSION = 20 # افزایش یافت به 20 (ایندکس‌های مرتب‌سازی لیست‌های مجازی)
+
+# پروفایل‌های PRAGMA که روی هر اتصال جدید اعمال می‌شوند.
+# هر دو از WAL استفاده می‌کنند تا خواننده‌های UI پشت نوشتن یک کار دسته‌ای قفل نشوند.
+PRAGMA_PROFILES = {
+    "conservative": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -8000,        # حدود 8MB (مقدار منفی یعنی کیلوبایت)
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+    },
+    "fast": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",    # در WAL فقط با قطع برق ممکن است آخرین کامیت از دست برود
+        "cache_size": -64000,       # حدود 64MB
+        "mmap_size": 268435456,     # 256MB
+        "temp_store": "MEMORY",
+    },
+}
+DEFAULT_PRAGMA_PROFILE = "fast"
+PRAGMA_PROFILE_ENV_VAR = "EASYINVOICE_DB_PROFILE" # برای انتخاب پروفایل بدون تغییر کد
+
+# ایندکس‌های کلیدهای خارجی و ستون‌های مرتب‌سازی (از نسخه 16)
+INDEX_QUERIES = [
+    "CREATE INDEX IF NOT EXISTS idx_customers_name_nocase ON Customers(name COLLATE NOCASE);",
+    "CREATE INDEX IF NOT EXISTS idx_contracts_customer_id ON Contracts(customer_id);",
+    # پوششی برای لیست قراردادها (ORDER BY contract_date DESC)
+    "CREATE INDEX IF NOT EXISTS idx_contracts_list ON Contracts(contract_date, id, customer_id, contract_number, title);",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_customer_id ON Invoices(customer_id);",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_contract_id ON Invoices(contract_id);",
+    # پوششی برای لیست صورتحساب‌ها (ORDER BY issue_date DESC, id DESC)
+    "CREATE INDEX IF NOT EXISTS idx_invoices_list ON Invoices(issue_date, id, customer_id, invoice_number, final_amount);",
+    "CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice_id ON InvoiceItems(invoice_id);",
+    "CREATE INDEX IF NOT EXISTS idx_invoice_items_service_id ON InvoiceItems(service_id);",
+    # مرتب‌سازی لیست‌های مجازی روی ستون‌های پرکاربرد (عبارت‌ها باید با SORT_COLUMNS مدیرها یکی باشند)
+    "CREATE INDEX IF NOT EXISTS idx_customers_code_sort ON Customers(IFNULL(customer_code, 0), id);",
+    "CREATE INDEX IF NOT EXISTS idx_contracts_date_sort ON Contracts(IFNULL(contract_date, ''), id);",
+    "CREATE INDEX IF NOT EXISTS idx_invoices_final_amount ON Invoices(final_amount, id);",
+]
+
+# ایندکس متنی مشتریان (از نسخه 17). توکنایزر trigram جستجوی زیررشته‌ای (مثل فیلتر قبلی با in) را
+# برای عبارت‌های سه حرفی و بیشتر از روی ایندکس انجام می‌دهد؛ تریگرها آن را با Customers هماهنگ نگه می‌دارند.
+# تریگرها فقط متن خام را کپی می‌کنند (بدون تابع مخصوص برنامه، تا نوشتن از هر کلاینت SQLite کار کند) و
+# مدیرها بعد از هر درج/ویرایش در همان تراکنش با refresh_customer_search_index متن نرمال شده
+# (normalize_search_text) را جایگزین می‌کنند (از نسخه 19).
+CUSTOMER_FTS_COLUMNS = ("name", "phone", "phone2", "mobile", "email", "tax_id", "postal_code", "address", "notes",
+                        "customer_code", "customer_type")
+# ستون‌هایی که جستجوی بدون ستون مشخص (رشته ساده) روی آن‌ها انجام می‌شود
+CUSTOMER_FTS_DEFAULT_COLUMNS = CUSTOMER_FTS_COLUMNS[:9]
+_CUSTOMER_FTS_COLS = ", ".join(CUSTOMER_FTS_COLUMNS)
+_CUSTOMER_FTS_NEW = ", ".join(f"new.{col}" for col in CUSTOMER_FTS_COLUMNS)
+CUSTOMER_FTS_QUERIES = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS CustomersFTS USING fts5(
+        {_CUSTOMER_FTS_COLS}, tokenize='trigram'
+    );""",
+    f"""CREATE TRIGGER IF NOT EXISTS customers_fts_ai AFTER INSERT ON Customers BEGIN
+        INSERT INTO CustomersFTS(rowid, {_CUSTOMER_FTS_COLS}) VALUES (new.id, {_CUSTOMER_FTS_NEW});
+    END;""",
+    """CREATE TRIGGER IF NOT EXISTS customers_fts_ad AFTER DELETE ON Customers BEGIN
+        DELETE FROM CustomersFTS WHERE rowid = old.id;
+    END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS customers_fts_au AFTER UPDATE ON Customers BEGIN
+        DELETE FROM CustomersFTS WHERE rowid = old.id;
+        INSERT INTO CustomersFTS(rowid, {_CUSTOMER_FTS_COLS}) VALUES (new.id, {_CUSTOMER_FTS_NEW});
+    END;""",
+]
+_CUSTOMER_FTS_SOURCE = f"SELECT id, {_CUSTOMER_FTS_COLS} FROM Customers"
+
+# ایندکس متنی قراردادها (از نسخه 18). نام مشتری هم در خود ایندکس نگه داشته می‌شود و تریگرهای Contracts
+# و تغییر نام در Customers آن را به‌روز نگه می‌دارند. نرمال‌سازی مثل CustomersFTS در مدیرها انجام می‌شود.
+CONTRACT_FTS_COLUMNS = ("contract_number", "title", "description", "contract_date", "customer_name",
+                        "payment_method", "total_amount")
+CONTRACT_FTS_DEFAULT_COLUMNS = CONTRACT_FTS_COLUMNS[:5]
+# وزن ستون‌ها در رتبه‌بندی bm25 (به ترتیب CONTRACT_FTS_COLUMNS)
+CONTRACT_FTS_WEIGHTS = (10.0, 5.0, 1.0, 2.0, 4.0, 1.0, 1.0)
+_CONTRACT_FTS_COLS = ", ".join(CONTRACT_FTS_COLUMNS)
+_CONTRACT_FTS_NEW = """new.contract_number, new.title, new.description, new.contract_date,
+            (SELECT name FROM Customers WHERE id = new.customer_id), new.payment_method, new.total_amount"""
+CONTRACT_FTS_QUERIES = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS ContractsFTS USING fts5(
+        {_CONTRACT_FTS_COLS}, tokenize='trigram'
+    );""",
+    f"""CREATE TRIGGER IF NOT EXISTS contracts_fts_ai AFTER INSERT ON Contracts BEGIN
+        INSERT INTO ContractsFTS(rowid, {_CONTRACT_FTS_COLS}) VALUES (new.id, {_CONTRACT_FTS_NEW});
+    END;""",
+    """CREATE TRIGGER IF NOT EXISTS contracts_fts_ad AFTER DELETE ON Contracts BEGIN
+        DELETE FROM ContractsFTS WHERE rowid = old.id;
+    END;""",
+    f"""CREATE TRIGGER IF NOT EXISTS contracts_fts_au AFTER UPDATE ON Contracts BEGIN
+        DELETE FROM ContractsFTS WHERE rowid = old.id;
+        INSERT INTO ContractsFTS(rowid, {_CONTRACT_FTS_COLS}) VALUES (new.id, {_CONTRACT_FTS_NEW});
+    END;""",
+    """CREATE TRIGGER IF NOT EXISTS customers_contracts_fts_au AFTER UPDATE OF name ON Customers BEGIN
+        UPDATE ContractsFTS SET customer_name = new.name
+        WHERE rowid IN (SELECT id FROM Contracts WHERE customer_id = new.id);
+    END;""",
+]
+_CONTRACT_FTS_SOURCE = """SELECT c.id, c.contract_number, c.title, c.description, c.contract_date, cust.name,
+        c.payment_method, c.total_amount
+    FROM Contracts c LEFT JOIN Customers cust ON c.customer_id = cust.id"""
+
+# حذف ایندکس‌های متنی و تریگرهایشان (برای ساخت دوباره در مهاجرت)
+FTS_DROP_QUERIES = [
+    "DROP TRIGGER IF EXISTS customers_fts_ai;",
+    "DROP TRIGGER IF EXISTS customers_fts_ad;",
+    "DROP TRIGGER IF EXISTS customers_fts_au;",
+    "DROP TRIGGER IF EXISTS contracts_fts_ai;",
+    "DROP TRIGGER IF EXISTS contracts_fts_ad;",
+    "DROP TRIGGER IF EXISTS contracts_fts_au;",
+    "DROP TRIGGER IF EXISTS customers_contracts_fts_au;",
+    "DROP TABLE IF EXISTS CustomersFTS;",
+    "DROP TABLE IF EXISTS ContractsFTS;",
+]
+
+
+def fts_phrase(term):
+    """ تبدیل عبارت کاربر به یک phrase امن برای MATCH در FTS5 """
+    return '"' + term.replace('"', '""') + '"'
+
+
+def like_pattern(term, prefix=False):
+    """ الگوی LIKE زیررشته‌ای (یا پیشوندی با prefix=True) برای عبارت کاربر (با ESCAPE '\\') """
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%" if prefix else "%" + escaped + "%"
+
+
+def keyset_clause(sort_expr, id_expr, descending=False, after=None, before=None, offset=0, limit=200,
+                  where=None, where_params=()):
+    """
+    بخش WHERE/ORDER BY/LIMIT یک صفحه keyset با مرتب‌سازی بر اساس sort_expr و سپس id_expr.
+    sort_expr نباید NULL برگرداند (برای ستون‌های nullable از IFNULL استفاده شود).
+    after: کلید (sort_value, id) آخرین ردیف صفحه قبل؛ before: کلید اولین ردیف صفحه بعد (خواندن رو به عقب).
+    offset برای پرش به وسط لیست است: از ابتدای لیست، یا (همراه after/before) از نزدیک‌ترین کلید معلوم.
+    where/where_params: شرط اضافه (مثلاً فیلتر جستجو) که با شرط keyset ترکیب می‌شود.
+    خروجی: (sql, params, reverse)؛ اگر reverse برقرار باشد ردیف‌ها باید برعکس شوند.
+    """
+    reverse = before is not None
+    ascending = descending == reverse # خواندن رو به عقب جهت مرتب‌سازی را برعکس می‌کند
+    key = before if reverse else after
+    op, op_eq = (">", ">=") if ascending else ("<", "<=")
+    conditions, params = ([f"({where})"], list(where_params)) if where else ([], [])
+    if key is not None:
+        # شرط اول محدوده ایندکس را مشخص می‌کند و شرط دوم مقدارهای برابر را با id جدا می‌کند
+        conditions.append(f"{sort_expr} {op_eq} ? AND ({sort_expr} {op} ? OR {id_expr} {op} ?)")
+        params.extend([key[0], key[0], key[1]])
+    direction = "ASC" if ascending else "DESC"
+    sql = f"ORDER BY {sort_expr} {direction}, {id_expr} {direction} LIMIT ?"
+    if conditions:
+        sql = f"WHERE {' AND '.join(conditions)} {sql}"
+    params.append(limit)
+    if offset:
+        sql += " OFFSET ?"
+        params.append(offset)
+    return sql, tuple(params), reverse
+
+
+# بررسی رگرسیون پلن کوئری‌های پرتکرار: (کوئری، پارامترها، ایندکسی که باید استفاده شود)
+EXPECTED_QUERY_PLANS = [
+    ("SELECT * FROM Customers ORDER BY name COLLATE NOCASE ASC", (), "idx_customers_name_nocase"),
+    ("""SELECT c.id, c.contract_number, c.contract_date, cust.name AS customer_name
+        FROM Contracts c JOIN Customers cust ON c.customer_id = cust.id
+        ORDER BY c.contract_date DESC""", (), "idx_contracts_list"),
+    ("SELECT id FROM Contracts WHERE customer_id = ?", (1,), "idx_contracts_customer_id"),
+    ("""SELECT i.id, i.invoice_number, i.issue_date, i.final_amount, c.name AS customer_name
+        FROM Invoices i JOIN Customers c ON i.customer_id = c.id
+        ORDER BY i.issue_date DESC, i.id DESC""", (), "idx_invoices_list"),
+    ("SELECT id FROM Invoices WHERE customer_id = ?", (1,), "idx_invoices_customer_id"),
+    ("SELECT id FROM Invoices WHERE contract_id = ?", (1,), "idx_invoices_contract_id"),
+    ("SELECT * FROM InvoiceItems WHERE invoice_id = ?", (1,), "idx_invoice_items_invoice_id"),
+    ("SELECT id FROM InvoiceItems WHERE service_id = ?", (1,), "idx_invoice_items_service_id"),
+    ("SELECT * FROM Customers c ORDER BY IFNULL(c.customer_code, 0) DESC, c.id DESC LIMIT 200", (), "idx_customers_code_sort"),
+    ("""SELECT c.id FROM Contracts c JOIN Customers cust ON c.customer_id = cust.id
+        ORDER BY IFNULL(c.contract_date, '') DESC, c.id DESC LIMIT 200""", (), "idx_contracts_date_sort"),
+    ("""SELECT i.id FROM Invoices i JOIN Customers c ON i.customer_id = c.id
+        ORDER BY i.final_amount ASC, i.id ASC LIMIT 200""", (), "idx_invoices_final_amount"),
+]
+
+def resolve_pragma_profile(profile=None):
+    """
+    تبدیل نام پروفایل (یا دیکشنری سفارشی PRAGMAها) به دیکشنری نهایی.
+    اولویت: آرگومان، سپس متغیر محیطی EASYINVOICE_DB_PROFILE، سپس پروفایل پیش‌فرض.
+    """
+    if isinstance(profile, dict):
+        return dict(profile)
+    name = profile or os.environ.get(PRAGMA_PROFILE_ENV_VAR) or DEFAULT_PRAGMA_PROFILE
+    if name not in PRAGMA_PROFILES:
+        print(f"Warning: unknown PRAGMA profile '{name}'. Using '{DEFAULT_PRAGMA_PROFILE}'.")
+        name = DEFAULT_PRAGMA_PROFILE
+    return dict(PRAGMA_PROFILES[name])
+
+
+class PooledConnection(sqlite3.Connection):
+    """ اتصال استخر که عمق تراکنش باز روی آن را هم نگه می‌دارد (مشترک بین همه DBManagerها). """
+    transaction_depth = 0
+
+
+class ConnectionPool:
+    """
+    استخر سراسری (در سطح پروسه) اتصال‌ها برای یک فایل دیتابیس.
+    برای هر نخ (thread) یک اتصال ماندگار نگه داشته می‌شود و بین همه مدیرها مشترک است،
+    بنابراین checkout/checkin به جای باز و بسته کردن فایل فقط یک شمارنده را تغییر می‌دهد.
+    """
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    def __init__(self, db_path, pragma_profile=None):
+        self.db_path = db_path
+        self.pragmas = resolve_pragma_profile(pragma_profile)
+        self._lock = threading.Lock()
+        self._connections = {} # thread ident -> [thread, conn, checkout_count]
+
+    @classmethod
+    def for_path(cls, db_path, pragma_profile=None):
+        """
+        بازگرداندن استخر مشترک برای یک مسیر دیتابیس (در صورت نبود، ساخته می‌شود).
+        اگر pragma_profile داده شود، روی اتصال‌هایی که از این به بعد باز می‌شوند اعمال می‌شود.
+        """
+        with cls._pools_lock:
+            pool = cls._pools.get(db_path)
+            if pool is None:
+                pool = cls(db_path, pragma_profile)
+                cls._pools[db_path] = pool
+            elif pragma_profile is not None:
+                pool.pragmas = resolve_pragma_profile(pragma_profile)
+            return pool
+
+    def _open_connection(self):
+        # check_same_thread=False فقط برای بستن اتصال‌ها در close_all است؛
+        # خود استخر تضمین می‌کند هر اتصال تنها در نخ سازنده‌اش استفاده شود.
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=PooledConnection)
+        conn.row_factory = sqlite3.Row
+        self._apply_pragmas(conn)
+        print(f"Connected to database: {self.db_path}")
+        return conn
+
+    def _apply_pragmas(self, conn):
+        # busy_timeout اول اعمال می‌شود تا تغییر journal_mode هم منتظر قفل بماند
+        for name, value in self.pragmas.items():
+            try:
+                conn.execute(f"PRAGMA {name} = {value}")
+            except sqlite3.Error as e:
+                print(f"Warning: could not apply PRAGMA {name} = {value}: {e}")
+
+    def _prune_dead_threads(self):
+        """ بستن اتصال نخ‌هایی که دیگر زنده نیستند. """
+        for ident, (thread, conn, _) in list(self._connections.items()):
+            if not thread.is_alive():
+                conn.close()
+                del self._connections[ident]
+
+    def checkout(self):
+        """ گرفتن اتصال نخ جاری از استخر. """
+        thread = threading.current_thread()
+        with self._lock:
+            self._prune_dead_threads()
+            entry = self._connections.get(thread.ident)
+            if entry is None or entry[0] is not thread:
+                entry = [thread, self._open_connection(), 0]
+                self._connections[thread.ident] = entry
+            entry[2] += 1
+            return entry[1]
+
+    def checkin(self, conn):
+        """ بازگرداندن اتصال به استخر. اتصال باز می‌ماند تا دفعه بعد دوباره استفاده شود. """
+        with self._lock:
+            entry = self._connections.get(threading.get_ident())
+            if entry is None or entry[1] is not conn:
+                return
+            entry[2] = max(entry[2] - 1, 0)
+            if entry[2] == 0 and conn.in_transaction:
+                # تراکنش نیمه‌کاره نباید به استفاده بعدی از اتصال مشترک نشت کند
+                conn.rollback()
+
+    def close_all(self):
+        """ بستن همه اتصال‌های استخر (هنگام خروج از برنامه). """
+        with self._lock:
+            for _, conn, _ in self._connections.values():
+                conn.close()
+            self._connections.clear()
+        print("Database connection closed.")
+
 
 class DBManager:
-    def __init__(self, db_path):
+    def __init__(self, db_path, pragma_profile=None):
         if getattr(sys, 'frozen', False):
             base_path = os.path.dirname(sys.executable)
         else:
             base_path = os.path.dirname(os.path.abspath(__file__))
         
-        self.db_path = os.path.join(base_path, DATABASE_NAME)
-        
-        self.conn = None
+        self._bind(os.path.join(base_path, DATABASE_NAME), pragma_profile)
+
+    @classmethod
+    def at_path(cls, db_path, pragma_profile=None):
+        """ DBManager روی یک فایل مشخص به جای دیتابیس کنار برنامه (مثلاً دیتابیس موقت بررسی‌ها) """
+        manager = cls.__new__(cls)
+        manager._bind(db_path, pragma_profile)
+        return manager
+
+    def _bind(self, db_path, pragma_profile):
+        self.db_path = db_path
+        self.pool = ConnectionPool.for_path(self.db_path, pragma_profile)
+        self._local = threading.local() # هر نخ اتصال checkout شده خودش را دارد
+
+    @property
+    def conn(self):
+        return getattr(self._local, 'conn', None)
 
     def connect(self):
+        """ checkout یک اتصال از استخر مشترک برای نخ جاری. """
+        if self.conn is not None:
+            return True
         try:
-            self.conn = sqlite3.connect(self.db_path)
-            self.conn.row_factory = sqlite3.Row
-            print(f"Connected to database: {self.db_path}")
+            self._local.conn = self.pool.checkout()
             return True
         except sqlite3.Error as e:
             print(f"Error connecting to database: {e}")
             return False
 
     def close(self):
-        if self.conn:
-            self.conn.close()
-            print("Database connection closed.")
+        """ checkin اتصال به استخر؛ اتصال واقعی برای استفاده‌های بعدی باز می‌ماند. """
+        conn = self.conn
+        if conn:
+            self.pool.checkin(conn)
+            self._local.conn = None
+
+    def close_all(self):
+        """ بستن واقعی همه اتصال‌های استخر این دیتابیس. """
+        self.close()
+        self.pool.close_all()
 
     def execute_query(self, query, params=()):
         try:
             cursor = self.conn.cursor()
             cursor.execute(query, params)
-            self.conn.commit()
+            if not self.conn.transaction_depth: # داخل transaction() کامیت با خود تراکنش است
+                self.conn.commit()
             return cursor
         except sqlite3.Error as e:
             print(f"Error executing query: {query} with params {params} - {e}")
+            if not self.conn.transaction_depth and self.conn.in_transaction:
+                # تراکنش ضمنی دستور شکست خورده نباید روی اتصال مشترک نخ باز بماند
+                self.conn.rollback()
             return None
 
+    def execute(self, query, params=()):
+        """
+        اجرای یک دستور بدون کامیت، برای استفاده داخل transaction().
+        برخلاف execute_query خطا را بالا می‌فرستد تا تراکنش برگشت بخورد.
+        """
+        return self.conn.execute(query, params)
+
+    def execute_many(self, query, params_seq):
+        """
+        اجرای دسته‌ای یک دستور (INSERT/UPDATE/DELETE) با executemany در یک تراکنش.
+        تعداد سطرهای تغییر یافته برگردانده می‌شود؛ خطا بالا فرستاده می‌شود.
+        """
+        with self.transaction() as conn:
+            cursor = conn.executemany(query, params_seq)
+        return cursor.rowcount
+
+    def insert_many(self, query, params_seq):
+        """
+        درج دسته‌ای با executemany در یک تراکنش و بازگرداندن شناسه‌های تولید شده به ترتیب ورودی.
+        شناسه‌ها از last_insert_rowid محاسبه می‌شوند، پس query باید یک INSERT ساده (بدون OR IGNORE
+        و بدون id صریح) باشد؛ قفل نوشتن تراکنش تضمین می‌کند شناسه‌ها پشت سر هم باشند.
+        """
+        params_seq = list(params_seq)
+        if not params_seq:
+            return []
+        with self.transaction() as conn:
+            conn.executemany(query, params_seq)
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+        first_id = last_id - len(params_seq) + 1
+        return list(range(first_id, last_id + 1))
+
+    def iter_query(self, query, params=(), batch_size=500):
+        """
+        اجرای یک SELECT و برگرداندن سطرها به صورت جریانی با fetchmany (نه کل جدول در حافظه).
+        اتصال مستقیماً از استخر گرفته می‌شود تا connect/close های دیگر روی همین DBManager
+        در میانه پیمایش، cursor را از کار نیندازند.
+        """
+        conn = self.pool.checkout()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            self.pool.checkin(conn)
+
+    @contextmanager
+    def transaction(self):
+        """
+        with db.transaction(): ...
+        همه دستورات داخل بلوک یک تراکنش اتمیک با یک کامیت هستند و در صورت خطا برگشت می‌خورند.
+        تراکنش‌های تو در تو (حتی از DBManager دیگری روی همان نخ) به صورت SAVEPOINT اجرا می‌شوند.
+        """
+        opened_here = self.conn is None
+        if opened_here and not self.connect():
+            raise sqlite3.OperationalError("Could not connect to database.")
+        conn = self.conn
+        depth = conn.transaction_depth
+        savepoint = f"sp_{depth}"
+        if depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        else:
+            conn.execute(f"SAVEPOINT {savepoint}")
+        conn.transaction_depth = depth + 1
+        try:
+            yield conn
+        except BaseException:
+            conn.transaction_depth = depth
+            if depth == 0:
+                conn.rollback()
+            else:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+            raise
+        else:
+            conn.transaction_depth = depth
+            if depth == 0:
+                conn.commit()
+            else:
+                conn.execute(f"RELEASE {savepoint}")
+        finally:
+            if opened_here:
+                self.close()
+
     def create_tables(self):
         queries = [
             """
@@ -139,13 +537,71 @@ class DBManager:
             );
             """
         ]
-        for query in queries:
-            if not self.execute_query(query):
-                print(f"Failed to create table with query: {query}")
-                return False
+        try:
+            with self.transaction():
+                is_new_database = self.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0
+                for query in queries:
+                    self.execute(query)
+                if is_new_database:
+                    # دیتابیس تازه مستقیماً با آخرین شِما ساخته شد؛ مهاجرت‌های قدیمی نباید روی آن اجرا شوند
+                    # (ایندکس‌ها فقط اینجا ساخته می‌شوند، چون جداول دیتابیس قدیمی هنوز شِمای قدیمی دارند)
+                    for query in INDEX_QUERIES:
+                        self.execute(query)
+                    if self.has_fts5():
+                        for query in CUSTOMER_FTS_QUERIES + CONTRACT_FTS_QUERIES:
+                            self.execute(query)
+                    self.set_db_version(DATABASE_SCHEMA_VERSION)
+        except sqlite3.Error as e:
+            print(f"Failed to create tables: {e}")
+            return False
         print("All tables created or already exist.")
         return True
 
+    def has_fts5(self):
+        """ آیا SQLite این محیط ماژول FTS5 (و توکنایزر trigram) را دارد؟ """
+        try:
+            self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x, tokenize='trigram')")
+            self.conn.execute("DROP TABLE temp.fts5_probe")
+            return True
+        except sqlite3.OperationalError:
+            return False
+
+    SEARCH_INDEX_CHUNK = 500 # حداکثر شناسه در هر IN (...) هنگام به‌روزرسانی ایندکس متنی
+
+    def refresh_customer_search_index(self, customer_ids=None):
+        """
+        نوشتن متن نرمال شده مشتریان (همه، یا customer_ids) در CustomersFTS. باید داخل transaction()
+        صدا زده شود؛ بدون FTS5 کاری انجام نمی‌دهد. خروجی: تعداد ردیف‌های به‌روز شده.
+        """
+        return self._refresh_search_index("CustomersFTS", CUSTOMER_FTS_COLUMNS, _CUSTOMER_FTS_SOURCE, "id", customer_ids)
+
+    def refresh_contract_search_index(self, contract_ids=None, customer_ids=None):
+        """
+        نوشتن متن نرمال شده قراردادها در ContractsFTS: همه، یا قراردادهای contract_ids، یا قراردادهای
+        مشتریان customer_ids (بعد از تغییر نام مشتری). مثل refresh_customer_search_index داخل تراکنش.
+        """
+        if customer_ids is not None:
+            return self._refresh_search_index("ContractsFTS", CONTRACT_FTS_COLUMNS, _CONTRACT_FTS_SOURCE,
+                                              "c.customer_id", customer_ids)
+        return self._refresh_search_index("ContractsFTS", CONTRACT_FTS_COLUMNS, _CONTRACT_FTS_SOURCE, "c.id", contract_ids)
+
+    def _refresh_search_index(self, fts_table, columns, source_sql, key_expr, keys):
+        if self.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts_table,)).fetchone() is None:
+            return 0
+        if keys is None:
+            rows = self.execute(source_sql).fetchall()
+        else:
+            keys, rows = list(keys), []
+            for start in range(0, len(keys), self.SEARCH_INDEX_CHUNK):
+                chunk = keys[start:start + self.SEARCH_INDEX_CHUNK]
+                placeholders = ", ".join("?" for _ in chunk)
+                rows.extend(self.execute(f"{source_sql} WHERE {key_expr} IN ({placeholders})", chunk).fetchall())
+        values = [(row[0],) + tuple(normalize_search_text(value) for value in tuple(row)[1:]) for row in rows]
+        self.conn.executemany(f"DELETE FROM {fts_table} WHERE rowid = ?", [(value[0],) for value in values])
+        placeholders = ", ".join("?" for _ in range(len(columns) + 1))
+        self.conn.executemany(f"INSERT INTO {fts_table}(rowid, {', '.join(columns)}) VALUES ({placeholders})", values)
+        return len(values)
+
     def get_db_version(self):
         cursor = self.execute_query("SELECT db_version FROM AppSettings WHERE id = 1")
         if cursor:
@@ -155,426 +611,99 @@ class DBManager:
         return 0
 
     def set_db_version(self, version):
-        self.execute_query("INSERT OR IGNORE INTO AppSettings (id) VALUES (?)", (1,))
-        self.execute_query("UPDATE AppSettings SET db_version = ? WHERE id = 1", (version,))
-
-    def migrate_database(self):
-        current_db_version = self.get_db_version()
-        print(f"Current database version: {current_db_version}")
-
-        if current_db_version < 2:
-            print("Migrating to version 2: Adding seller_economic_code and seller_logo_path to AppSettings...")
-            try:
-                self.execute_query("ALTER TABLE AppSettings ADD COLUMN seller_economic_code TEXT;")
-                self.execute_query("ALTER TABLE AppSettings ADD COLUMN seller_logo_path TEXT;")
-                print("Migration to version 2 successful.")
-                self.set_db_version(2)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 2: {e}")
-        
-        if current_db_version < 3:
-            print("Migrating to version 3: Removing invoice_number_format and last_invoice_number from AppSettings...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE AppSettings_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        seller_name TEXT,
-                        seller_address TEXT,
-                        seller_phone TEXT,
-                        seller_tax_id TEXT,
-                        seller_economic_code TEXT,
-                        seller_logo_path TEXT,
-                        db_version INTEGER DEFAULT 0
-                    );
-                """)
-                self.execute_query("""
-                    INSERT INTO AppSettings_temp (id, seller_name, seller_address, seller_phone, seller_tax_id, seller_economic_code, seller_logo_path, db_version)
-                    SELECT id, seller_name, seller_address, seller_phone, seller_tax_id, seller_economic_code, seller_logo_path, db_version
-                    FROM AppSettings;
-                """)
-                self.execute_query("DROP TABLE AppSettings;")
-                self.execute_query("ALTER TABLE AppSettings_temp RENAME TO AppSettings;")
-                print("Migration to version 3 successful.")
-                self.set_db_version(3)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 3 (AppSettings schema change): {e}")
+        with self.transaction():
+            self.execute("INSERT OR IGNORE INTO AppSettings (id) VALUES (?)", (1,))
+            self.execute("UPDATE AppSettings SET db_version = ? WHERE id = 1", (version,))
+            # نسخه در هدر فایل هم نگه داشته می‌شود تا شروع برنامه بدون خواندن AppSettings بررسی شود
+            self.execute(f"PRAGMA user_version = {int(version)}")
 
-        if current_db_version < 4:
-            print("Migrating to version 4: Modifying Services table schema (description and settlement_type)...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE Services_new (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        description TEXT NOT NULL UNIQUE,
-                        settlement_type TEXT NOT NULL
-                    );
-                """)
-                self.execute_query("""
-                    INSERT INTO Services_new (id, description, settlement_type)
-                    SELECT id, name, unit
-                    FROM Services;
-                """)
-                self.execute_query("DROP TABLE Services;")
-                self.execute_query("ALTER TABLE Services_new RENAME TO Services;")
-                print("Migration to version 4 successful.")
-                self.set_db_version(4)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 4 (Services schema change): {e}")
+    def get_schema_version(self):
+        """ نسخه شِما از PRAGMA user_version (هدر فایل دیتابیس). """
+        cursor = self.execute_query("PRAGMA user_version")
+        return cursor.fetchone()[0] if cursor else 0
 
-        if current_db_version < 5:
-            print("Migrating to version 5: Adding service_code and UNIQUE constraint to Services table...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE Services_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        service_code INTEGER UNIQUE,
-                        description TEXT NOT NULL,
-                        settlement_type TEXT NOT NULL,
-                        UNIQUE(description, settlement_type)
-                    );
-                """)
-                self.execute_query("""
-                    INSERT INTO Services_temp (id, description, settlement_type)
-                    SELECT id, description, settlement_type
-                    FROM Services;
-                """)
-                self.execute_query("DROP TABLE Services;")
-                self.execute_query("ALTER TABLE Services_temp RENAME TO Services;")
-                print("Migration to version 5 successful.")
-                self.set_db_version(5)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 5 (Services schema change): {e}")
-        
-        if current_db_version < 6:
-            print("Migrating to version 6: Removing settlement_type from Services table and setting UNIQUE on description...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE Services_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        service_code INTEGER UNIQUE,
-                        description TEXT NOT NULL UNIQUE
-                    );
-                """)
-                self.execute_query("""
-                    INSERT INTO Services_temp (id, service_code, description)
-                    SELECT id, service_code, description
-                    FROM Services;
-                """)
-                self.execute_query("DROP TABLE Services;")
-                self.execute_query("ALTER TABLE Services_temp RENAME TO Services;")
-                print("Migration to version 6 successful.")
-                self.set_db_version(6)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 6 (Services schema change): {e}")
+    def initialize_database(self):
+        """
+        آماده‌سازی شِمای دیتابیس هنگام شروع برنامه.
+        اگر user_version با DATABASE_SCHEMA_VERSION برابر باشد بلافاصله برمی‌گردد. دیتابیس تازه در
+        create_tables با یک تراکنش مستقیماً با آخرین شِما ساخته می‌شود و فقط دیتابیس‌های قدیمی
+        زنجیره مهاجرت را اجرا می‌کنند.
+        """
+        if self.get_schema_version() == DATABASE_SCHEMA_VERSION:
+            return True
+        if not self.create_tables():
+            return False
+        if self.get_schema_version() != DATABASE_SCHEMA_VERSION:
+            return self.migrate_database()
+        return True
 
-        if current_db_version < 7:
-            print("Migrating to version 7: Adding customer_code, customer_type, phone2, mobile, postal_code, notes to Customers table and setting UNIQUE on customer_code and tax_id...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE Customers_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        customer_code INTEGER UNIQUE,
-                        name TEXT NOT NULL,
-                        customer_type TEXT NOT NULL,
-                        company_name TEXT,
-                        address TEXT,
-                        phone TEXT,
-                        phone2 TEXT,
-                        mobile TEXT,
-                        email TEXT UNIQUE,
-                        tax_id TEXT UNIQUE,
-                        postal_code TEXT,
-                        notes TEXT,
-                        registration_date TEXT DEFAULT CURRENT_TIMESTAMP
-                    );
-                """)
-                self.execute_query("""
-                    INSERT INTO Customers_temp (id, name, company_name, address, phone, email, tax_id, registration_date)
-                    SELECT id, name, company_name, address, phone, email, tax_id, registration_date
-                    FROM Customers;
-                """)
-                self.execute_query("DROP TABLE Customers;")
-                self.execute_query("ALTER TABLE Customers_temp RENAME TO Customers;")
-                print("Migration to version 7 successful.")
-                self.set_db_version(7)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 7 (Customers schema change): {e}")
+    def migrate_database(self):
+        """
+        اجرای مراحل مهاجرت ثبت شده در db_migrations.MIGRATIONS از نسخه فعلی به بعد.
+        هر مرحله در تراکنش خودش اجرا می‌شود؛ اگر مرحله‌ای شکست بخورد، نسخه روی آخرین مرحله موفق
+        می‌ماند و اجرای بعدی از همان مرحله ادامه می‌دهد.
+        """
+        from db_migrations import run_migrations
 
-        # بلاک مهاجرت برای حذف company_name از Customers
-        if current_db_version < 8:
-            print("Migrating to version 8: Removing company_name from Customers table...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE Customers_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        customer_code INTEGER UNIQUE,
-                        name TEXT NOT NULL,
-                        customer_type TEXT NOT NULL,
-                        address TEXT,
-                        phone TEXT,
-                        phone2 TEXT,
-                        mobile TEXT,
-                        email TEXT UNIQUE,
-                        tax_id TEXT UNIQUE,
-                        postal_code TEXT,
-                        notes TEXT,
-                        registration_date TEXT DEFAULT CURRENT_TIMESTAMP
-                    );
-                """)
-                self.execute_query("""
-                    INSERT INTO Customers_temp (id, customer_code, name, customer_type, address, phone, phone2, mobile, email, tax_id, postal_code, notes, registration_date)
-                    SELECT id, customer_code, name, customer_type, address, phone, phone2, mobile, email, tax_id, postal_code, notes, registration_date
-                    FROM Customers;
-                """)
-                self.execute_query("DROP TABLE Customers;")
-                self.execute_query("ALTER TABLE Customers_temp RENAME TO Customers;")
-                print("Migration to version 8 successful.")
-                self.set_db_version(8)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 8 (Customers schema change): {e}")
+        current_db_version = self.get_db_version()
+        print(f"Current database version: {current_db_version}")
 
-        # بلاک مهاجرت برای جدول Contracts (حذف ستون‌های اضافی و اضافه کردن contract_date)
-        if current_db_version < 9:
-            print("Migrating to version 9: Adding new columns to Contracts table...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE Contracts_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        customer_id INTEGER NOT NULL,
-                        contract_number TEXT UNIQUE NOT NULL,
-                        start_date TEXT NOT NULL,
-                        end_date TEXT,
-                        total_amount REAL,
-                        description TEXT,
-                        title TEXT,
-                        services_provided TEXT,
-                        fiscal_year TEXT,
-                        scanned_pages TEXT,
-                        payment_method TEXT,
-                        FOREIGN KEY (customer_id) REFERENCES Customers(id)
-                    );
-                """)
-                self.execute_query("""
-                    INSERT INTO Contracts_temp (id, customer_id, contract_number, start_date, end_date, total_amount, description, title, services_provided, fiscal_year, scanned_pages, payment_method)
-                    SELECT id, customer_id, contract_number, start_date, end_date, total_amount, description, title, services_provided, fiscal_year, scanned_pages, payment_method
-                    FROM Contracts;
-                """)
-                self.execute_query("DROP TABLE Contracts;")
-                self.execute_query("ALTER TABLE Contracts_temp RENAME TO Contracts;")
-                print("Migration to version 9 successful.")
-                self.set_db_version(9)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 9 (Contracts schema change): {e}")
+        if current_db_version > DATABASE_SCHEMA_VERSION:
+            print("Warning: Database version is newer than application schema version. This might cause issues.")
+            return True
+        if current_db_version == DATABASE_SCHEMA_VERSION:
+            print("Database schema is up to date.")
+            if self.get_schema_version() != DATABASE_SCHEMA_VERSION:
+                # دیتابیس‌هایی که پیش از user_version مهاجرت کرده‌اند، یک بار علامت‌گذاری می‌شوند
+                self.set_db_version(DATABASE_SCHEMA_VERSION)
+            return True
 
-        # بلاک مهاجرت برای حذف ستون‌های اضافی از Contracts و اضافه کردن contract_date
-        if current_db_version < 10:
-            print("Migrating to version 10: Removing redundant columns from Contracts and adding contract_date...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE Contracts_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        customer_id INTEGER NOT NULL,
-                        contract_number TEXT UNIQUE NOT NULL,
-                        contract_date TEXT,
-                        total_amount REAL,
-                        description TEXT,
-                        scanned_pages TEXT,
-                        FOREIGN KEY (customer_id) REFERENCES Customers(id)
-                    );
-                """)
-                self.execute_query("""
-                    INSERT INTO Contracts_temp (id, customer_id, contract_number, total_amount, description, scanned_pages)
-                    SELECT id, customer_id, contract_number, total_amount, description, scanned_pages
-                    FROM Contracts;
-                """)
-                self.execute_query("DROP TABLE Contracts;")
-                self.execute_query("ALTER TABLE Contracts_temp RENAME TO Contracts;")
-                print("Migration to version 10 successful.")
-                self.set_db_version(10)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 10 (Contracts schema change): {e}")
-        
-        # بلاک مهاجرت جدید برای حذف start_date, end_date, services_provided و حفظ title, payment_method
-        if current_db_version < 11:
-            print("Migrating to version 11: Removing start_date, end_date, services_provided from Contracts, keeping title and payment_method...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE Contracts_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        customer_id INTEGER NOT NULL,
-                        contract_number TEXT UNIQUE NOT NULL,
-                        contract_date TEXT,
-                        total_amount REAL,
-                        description TEXT,
-                        title TEXT,               -- عنوان قرارداد (باقی ماند)
-                        payment_method TEXT,      -- نحوه پرداخت (باقی ماند)
-                        scanned_pages TEXT,
-                        FOREIGN KEY (customer_id) REFERENCES Customers(id)
-                    );
-                """)
-                # کپی کردن داده‌های موجود به جز فیلدهای حذف شده
-                self.execute_query("""
-                    INSERT INTO Contracts_temp (id, customer_id, contract_number, contract_date, total_amount, description, title, payment_method, scanned_pages)
-                    SELECT id, customer_id, contract_number, contract_date, total_amount, description, title, payment_method, scanned_pages
-                    FROM Contracts;
-                """)
-                self.execute_query("DROP TABLE Contracts;")
-                self.execute_query("ALTER TABLE Contracts_temp RENAME TO Contracts;")
-                print("Migration to version 11 successful.")
-                self.set_db_version(11)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 11 (Contracts schema change): {e}")
+        print(f"Performing database migration from {current_db_version} to {DATABASE_SCHEMA_VERSION}...")
+        reached_version = run_migrations(self, current_db_version)
+        if reached_version != DATABASE_SCHEMA_VERSION:
+            print(f"Database migration stopped at version {reached_version}.")
+            return False
+        print(f"Database migrated to version {DATABASE_SCHEMA_VERSION}.")
+        return True
 
-        # بلاک مهاجرت جدید برای جداول Invoices و InvoiceItems
-        if current_db_version < 12:
-            print("Migrating to version 12: Adding Invoices and InvoiceItems tables...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE IF NOT EXISTS Invoices (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        invoice_number TEXT NOT NULL UNIQUE,
-                        customer_id INTEGER NOT NULL,
-                        contract_id INTEGER,
-                        issue_date TEXT NOT NULL,
-                        due_date TEXT,
-                        total_amount REAL NOT NULL,
-                        discount_percentage REAL DEFAULT 0,
-                        tax_percentage REAL DEFAULT 0,
-                        final_amount REAL NOT NULL,
-                        description TEXT,
-                        FOREIGN KEY (customer_id) REFERENCES Customers(id),
-                        FOREIGN KEY (contract_id) REFERENCES Contracts(id)
-                    );
-                """)
-                self.execute_query("""
-                    CREATE TABLE IF NOT EXISTS InvoiceItems (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        invoice_id INTEGER NOT NULL,
-                        service_id INTEGER NOT NULL,
-                        quantity REAL NOT NULL,
-                        unit_price REAL NOT NULL,
-                        total_price REAL NOT NULL,
-                        FOREIGN KEY (invoice_id) REFERENCES Invoices(id) ON DELETE CASCADE,
-                        FOREIGN KEY (service_id) REFERENCES Services(id)
-                    );
-                """)
-                print("Migration to version 12 successful: Invoices and InvoiceItems tables created.")
-                self.set_db_version(12)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 12 (Invoices/InvoiceItems tables): {e}")
+    def check_query_plans(self):
+        """
+        بررسی رگرسیون با EXPLAIN QUERY PLAN: کوئری‌هایی که ایندکس مورد انتظارشان را استفاده نمی‌کنند
+        به صورت لیست (کوئری، پلن) برگردانده می‌شوند. لیست خالی یعنی همه پلن‌ها درست هستند.
+        """
+        failures = []
+        for query, params, expected_index in EXPECTED_QUERY_PLANS:
+            cursor = self.execute_query(f"EXPLAIN QUERY PLAN {query}", params)
+            plan = " | ".join(row['detail'] for row in cursor.fetchall()) if cursor else ""
+            if expected_index not in plan:
+                failures.append((" ".join(query.split()), plan))
+        return failures
 
-        # بلاک مهاجرت جدید برای جدول InvoiceTemplates
-        if current_db_version < 13:
-            print("Migrating to version 13: Adding InvoiceTemplates table...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE IF NOT EXISTS InvoiceTemplates (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        template_name TEXT UNIQUE NOT NULL,
-                        template_type TEXT NOT NULL,
-                        required_fields TEXT,       -- JSON array of required field names
-                        default_settings TEXT,      -- JSON object of default values/rules
-                        is_active INTEGER DEFAULT 1, -- 1 for active, 0 for inactive
-                        notes TEXT                  -- notes فیلد قبلی (حذف خواهد شد در 14)
-                    );
-                """)
-                print("Migration to version 13 successful: InvoiceTemplates table created.")
-                self.set_db_version(13)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 13 (InvoiceTemplates table): {e}")
+def main(argv=None):
+    """
+    بررسی رگرسیون پلن کوئری‌ها روی یک دیتابیس موقت با آخرین شِما (دیتابیس برنامه دست نمی‌خورد).
+    اگر کوئری‌ای از EXPECTED_QUERY_PLANS ایندکس مورد انتظارش را استفاده نکند، با کد خروج 1 شکست می‌خورد.
 
-        # بلاک مهاجرت جدید برای اضافه کردن فیلدهای عکس به InvoiceTemplates و حذف notes
-        if current_db_version < 14:
-            print("Migrating to version 14: Adding image paths and opacity to InvoiceTemplates, removing notes...")
-            try:
-                self.execute_query("""
-                    CREATE TABLE InvoiceTemplates_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        template_name TEXT UNIQUE NOT NULL,
-                        template_type TEXT NOT NULL,
-                        required_fields TEXT,
-                        default_settings TEXT,
-                        is_active INTEGER DEFAULT 1,
-                        header_image_path TEXT,
-                        footer_image_path TEXT,
-                        background_image_path TEXT,
-                        background_opacity REAL
-                    );
-                """)
-                self.execute_query("""
-                    INSERT INTO InvoiceTemplates_temp (id, template_name, template_type, required_fields, default_settings, is_active, header_image_path, footer_image_path, background_image_path, background_opacity)
-                    SELECT id, template_name, template_type, required_fields, default_settings, is_active, '', '', '', 1.0
-                    FROM InvoiceTemplates;
-                """) # با مقادیر پیش فرض برای مسیرهای عکس و شفافیت
-                self.execute_query("DROP TABLE InvoiceTemplates;")
-                self.execute_query("ALTER TABLE InvoiceTemplates_temp RENAME TO InvoiceTemplates;")
-                print("Migration to version 14 successful.")
-                self.set_db_version(14)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 14 (InvoiceTemplates schema change for images): {e}")
-        
-        # بلاک مهاجرت جدید برای تغییر نام default_settings به template_settings
-        if current_db_version < 15:
-            print("Migrating to version 15: Renaming 'default_settings' to 'template_settings' in InvoiceTemplates table...")
-            try:
-                # مرحله 1: ایجاد جدول موقت با شمای جدید
-                self.execute_query("""
-                    CREATE TABLE InvoiceTemplates_temp (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        template_name TEXT UNIQUE NOT NULL,
-                        template_type TEXT NOT NULL,
-                        required_fields TEXT,
-                        template_settings TEXT, -- فیلد جدید
-                        is_active INTEGER DEFAULT 1,
-                        header_image_path TEXT,
-                        footer_image_path TEXT,
-                        background_image_path TEXT,
-                        background_opacity REAL
-                    );
-                """)
-                # مرحله 2: کپی داده‌ها از جدول قدیمی به جدول موقت
-                # توجه: اگر default_settings قبلاً NULL یا خالی بوده، اینجا به صورت '{}' کپی می‌شود.
-                self.execute_query("""
-                    INSERT INTO InvoiceTemplates_temp (
-                        id, template_name, template_type, required_fields, 
-                        template_settings, is_active, header_image_path, 
-                        footer_image_path, background_image_path, background_opacity
-                    )
-                    SELECT 
-                        id, template_name, template_type, required_fields, 
-                        COALESCE(default_settings, '{}'), -- اگر default_settings خالی بود، '{}' را بگذار
-                        is_active, header_image_path, 
-                        footer_image_path, background_image_path, background_opacity
-                    FROM InvoiceTemplates;
-                """)
-                # مرحله 3: حذف جدول قدیمی
-                self.execute_query("DROP TABLE InvoiceTemplates;")
-                # مرحله 4: تغییر نام جدول موقت به نام اصلی
-                self.execute_query("ALTER TABLE InvoiceTemplates_temp RENAME TO InvoiceTemplates;")
-                
-                print("Migration to version 15 successful.")
-                self.set_db_version(15)
-            except sqlite3.Error as e:
-                print(f"Error migrating to version 15 (InvoiceTemplates schema change for template_settings): {e}")
+    مثال:
+        python db_manager.py
+    """
+    import tempfile
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        db = DBManager.at_path(os.path.join(scratch_dir, DATABASE_NAME))
+        try:
+            if not db.connect() or not db.create_tables():
+                print("FAIL: could not create the scratch database")
+                return 1
+            plan_failures = db.check_query_plans()
+        finally:
+            db.close_all() # فایل‌های دیتابیس موقت باید قبل از حذف پوشه بسته شوند
 
+    for query, plan in plan_failures:
+        print(f"FAIL: query plan regression: {query}\n    plan: {plan}")
+    if not plan_failures:
+        print(f"OK: all {len(EXPECTED_QUERY_PLANS)} query plans use their expected indexes")
+    return 1 if plan_failures else 0
 
-        if current_db_version < DATABASE_SCHEMA_VERSION:
-            print(f"Performing database migration from {current_db_version} to {DATABASE_SCHEMA_VERSION}...")
-            self.set_db_version(DATABASE_SCHEMA_VERSION)
-            print(f"Database migrated to version {DATABASE_SCHEMA_VERSION}.")
-        elif current_db_version > DATABASE_SCHEMA_VERSION:
-            print("Warning: Database version is newer than application schema version. This might cause issues.")
-        else:
-            print("Database schema is up to date.")
 
 if __name__ == "__main__":
-    base_path_for_test = os.path.dirname(os.path.abspath(__file__))
-    db_file_path_for_test = os.path.join(base_path_for_test, DATABASE_NAME)
-    db_manager_test = DBManager(db_file_path_for_test)
-
-    if db_manager_test.connect():
-        db_manager_test.create_tables()
-        db_manager_test.migrate_database()
-        db_manager_test.close()
-    else:
-        print("Could not connect to database for test. Exiting.")
\ No newline at end of file
+    sys.exit(main())
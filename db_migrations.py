@@ -0,0 +1,436 @@
+# db_migrations.py
+import time
+
+from db_manager import INDEX_QUERIES, CUSTOMER_FTS_QUERIES, CONTRACT_FTS_QUERIES, FTS_DROP_QUERIES
+
+COPY_CHUNK_SIZE = 5000 # تعداد سطرهای کپی شده در هر مرحله بازسازی جدول
+
+
+class MigrationStep:
+    """ یک مرحله مهاجرت: نسخه مقصد، توضیح و تابعی که روی DBManager (داخل تراکنش) اجرا می‌شود """
+    def __init__(self, version, description, apply):
+        self.version = version
+        self.description = description
+        self.apply = apply # apply(db) -> True اگر اعمال شد، False اگر روی این دیتابیس کاربرد نداشت
+
+
+def table_columns(db, table):
+    """ نام ستون‌های فعلی یک جدول (لیست خالی اگر جدول وجود نداشته باشد) """
+    return [row['name'] for row in db.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def add_columns(db, table, column_defs):
+    """ اضافه کردن ستون‌هایی که هنوز وجود ندارند. column_defs: [(نام، نوع)] """
+    existing = table_columns(db, table)
+    missing = [(name, col_type) for name, col_type in column_defs if name not in existing]
+    for name, col_type in missing:
+        db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type};")
+    return bool(missing)
+
+
+def rebuild_table(db, table, create_sql, column_map, requires=()):
+    """
+    بازسازی یک جدول با شِمای جدید (جدول موقت، کپی، حذف و تغییر نام) داخل تراکنش جاری.
+    column_map: [(ستون مقصد، عبارت SELECT)]؛ عبارتی که ستون ساده است و در جدول فعلی نیست NULL کپی می‌شود.
+    requires: ستون‌هایی که باید در جدول فعلی باشند تا این مرحله کاربرد داشته باشد.
+    کپی به صورت تکه‌تکه (بر اساس rowid) انجام و در پایان تعداد سطرها و سلامت جدول بررسی می‌شود.
+    """
+    current_columns = table_columns(db, table)
+    target_columns = [target for target, _ in column_map]
+    if not current_columns or sorted(current_columns) == sorted(target_columns):
+        return False # جدول وجود ندارد یا از قبل در شِمای مقصد است
+    if any(column not in current_columns for column in requires):
+        return False
+
+    temp_table = f"{table}_temp"
+    db.execute(f"DROP TABLE IF EXISTS {temp_table};") # باقیمانده احتمالی اجرای نیمه‌کاره نسخه‌های قدیمی
+    db.execute(create_sql.format(table=temp_table))
+
+    select_exprs = []
+    for _, expr in column_map:
+        if expr.isidentifier() and expr not in current_columns:
+            expr = "NULL"
+        select_exprs.append(expr)
+
+    insert_sql = (
+        f"INSERT INTO {temp_table} ({', '.join(target_columns)}) "
+        f"SELECT {', '.join(select_exprs)} FROM {table} WHERE rowid > ? ORDER BY rowid LIMIT ?"
+    )
+    last_rowid = -1
+    while True:
+        cursor = db.execute(insert_sql, (last_rowid, COPY_CHUNK_SIZE))
+        if cursor.rowcount < COPY_CHUNK_SIZE:
+            break
+        last_rowid = db.execute(f"SELECT MAX(rowid) FROM {temp_table}").fetchone()[0]
+
+    source_count = db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    copied_count = db.execute(f"SELECT COUNT(*) FROM {temp_table}").fetchone()[0]
+    if source_count != copied_count:
+        raise RuntimeError(f"Row count mismatch while rebuilding {table}: {source_count} != {copied_count}")
+    check = db.execute(f"PRAGMA quick_check({temp_table})").fetchone()[0]
+    if check != "ok":
+        raise RuntimeError(f"Integrity check failed for {temp_table}: {check}")
+
+    db.execute(f"DROP TABLE {table};")
+    db.execute(f"ALTER TABLE {temp_table} RENAME TO {table};")
+    return True
+
+
+def _same(*columns):
+    return [(column, column) for column in columns]
+
+
+# --- مراحل مهاجرت ---
+
+def _migrate_v2(db):
+    return add_columns(db, "AppSettings", [("seller_economic_code", "TEXT"), ("seller_logo_path", "TEXT")])
+
+
+def _migrate_v3(db):
+    return rebuild_table(db, "AppSettings", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            seller_name TEXT,
+            seller_address TEXT,
+            seller_phone TEXT,
+            seller_tax_id TEXT,
+            seller_economic_code TEXT,
+            seller_logo_path TEXT,
+            db_version INTEGER DEFAULT 0
+        );
+    """, _same("id", "seller_name", "seller_address", "seller_phone", "seller_tax_id",
+               "seller_economic_code", "seller_logo_path", "db_version"))
+
+
+def _migrate_v4(db):
+    return rebuild_table(db, "Services", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            description TEXT NOT NULL UNIQUE,
+            settlement_type TEXT NOT NULL
+        );
+    """, [("id", "id"), ("description", "name"), ("settlement_type", "unit")], requires=("name", "unit"))
+
+
+def _migrate_v5(db):
+    return rebuild_table(db, "Services", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            service_code INTEGER UNIQUE,
+            description TEXT NOT NULL,
+            settlement_type TEXT NOT NULL,
+            UNIQUE(description, settlement_type)
+        );
+    """, _same("id", "service_code", "description", "settlement_type"), requires=("settlement_type",))
+
+
+def _migrate_v6(db):
+    return rebuild_table(db, "Services", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            service_code INTEGER UNIQUE,
+            description TEXT NOT NULL UNIQUE
+        );
+    """, _same("id", "service_code", "description"))
+
+
+def _migrate_v7(db):
+    # customer_type در شِمای قدیمی وجود نداشت ولی NOT NULL است
+    customer_type = "COALESCE(customer_type, '')" if "customer_type" in table_columns(db, "Customers") else "''"
+    return rebuild_table(db, "Customers", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_code INTEGER UNIQUE,
+            name TEXT NOT NULL,
+            customer_type TEXT NOT NULL,
+            company_name TEXT,
+            address TEXT,
+            phone TEXT,
+            phone2 TEXT,
+            mobile TEXT,
+            email TEXT UNIQUE,
+            tax_id TEXT UNIQUE,
+            postal_code TEXT,
+            notes TEXT,
+            registration_date TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+    """, _same("id", "customer_code", "name") + [("customer_type", customer_type)]
+       + _same("company_name", "address", "phone", "phone2", "mobile", "email", "tax_id",
+               "postal_code", "notes", "registration_date"),
+       requires=("company_name",))
+
+
+def _migrate_v8(db):
+    return rebuild_table(db, "Customers", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_code INTEGER UNIQUE,
+            name TEXT NOT NULL,
+            customer_type TEXT NOT NULL,
+            address TEXT,
+            phone TEXT,
+            phone2 TEXT,
+            mobile TEXT,
+            email TEXT UNIQUE,
+            tax_id TEXT UNIQUE,
+            postal_code TEXT,
+            notes TEXT,
+            registration_date TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+    """, _same("id", "customer_code", "name", "customer_type", "address", "phone", "phone2", "mobile",
+               "email", "tax_id", "postal_code", "notes", "registration_date"))
+
+
+def _migrate_v9(db):
+    return rebuild_table(db, "Contracts", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            contract_number TEXT UNIQUE NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            total_amount REAL,
+            description TEXT,
+            title TEXT,
+            services_provided TEXT,
+            fiscal_year TEXT,
+            scanned_pages TEXT,
+            payment_method TEXT,
+            FOREIGN KEY (customer_id) REFERENCES Customers(id)
+        );
+    """, _same("id", "customer_id", "contract_number", "start_date", "end_date", "total_amount", "description",
+               "title", "services_provided", "fiscal_year", "scanned_pages", "payment_method"),
+       requires=("start_date",))
+
+
+def _migrate_v10(db):
+    # فقط جدول‌هایی که هنوز ستون‌های قدیمی (start_date) را دارند؛ شِمای جدیدتر نباید title را از دست بدهد
+    return rebuild_table(db, "Contracts", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            contract_number TEXT UNIQUE NOT NULL,
+            contract_date TEXT,
+            total_amount REAL,
+            description TEXT,
+            scanned_pages TEXT,
+            FOREIGN KEY (customer_id) REFERENCES Customers(id)
+        );
+    """, _same("id", "customer_id", "contract_number", "contract_date", "total_amount", "description",
+               "scanned_pages"),
+       requires=("start_date",))
+
+
+def _migrate_v11(db):
+    return rebuild_table(db, "Contracts", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            contract_number TEXT UNIQUE NOT NULL,
+            contract_date TEXT,
+            total_amount REAL,
+            description TEXT,
+            title TEXT,               -- عنوان قرارداد (باقی ماند)
+            payment_method TEXT,      -- نحوه پرداخت (باقی ماند)
+            scanned_pages TEXT,
+            FOREIGN KEY (customer_id) REFERENCES Customers(id)
+        );
+    """, _same("id", "customer_id", "contract_number", "contract_date", "total_amount", "description",
+               "title", "payment_method", "scanned_pages"))
+
+
+def _migrate_v12(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS Invoices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_number TEXT NOT NULL UNIQUE,
+            customer_id INTEGER NOT NULL,
+            contract_id INTEGER,
+            issue_date TEXT NOT NULL,
+            due_date TEXT,
+            total_amount REAL NOT NULL,
+            discount_percentage REAL DEFAULT 0,
+            tax_percentage REAL DEFAULT 0,
+            final_amount REAL NOT NULL,
+            description TEXT,
+            FOREIGN KEY (customer_id) REFERENCES Customers(id),
+            FOREIGN KEY (contract_id) REFERENCES Contracts(id)
+        );
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS InvoiceItems (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_id INTEGER NOT NULL,
+            service_id INTEGER NOT NULL,
+            quantity REAL NOT NULL,
+            unit_price REAL NOT NULL,
+            total_price REAL NOT NULL,
+            FOREIGN KEY (invoice_id) REFERENCES Invoices(id) ON DELETE CASCADE,
+            FOREIGN KEY (service_id) REFERENCES Services(id)
+        );
+    """)
+    return True
+
+
+def _migrate_v13(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS InvoiceTemplates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            template_name TEXT UNIQUE NOT NULL,
+            template_type TEXT NOT NULL,
+            required_fields TEXT,       -- JSON array of required field names
+            default_settings TEXT,      -- JSON object of default values/rules
+            is_active INTEGER DEFAULT 1, -- 1 for active, 0 for inactive
+            notes TEXT                  -- notes فیلد قبلی (حذف خواهد شد در 14)
+        );
+    """)
+    return True
+
+
+def _migrate_v14(db):
+    return rebuild_table(db, "InvoiceTemplates", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            template_name TEXT UNIQUE NOT NULL,
+            template_type TEXT NOT NULL,
+            required_fields TEXT,
+            default_settings TEXT,
+            is_active INTEGER DEFAULT 1,
+            header_image_path TEXT,
+            footer_image_path TEXT,
+            background_image_path TEXT,
+            background_opacity REAL
+        );
+    """, _same("id", "template_name", "template_type", "required_fields", "default_settings", "is_active")
+       + [("header_image_path", "''"), ("footer_image_path", "''"), ("background_image_path", "''"),
+          ("background_opacity", "1.0")], # با مقادیر پیش فرض برای مسیرهای عکس و شفافیت
+       requires=("default_settings",))
+
+
+def _migrate_v15(db):
+    return rebuild_table(db, "InvoiceTemplates", """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            template_name TEXT UNIQUE NOT NULL,
+            template_type TEXT NOT NULL,
+            required_fields TEXT,
+            template_settings TEXT, -- فیلد جدید
+            is_active INTEGER DEFAULT 1,
+            header_image_path TEXT,
+            footer_image_path TEXT,
+            background_image_path TEXT,
+            background_opacity REAL
+        );
+    """, _same("id", "template_name", "template_type", "required_fields")
+       + [("template_settings", "COALESCE(default_settings, '{}')")] # اگر default_settings خالی بود، '{}' را بگذار
+       + _same("is_active", "header_image_path", "footer_image_path", "background_image_path", "background_opacity"),
+       requires=("default_settings",))
+
+
+def _migrate_v16(db):
+    for query in INDEX_QUERIES:
+        db.execute(query)
+    # به‌روزرسانی آمار جداول برای انتخاب درست ایندکس‌ها توسط planner
+    db.execute("ANALYZE;")
+    return True
+
+
+def _migrate_v17(db):
+    if not db.has_fts5():
+        return False # بدون FTS5، CustomerManager.search با LIKE روی جدول کار می‌کند
+    for query in CUSTOMER_FTS_QUERIES:
+        db.execute(query)
+    db.refresh_customer_search_index() # پر کردن ایندکس از روی داده‌های موجود
+    return True
+
+
+def _migrate_v18(db):
+    if not db.has_fts5():
+        return False # بدون FTS5، ContractManager.search با LIKE روی جدول کار می‌کند
+    for query in CONTRACT_FTS_QUERIES:
+        db.execute(query)
+    db.refresh_contract_search_index()
+    return True
+
+
+def _migrate_v19(db):
+    if not db.has_fts5():
+        return False
+    # ساخت دوباره هر دو ایندکس متنی با متن نرمال شده (ی/ک عربی، ارقام فارسی، نیم‌فاصله) و ستون‌های جستجوی
+    # اضافه. تریگرها متن خام را کپی می‌کنند و متن نرمال شده از پایتون نوشته می‌شود، تا نوشتن در
+    # Customers/Contracts از هر کلاینت SQLite (مثلاً sqlite3) بدون تابع مخصوص برنامه کار کند
+    for query in FTS_DROP_QUERIES + CUSTOMER_FTS_QUERIES + CONTRACT_FTS_QUERIES:
+        db.execute(query)
+    db.refresh_customer_search_index()
+    db.refresh_contract_search_index()
+    return True
+
+
+def _migrate_v20(db):
+    # ایندکس‌های مرتب‌سازی لیست‌های مجازی (بقیه INDEX_QUERIES از نسخه 16 وجود دارند)
+    for query in INDEX_QUERIES:
+        db.execute(query)
+    db.execute("ANALYZE;")
+    return True
+
+
+MIGRATIONS = [
+    MigrationStep(2, "Adding seller_economic_code and seller_logo_path to AppSettings", _migrate_v2),
+    MigrationStep(3, "Removing invoice_number_format and last_invoice_number from AppSettings", _migrate_v3),
+    MigrationStep(4, "Modifying Services table schema (description and settlement_type)", _migrate_v4),
+    MigrationStep(5, "Adding service_code and UNIQUE constraint to Services table", _migrate_v5),
+    MigrationStep(6, "Removing settlement_type from Services table and setting UNIQUE on description", _migrate_v6),
+    MigrationStep(7, "Adding customer_code, customer_type, phone2, mobile, postal_code, notes to Customers table", _migrate_v7),
+    MigrationStep(8, "Removing company_name from Customers table", _migrate_v8),
+    MigrationStep(9, "Adding new columns to Contracts table", _migrate_v9),
+    MigrationStep(10, "Removing redundant columns from Contracts and adding contract_date", _migrate_v10),
+    MigrationStep(11, "Removing start_date, end_date, services_provided from Contracts, keeping title and payment_method", _migrate_v11),
+    MigrationStep(12, "Adding Invoices and InvoiceItems tables", _migrate_v12),
+    MigrationStep(13, "Adding InvoiceTemplates table", _migrate_v13),
+    MigrationStep(14, "Adding image paths and opacity to InvoiceTemplates, removing notes", _migrate_v14),
+    MigrationStep(15, "Renaming 'default_settings' to 'template_settings' in InvoiceTemplates table", _migrate_v15),
+    MigrationStep(16, "Adding indexes for foreign keys and list sort columns", _migrate_v16),
+    MigrationStep(17, "Adding CustomersFTS full-text index for customer search", _migrate_v17),
+    MigrationStep(18, "Adding ContractsFTS full-text index for contract search", _migrate_v18),
+    MigrationStep(19, "Rebuilding full-text indexes on Persian-normalised text", _migrate_v19),
+    MigrationStep(20, "Adding sort indexes for virtual list columns", _migrate_v20),
+]
+
+
+def run_migrations(db, current_version):
+    """
+    اجرای مراحل بعد از current_version به ترتیب. هر مرحله و افزایش نسخه‌اش در یک تراکنش هستند،
+    پس با خطا یا قطع برنامه فقط همان مرحله برگشت می‌خورد و اجرای بعدی از همان‌جا ادامه می‌یابد.
+    مدت هر مرحله در جدول SchemaMigrations ثبت می‌شود. نسخه نهایی (آخرین مرحله موفق) برگردانده می‌شود.
+    """
+    db.execute_query("""
+        CREATE TABLE IF NOT EXISTS SchemaMigrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            status TEXT,               -- applied یا skipped (روی این دیتابیس کاربرد نداشت)
+            duration_ms REAL,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    version = current_version
+    for step in MIGRATIONS:
+        if step.version <= version:
+            continue
+        print(f"Migrating to version {step.version}: {step.description}...")
+        started = time.perf_counter()
+        try:
+            with db.transaction():
+                applied = step.apply(db)
+                duration_ms = (time.perf_counter() - started) * 1000
+                db.execute(
+                    "INSERT OR REPLACE INTO SchemaMigrations (version, description, status, duration_ms) VALUES (?, ?, ?, ?)",
+                    (step.version, step.description, "applied" if applied else "skipped", duration_ms)
+                )
+                db.set_db_version(step.version)
+        except Exception as e:
+            print(f"Error migrating to version {step.version}: {e}. Migration will resume from this step on next start.")
+            return version
+        version = step.version
+        status = "successful" if applied else "skipped (not applicable to this database)"
+        print(f"Migration to version {step.version} {status} in {duration_ms:.1f} ms.")
+    return version
@@ -0,0 +1,101 @@
+# font_metrics.py
+import threading
+from collections import OrderedDict
+
+import fitz  # PyMuPDF
+
+
+class FontMetrics:
+    """
+    فونت‌ها و اندازه‌گیری عرض متن برای تولید PDF (مشترک در کل پروسه).
+    هر فونت TTF فقط یک بار به صورت fitz.Font بارگذاری می‌شود. عرض متن به ازای (فونت، متن) و برای اندازه 1
+    کش می‌شود (عرض با اندازه فونت خطی است، پس همه اندازه‌ها از یک ورودی استفاده می‌کنند). رشته‌های عددی
+    (مبالغ، تاریخ‌ها، شماره ردیف) با جدول عرض کاراکترها جمع زده می‌شوند و اصلاً به MuPDF نمی‌رسند.
+    """
+    # کاراکترهایی که برایشان جدول عرض ساخته می‌شود (ارقام لاتین و فارسی و جداکننده‌های مبلغ و تاریخ)
+    NUMERIC_CHARS = "0123456789۰۱۲۳۴۵۶۷۸۹,.-+/%:٬٫ "
+    MAX_CACHED_TEXTS = 20000
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fonts = {} # fontname -> fitz.Font (فقط فونت‌های TTF ثبت شده)
+        self._fontfiles = {} # fontname -> مسیر فایل TTF (فونت‌های داخلی PDF مثل helv فایل ندارند)
+        self._numeric_widths = {} # fontname -> {کاراکتر: عرض در اندازه 1}
+        self._widths = OrderedDict() # (fontname, text) -> عرض در اندازه 1
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def shared(cls):
+        """ نمونه مشترک در کل پروسه """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def register_font(self, fontname, fontfile):
+        """ بارگذاری یک فایل TTF با نام fontname (فقط بار اول)؛ خروجی: آیا فونت قابل استفاده است """
+        with self._lock:
+            if fontname in self._fonts:
+                return True
+            try:
+                font = fitz.Font(fontfile=fontfile)
+            except Exception as e:
+                print(f"Error loading font {fontname} from {fontfile}: {e}")
+                return False
+            self._fonts[fontname] = font
+            self._fontfiles[fontname] = fontfile
+            return True
+
+    def fontfile(self, fontname):
+        """ مسیر فایل فونت ثبت شده (برای page.insert_text)؛ None برای فونت‌های داخلی """
+        return self._fontfiles.get(fontname)
+
+    def _unit_length(self, text, fontname):
+        """
+        عرض متن در اندازه 1. فونت‌های TTF ثبت شده با fitz.Font اندازه‌گیری می‌شوند؛ فونت‌های داخلی PDF
+        (helv، tiro، ...) با fitz.get_text_length، که مثل insert_text متن را با WinAnsi کدگذاری می‌کند
+        (کاراکترهای خارج از WinAnsi به صورت · رسم می‌شوند و fitz.Font برایشان عرض گلیف دیگری می‌دهد).
+        get_text_length کاراکتر به کاراکتر صدا زده می‌شود: روی کل رشته، بعد از هر کاراکتر چند بایتی
+        (مثل حروف فارسی) به اندازه طول UTF-8 آن جلو می‌رود و کاراکترهای بعدی را نمی‌شمارد.
+        """
+        font = self._fonts.get(fontname)
+        if font is None:
+            return sum(fitz.get_text_length(char, fontname=fontname, fontsize=1) for char in text)
+        return font.text_length(text, fontsize=1)
+
+    def _numeric_table(self, fontname):
+        table = self._numeric_widths.get(fontname)
+        if table is None:
+            table = {char: self._unit_length(char, fontname) for char in self.NUMERIC_CHARS}
+            self._numeric_widths[fontname] = table
+        return table
+
+    def text_length(self, text, fontname, fontsize):
+        """ عرض متن با فونت و اندازه داده شده (همان عرضی که insert_text با این فونت رسم می‌کند) """
+        table = self._numeric_table(fontname)
+        try:
+            return sum(table[char] for char in text) * fontsize
+        except KeyError:
+            pass # متن غیر عددی
+        key = (fontname, text)
+        with self._lock:
+            width = self._widths.get(key)
+            if width is not None:
+                self._widths.move_to_end(key)
+                self.hits += 1
+                return width * fontsize
+            self.misses += 1
+        width = self._unit_length(text, fontname)
+        with self._lock:
+            self._widths[key] = width
+            while len(self._widths) > self.MAX_CACHED_TEXTS:
+                self._widths.popitem(last=False)
+        return width * fontsize
+
+    def stats(self):
+        with self._lock:
+            return {"fonts": sorted(self._fonts), "cached_texts": len(self._widths), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,73 @@
+# image_asset_cache.py
+import os
+import threading
+from collections import OrderedDict
+
+
+class ImageAssetCache:
+    """
+    کش مشترک تصاویر آماده شده قالب‌ها (سربرگ، پاورقی و پس‌زمینه) برای تولید PDF.
+    کلید هر ورودی (مسیر، زمان تغییر فایل، variant) است؛ variant نوع آماده‌سازی را مشخص می‌کند (مثلاً
+    اندازه مقصد و شفافیت پس‌زمینه). پس تصویر هر قالب در هر پروسه فقط یک بار باز، تغییر اندازه و تبدیل
+    می‌شود و با عوض شدن فایل روی دیسک، نسخه جدید خوانده می‌شود. ورودی‌ها با LRU و تا سقف حجم
+    budget_bytes نگه داشته می‌شوند.
+    """
+    DEFAULT_BUDGET_BYTES = 64 * 1024 * 1024
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (value, nbytes)
+        self._bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def shared(cls):
+        """ نمونه مشترک کش در کل پروسه """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def get(self, path, variant, loader):
+        """
+        مقدار آماده شده یک تصویر؛ در صورت نبودن در کش loader(path) فراخوانی می‌شود که باید
+        (value, nbytes) برگرداند. خطای loader (و نبودن فایل) به فراخواننده می‌رسد.
+        """
+        key = (os.path.abspath(path), os.stat(path).st_mtime_ns, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        # آماده‌سازی بیرون از قفل انجام می‌شود تا نخ‌های دیگر منتظر decode نمانند
+        value, nbytes = loader(path)
+        with self._lock:
+            if nbytes > self.budget_bytes:
+                return value # بزرگ‌تر از کل بودجه: کش نمی‌شود
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes_used -= previous[1]
+            self._entries[key] = (value, nbytes)
+            self._bytes_used += nbytes
+            while self._bytes_used > self.budget_bytes:
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._bytes_used -= evicted_bytes
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes_used = 0
+
+    def stats(self):
+        """ آمار کش: تعداد ورودی‌ها، حجم، بودجه و تعداد hit/miss """
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes_used, "budget_bytes": self.budget_bytes,
+                    "hits": self.hits, "misses": self.misses}
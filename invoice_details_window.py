@@ -4,17 +4,15 @@ from tkinter import messagebox, filedialog, ttk
 import os
 import json # برای serializing/deserializing لیست scanned_pages
 import jdatetime
-from PIL import Image, ImageTk 
-import fitz # (PyMuPDF) برای کار با PDF
 import subprocess # برای باز کردن فایل‌ها
 
 from db_manager import DBManager # فقط برای تست مستقل لازم است
 from customer_manager import CustomerManager # برای خواندن اطلاعات مشتری
 from service_manager import ServiceManager # برای خواندن اطلاعات سرویس
+from service_catalog import ServiceCatalog # کش مشترک خدمات
 from settings_manager import SettingsManager # برای خواندن تنظیمات فروشنده
 from contract_manager import ContractManager # برای خواندن اطلاعات قرارداد
 from models import Invoice, InvoiceItem, Customer, Service, Contract, InvoiceTemplate # InvoiceTemplate اضافه شد
-from invoice_generator import InvoiceGenerator
 from invoice_manager import InvoiceManager # اضافه شده: برای ذخیره در دیتابیس
 
 class InvoiceDetailsWindow(ctk.CTkToplevel):
@@ -32,6 +30,8 @@ class InvoiceDetailsWindow(ctk.CTkToplevel):
         self.service_manager = ServiceManager()
         self.settings_manager = SettingsManager()
         self.contract_manager = ContractManager()
+        # PyMuPDF و reportlab (از طریق invoice_generator) تا باز شدن این پنجره بارگذاری نمی‌شوند
+        from invoice_generator import InvoiceGenerator
         self.invoice_generator = InvoiceGenerator(self.settings_manager)
         self.invoice_manager = InvoiceManager() # اضافه شده: برای ذخیره در دیتابیس
 
@@ -241,7 +241,7 @@ class InvoiceDetailsWindow(ctk.CTkToplevel):
             self.destroy() # بستن پنجره اگر مشتری پیدا نشد
 
         # Load Services for item dropdown
-        services, _ = self.service_manager.get_all_services()
+        services = ServiceCatalog.shared().get_all_services()
         services.sort(key=lambda s: s.description)
         service_descriptions = []
         self.service_data_map = {}
@@ -456,7 +456,7 @@ class InvoiceDetailsWindow(ctk.CTkToplevel):
             self.invoice_items_tree.delete(item)
         
         for idx, item in enumerate(self.invoice_items_list):
-            service_description = self.settings_manager.get_service_description_by_id(item.service_id)
+            service_description = ServiceCatalog.shared().get_description(item.service_id)
             if not service_description:
                 service_description = "خدمت نامشخص" # Fallback if service not found
             self.invoice_items_tree.insert("", "end", iid=str(idx), values=(
@@ -6,15 +6,140 @@ from PIL import Image # از PIL.Image فقط Image رو وارد می‌کنی
 import json
 import subprocess 
 import re # اضافه شد برای Regex
+import threading
+from collections import OrderedDict
 from reportlab.pdfbase import pdfmetrics # اضافه شد
 from reportlab.pdfbase.ttfonts import TTFont # اضافه شد
+from service_catalog import ServiceCatalog
+from image_asset_cache import ImageAssetCache
+from font_metrics import FontMetrics
+from template_compiler import TemplatePlanCache, TemplateError, EMPTY_PLAN
+
+
+_TF_FONT_NAME_RE = re.compile(rb"/([^\s/\[\]()<>{}%]+)\s+[-+\d.]+\s+Tf")
+
+
+def share_form_fonts(page):
+    """
+    ثبت فونت‌های form XObjectهای صفحه (مثل صفحه پایه مهر شده با show_pdf_page) در /Resources خود صفحه.
+    insert_text فونتی را که با همان نام (helv یا Vazirmatn) در فرم پیدا کند دوباره به صفحه اضافه نمی‌کند،
+    پس بدون این کار متن پویا به فونتی اشاره می‌کند که صفحه تعریف نکرده و نمایشگر فونت دیگری جایگزین می‌کند.
+    همان شیء فونت فرم با همان نام ثبت می‌شود، پس فونت دوباره در فایل جاسازی نمی‌شود.
+    """
+    doc = page.parent
+    for xref, _, _, _, refname, _, referencer in page.get_fonts(full=True):
+        if not referencer:
+            continue
+        # xref_set_key از مسیرهای دارای ارجاع غیرمستقیم عبور نمی‌کند؛ Resources و Font اگر شیء جدا باشند
+        # کلید روی خود آن شیء نوشته می‌شود
+        target, path = page.xref, "Resources/Font"
+        kind, value = doc.xref_get_key(page.xref, "Resources")
+        if kind == "xref":
+            target, path = int(value.split()[0]), "Font"
+        kind, value = doc.xref_get_key(target, path)
+        if kind == "xref":
+            target, path = int(value.split()[0]), ""
+        doc.xref_set_key(target, f"{path}/{refname}" if path else refname, f"{xref} 0 R")
+
+
+def undefined_font_names(doc):
+    """ فونت‌هایی که محتوای صفحه با Tf استفاده کرده ولی در /Resources خود صفحه نیستند: [(شماره صفحه، [نام‌ها])] """
+    problems = []
+    for page in doc:
+        defined = {font[4] for font in page.get_fonts(full=True) if not font[6]}
+        used = {name.decode("latin-1") for name in _TF_FONT_NAME_RE.findall(page.read_contents())}
+        if used - defined:
+            problems.append((page.number, sorted(used - defined)))
+    return problems
+
+
+class RenderContext:
+    """
+    وضعیت رندر یک صورتحساب: سند، صفحه فعلی و مکان‌نمای عمودی.
+    برای هر PDF یک نمونه جدید ساخته می‌شود و InvoiceGenerator خودش وضعیتی بین دو رندر نگه نمی‌دارد؛
+    پس یک generator را می‌توان برای رندرهای پشت سر هم (مثلاً در پروسه‌های کارگر batch_renderer) به کار برد.
+    """
+    def __init__(self, width, height, bundle=None, invoice_template=None):
+        self.doc = fitz.open()
+        self.page = self.doc.new_page(width=width, height=height)
+        self.y_cursor = height # از بالای صفحه شروع و به سمت پایین حرکت می‌کند
+        self.bundle = bundle # InvoiceBundle در حال رندر (اگر از get_invoice_bundle آمده باشد)
+        self.invoice_template = invoice_template
+        # کلیدهای کش قالب یک بار برای هر رندر محاسبه می‌شوند، نه برای هر صفحه یا هر کش
+        self.template_version = invoice_template.version_key() if invoice_template is not None else None
+        self.base_page_key = None # در اولین مهر صفحه پایه محاسبه می‌شود
+
+
+class TemplateBasePageCache:
+    """
+    کش مشترک «صفحه پایه» قالب‌ها: یک PDF یک‌صفحه‌ای شامل پس‌زمینه، تصاویر سربرگ و پاورقی و متن‌های ثابت
+    (بدون placeholder) که برای همه صورتحساب‌های یک قالب یکسان است. کلید کش شناسه قالب، اثر انگشت محتوای
+    آن (InvoiceTemplate.version_key) و زمان تغییر فایل‌های تصویر است. صفحه پایه با show_pdf_page روی هر
+    صفحه صورتحساب مهر می‌شود؛ PyMuPDF آن را یک بار به صورت form XObject در سند جاسازی می‌کند و صفحه‌های
+    بعدی همان سند فقط به آن ارجاع می‌دهند.
+    """
+    MAX_ENTRIES = 8
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock() # سند fitz هم‌زمان از دو نخ قابل استفاده نیست
+        self._pages = OrderedDict() # key -> fitz.Document یک‌صفحه‌ای یا None (قالب بدون محتوای ثابت)
+
+    @classmethod
+    def shared(cls):
+        """ نمونه مشترک کش در کل پروسه """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @staticmethod
+    def cache_key(invoice_template, version_key=None):
+        """ کلید صفحه پایه قالب؛ version_key اگر از قبل محاسبه شده باشد (RenderContext) دوباره ساخته نمی‌شود """
+        mtimes = []
+        for path in (invoice_template.background_image_path, invoice_template.header_image_path,
+                     invoice_template.footer_image_path):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns if path else None)
+            except OSError:
+                mtimes.append(None)
+        return invoice_template.id, version_key or invoice_template.version_key(), tuple(mtimes)
+
+    def stamp(self, page, key, invoice_template, build):
+        """
+        مهر کردن صفحه پایه قالب (با کلید key از cache_key) روی page. build(invoice_template) فقط بار اول هر
+        نسخه قالب فراخوانی می‌شود و باید سند یک‌صفحه‌ای یا None برگرداند. خروجی: آیا چیزی مهر شد.
+        """
+        with self._lock:
+            if key in self._pages:
+                self._pages.move_to_end(key)
+                base_doc = self._pages[key]
+            else:
+                base_doc = build(invoice_template)
+                self._pages[key] = base_doc
+                while len(self._pages) > self.MAX_ENTRIES:
+                    _, evicted = self._pages.popitem(last=False)
+                    if evicted is not None:
+                        evicted.close()
+            if base_doc is None:
+                return False
+            page.show_pdf_page(page.rect, base_doc, 0)
+        share_form_fonts(page)
+        return True
+
+    def clear(self):
+        with self._lock:
+            for base_doc in self._pages.values():
+                if base_doc is not None:
+                    base_doc.close()
+            self._pages.clear()
+
 
 class InvoiceGenerator:
     def __init__(self, settings_manager):
         self.settings_manager = settings_manager
-        self.doc = None
-        self.page = None
-        self.y_cursor = 0 # برای مدیریت موقعیت عمودی در صفحه
         # A4 dimensions in points
         self.A4_WIDTH = 595
         self.A4_HEIGHT = 842
@@ -22,88 +147,113 @@ class InvoiceGenerator:
         # Load default font for Persian text (Vazirmatn)
         self.font_path = os.path.join(os.path.dirname(__file__), "Vazirmatn-Regular.ttf")
         self.bold_font_path = os.path.join(os.path.dirname(__file__), "Vazirmatn-Bold.ttf") # assuming a bold variant exists
+        self.font_metrics = FontMetrics.shared()
         self.font_registered = False
+        self.bold_font_registered = False
         try:
             if os.path.exists(self.font_path):
-                pdfmetrics.registerFont(TTFont('Vazirmatn', self.font_path))
-                pdfmetrics.registerFont(TTFont('Vazirmatn-Bold', self.bold_font_path))
-                self.font_registered = True
-                print("Vazirmatn fonts registered for PDF generation.")
+                # فونت‌ها در هر پروسه فقط یک بار ثبت و بارگذاری می‌شوند (generator در هر پنجره و پروسه کارگر ساخته می‌شود)
+                if not {'Vazirmatn', 'Vazirmatn-Bold'} <= set(pdfmetrics.getRegisteredFontNames()):
+                    pdfmetrics.registerFont(TTFont('Vazirmatn', self.font_path))
+                    pdfmetrics.registerFont(TTFont('Vazirmatn-Bold', self.bold_font_path))
+                    print("Vazirmatn fonts registered for PDF generation.")
+                self.font_registered = self.font_metrics.register_font('Vazirmatn', self.font_path)
+                self.bold_font_registered = (self.font_registered and
+                                             self.font_metrics.register_font('Vazirmatn-Bold', self.bold_font_path))
             else:
                 print(f"Warning: Vazirmatn-Regular.ttf not found at {self.font_path}. Using default font.")
         except Exception as e:
             print(f"Error registering Vazirmatn font: {e}. Using default font.")
 
 
+    def create_invoice_pdf_from_bundle(self, bundle, output_path="invoice.pdf", invoice_template=None):
+        """
+        تولید PDF از یک InvoiceBundle (خروجی InvoiceManager.get_invoice_bundle).
+        تنظیمات، قرارداد و توضیحات خدمات از خود bundle خوانده می‌شوند و کوئری جداگانه‌ای اجرا نمی‌شود.
+        """
+        ctx = RenderContext(self.A4_WIDTH, self.A4_HEIGHT, bundle, invoice_template)
+        return self._render_to_file(ctx, bundle.invoice, bundle.customer, bundle.items, output_path, invoice_template)
+
     def create_invoice_pdf(self, invoice_data, customer_data, invoice_items, output_path="invoice.pdf", invoice_template=None): # تغییر: invoice_template اضافه شد
-        self.doc = fitz.open()
-        self.page = self.doc.new_page(width=self.A4_WIDTH, height=self.A4_HEIGHT) 
-        self.y_cursor = self.A4_HEIGHT # Start from top of the page, moving downwards
+        ctx = RenderContext(self.A4_WIDTH, self.A4_HEIGHT, invoice_template=invoice_template)
+        return self._render_to_file(ctx, invoice_data, customer_data, invoice_items, output_path, invoice_template)
+
+    def _render_to_file(self, ctx, invoice_data, customer_data, invoice_items, output_path, invoice_template):
+        try:
+            plan = self._get_plan(invoice_template, ctx.template_version)
+        except TemplateError as e:
+            ctx.doc.close()
+            print(f"Invalid invoice template: {e}")
+            return False, f"قالب صورتحساب نامعتبر است:\n{e}"
 
         # Prepare context data for placeholders
-        context_data = self._populate_template_data(invoice_data, customer_data, invoice_items)
+        context_data = self._populate_template_data(ctx, invoice_data, customer_data, invoice_items)
         
-        template_settings = {}
-        if invoice_template and invoice_template.template_settings:
-            template_settings = invoice_template.template_settings
+        # --- Base Page: background, header/footer images and static text (rendered once per template version) ---
+        self._stamp_base_page(ctx)
         
-        # --- Draw Background Image ---
-        # This can be set in template_settings JSON or directly in InvoiceTemplate object
-        bg_image_path = invoice_template.background_image_path if invoice_template else None
-        bg_opacity = invoice_template.background_opacity if invoice_template else 1.0
-
-        if bg_image_path and os.path.exists(bg_image_path):
-            self._draw_background_image(self.page, bg_image_path, bg_opacity)
-
-        # --- Draw Header Image ---
-        header_image_path = invoice_template.header_image_path if invoice_template else None
-        if header_image_path and os.path.exists(header_image_path):
-            self._draw_image(self.page, header_image_path, "header")
-        
-        # --- Draw Static Text Elements & Dynamic Fields ---
-        if 'static_text_elements' in template_settings:
-            for element_config in template_settings['static_text_elements']:
-                text = element_config.get('text', '')
-                x_pos = element_config.get('x_pos', 0)
-                y_pos = element_config.get('y_pos', 0)
-                align = element_config.get('align', 'right')
-                font_size = element_config.get('font_size', 12)
-                font_bold = element_config.get('font_bold', False)
-                
-                # Replace placeholders with actual data
-                for placeholder in element_config.get('field_placeholders', []):
-                    # Ensure placeholder is in context_data, otherwise keep it as is or replace with empty
-                    if placeholder in context_data:
-                        text = text.replace(f'{{{{{placeholder}}}}}', str(context_data[placeholder]))
-                    else:
-                        text = text.replace(f'{{{{{placeholder}}}}}', '') # Replace missing data with empty string
-
-                self._draw_text(self.page, x_pos, y_pos, text, 
-                                font_size, align, font_bold)
+        # --- Draw Dynamic Fields (static text elements are already on the base page) ---
+        for slot in plan.dynamic_texts:
+            self._draw_slot(ctx.page, slot, slot.fill(context_data))
 
         # --- Draw Invoice Items Table (Placeholder for now) ---
-        if 'table_configs' in template_settings and 'invoice_items_table' in template_settings['table_configs']:
-            self._draw_invoice_items_dynamic_table(invoice_items, template_settings['table_configs']['invoice_items_table'], context_data)
+        if plan.table is not None:
+            self._draw_invoice_items_dynamic_table(ctx, invoice_items, plan.table)
 
         # --- Draw Signature Section (Placeholder for now) ---
-        if 'signature_block_config' in template_settings:
-            self._draw_signature_section_from_template(template_settings['signature_block_config'], context_data)
-
-
-        # --- Draw Footer Image ---
-        footer_image_path = invoice_template.footer_image_path if invoice_template else None
-        if footer_image_path and os.path.exists(footer_image_path):
-            self._draw_image(self.page, footer_image_path, "footer")
+        if plan.signature is not None:
+            self._draw_signature_section_from_template(ctx, plan.signature)
 
         try:
-            self.doc.save(output_path)
-            self.doc.close()
+            ctx.doc.save(output_path)
             return True, output_path
         except Exception as e:
             print(f"Error saving PDF: {e}")
             return False, f"خطا در ذخیره فایل PDF: {e}"
+        finally:
+            ctx.doc.close()
+
+    def _get_plan(self, invoice_template, version_key=None):
+        """ نقشه رندر کامپایل شده قالب (از کش مشترک، بر اساس شناسه و نسخه قالب و فونت‌های این generator) """
+        if invoice_template is None:
+            return EMPTY_PLAN
+        return TemplatePlanCache.shared().get(invoice_template, self._resolve_font(False), self._resolve_font(True),
+                                              self.A4_HEIGHT, version_key)
+
+    def _stamp_base_page(self, ctx):
+        """ مهر صفحه پایه قالب روی صفحه فعلی (برای صفحه اول و صفحه‌های ادامه جدول) """
+        if ctx.invoice_template is None:
+            return
+        if ctx.base_page_key is None:
+            ctx.base_page_key = TemplateBasePageCache.cache_key(ctx.invoice_template, ctx.template_version)
+        TemplateBasePageCache.shared().stamp(ctx.page, ctx.base_page_key, ctx.invoice_template, self._build_base_page)
 
-    def _populate_template_data(self, invoice, customer, items):
+    def _build_base_page(self, invoice_template):
+        """ ساخت صفحه پایه یک قالب برای TemplateBasePageCache؛ None اگر قالب محتوای ثابتی نداشته باشد """
+        static_texts = self._get_plan(invoice_template).static_texts
+        # This can be set in template_settings JSON or directly in InvoiceTemplate object
+        bg_image_path = invoice_template.background_image_path
+        header_image_path = invoice_template.header_image_path
+        footer_image_path = invoice_template.footer_image_path
+        has_background = bool(bg_image_path and os.path.exists(bg_image_path))
+        has_header = bool(header_image_path and os.path.exists(header_image_path))
+        has_footer = bool(footer_image_path and os.path.exists(footer_image_path))
+        if not (has_background or has_header or has_footer or static_texts):
+            return None
+
+        base_doc = fitz.open()
+        page = base_doc.new_page(width=self.A4_WIDTH, height=self.A4_HEIGHT)
+        if has_background:
+            self._draw_background_image(page, bg_image_path, invoice_template.background_opacity)
+        if has_header:
+            self._draw_image(page, header_image_path, "header")
+        for slot in static_texts:
+            self._draw_slot(page, slot, slot.fill({}))
+        if has_footer:
+            self._draw_image(page, footer_image_path, "footer")
+        return base_doc
+
+    def _populate_template_data(self, ctx, invoice, customer, items):
         """ Populates a dictionary with all available data for template rendering. """
         data = {}
 
@@ -130,7 +280,7 @@ class InvoiceGenerator:
         data['customer_notes'] = customer.notes if customer.notes else ''
 
         # Seller Data (from AppSettings)
-        settings = self.settings_manager.get_settings()
+        settings = ctx.bundle.settings if ctx.bundle else self.settings_manager.get_settings()
         data['seller_name'] = settings.seller_name if settings.seller_name else ''
         data['seller_address'] = settings.seller_address if settings.seller_address else ''
         data['seller_phone'] = settings.seller_phone if settings.seller_phone else ''
@@ -140,7 +290,10 @@ class InvoiceGenerator:
 
         # Contract Data (if available)
         if invoice.contract_id:
-            contract, _ = self.settings_manager.contract_manager.get_contract_by_id(invoice.contract_id) # Need to access contract_manager
+            if ctx.bundle:
+                contract = ctx.bundle.contract
+            else:
+                contract, _ = self.settings_manager.contract_manager.get_contract_by_id(invoice.contract_id) # Need to access contract_manager
             if contract:
                 data['contract_number'] = contract.contract_number if contract.contract_number else ''
                 data['contract_title'] = contract.title if contract.title else ''
@@ -161,38 +314,40 @@ class InvoiceGenerator:
 
         return data
 
-    def _draw_text(self, page, x_pos, y_pos, text, font_size, align, font_bold=False):
+    def _resolve_font(self, font_bold=False):
+        """ نام فونت PDF برای متن معمولی/پررنگ با توجه به فونت‌های موجود """
+        # Fallback if Vazirmatn is not registered
+        if not self.font_registered:
+            return "helv" # Helvetica is a default font
+        if font_bold and self.bold_font_registered:
+            return 'Vazirmatn-Bold'
+        return 'Vazirmatn'
+
+    def _draw_slot(self, page, slot, text, y_pos=None):
+        """ رسم یک TextSlot کامپایل شده (y_pos برای سلول‌های جدول که ردیفشان در زمان رندر معلوم می‌شود) """
+        self._draw_text(page, slot.x, slot.y if y_pos is None else y_pos, text, slot.font_size, slot.anchor, slot.fontname)
+
+    def _draw_text(self, page, x_pos, y_pos, text, font_size, anchor, fontname):
         """
-        Draws text on the page with specified position, size, alignment, and boldness.
-        x_pos, y_pos are expected in PDF coordinates (bottom-left origin).
+        Draws text on the page with specified position, size, alignment anchor and resolved font.
+        x_pos, y_pos are expected in PDF coordinates (bottom-left origin); anchor is the fraction of the
+        text width to shift left (0 = left, 0.5 = center, 1 = right).
         """
         if not text:
             return
 
-        # Choose font based on boldness and availability
-        selected_font_name = 'Vazirmatn'
-        if font_bold:
-            selected_font_name = 'Vazirmatn-Bold' if self.font_registered and os.path.exists(self.bold_font_path) else 'Vazirmatn'
-        
-        # Fallback if Vazirmatn is not registered
-        if not self.font_registered:
-            selected_font_name = "helv" # Helvetica is a default font
-
-        # Adjust x_pos based on alignment
-        text_len = page.text_length(text, fontname=selected_font_name, fontsize=font_size)
-        if align == 'center':
-            x_pos -= text_len / 2
-        elif align == 'right':
-            x_pos -= text_len # This is for RTL, so right-aligned means start further right
+        # Adjust x_pos based on alignment (right-aligned means start further right, for RTL)
+        if anchor:
+            x_pos -= self.font_metrics.text_length(text, fontname, font_size) * anchor
         
         # In PyMuPDF, text is drawn from its baseline.
-        # Persian text also needs RTL handling for rendering, but PyMuPDF's text_length usually works.
+        # Persian text also needs RTL handling for rendering, but the measured width is the same font's width.
         try:
             page.insert_text(fitz.Point(x_pos, y_pos), text, 
-                             fontname=selected_font_name, fontsize=font_size, 
+                             fontname=fontname, fontfile=self.font_metrics.fontfile(fontname), fontsize=font_size, 
                              color=(0, 0, 0)) # Default to black
         except Exception as e:
-            print(f"Error drawing text '{text}' at ({x_pos}, {y_pos}) with font {selected_font_name}: {e}")
+            print(f"Error drawing text '{text}' at ({x_pos}, {y_pos}) with font {fontname}: {e}")
             page.insert_text(fitz.Point(x_pos, y_pos), text, fontname="helv", fontsize=font_size, color=(1,0,0))
 
 
@@ -202,7 +357,7 @@ class InvoiceGenerator:
             print(f"Warning: {image_type.capitalize()} image not found at {image_path}")
             return
         try:
-            img_pil = Image.open(image_path)
+            pix, ratio = ImageAssetCache.shared().get(image_path, ("image",), self._load_image_pixmap)
             
             if image_type == "header":
                 target_height = 100 # Example fixed height for header
@@ -214,7 +369,6 @@ class InvoiceGenerator:
                 target_height = self.A4_HEIGHT
                 y_pos = 0
 
-            ratio = img_pil.width / img_pil.height
             new_width = int(target_height * ratio)
             
             # Scale down if too wide
@@ -226,11 +380,6 @@ class InvoiceGenerator:
             x_pos = (self.A4_WIDTH - new_width) / 2
             
             img_rect = fitz.Rect(x_pos, y_pos, x_pos + new_width, y_pos + target_height)
-            
-            pix = fitz.Pixmap(img_pil.mode, img_pil.size, img_pil.tobytes())
-            if pix.alpha:
-                pix = fitz.Pixmap(pix, 0) # Remove alpha for consistent rendering
-            
             page.insert_image(img_rect, pixmap=pix)
 
         except Exception as e:
@@ -243,124 +392,119 @@ class InvoiceGenerator:
             return
 
         try:
-            img_pil = Image.open(image_path)
-            img_pil = img_pil.resize((int(self.A4_WIDTH), int(self.A4_HEIGHT)), Image.LANCZOS)
-
-            if opacity < 1.0:
-                if img_pil.mode != 'RGBA':
-                    img_pil = img_pil.convert('RGBA')
-                alpha = img_pil.split()[3] 
-                alpha = Image.eval(alpha, lambda x: x * opacity) 
-                img_pil.putalpha(alpha) 
-
-            pix = fitz.Pixmap(img_pil.mode, img_pil.size, img_pil.tobytes())
+            size = (int(self.A4_WIDTH), int(self.A4_HEIGHT))
+            pix = ImageAssetCache.shared().get(
+                image_path, ("background", size, opacity),
+                lambda path: self._load_background_pixmap(path, size, opacity)
+            )
             page.insert_image(page.rect, pixmap=pix)
 
         except Exception as e:
             print(f"Error drawing background image {image_path}: {e}")
 
-
-    def _draw_invoice_items_dynamic_table(self, invoice_items, table_config, context_data):
+    @staticmethod
+    def _load_image_pixmap(image_path):
+        """ بارگذاری تصویر سربرگ/پاورقی برای ImageAssetCache: ((pixmap بدون آلفا، نسبت عرض به ارتفاع)، حجم) """
+        with Image.open(image_path) as img_pil:
+            ratio = img_pil.width / img_pil.height
+            pix = InvoiceGenerator._pixmap_from_pil(img_pil)
+        if pix.alpha:
+            pix = fitz.Pixmap(pix, 0) # Remove alpha for consistent rendering
+        return (pix, ratio), pix.stride * pix.height
+
+    @staticmethod
+    def _load_background_pixmap(image_path, size, opacity):
+        """ بارگذاری پس‌زمینه برای ImageAssetCache: تغییر اندازه به A4 و اعمال شفافیت فقط یک بار """
+        with Image.open(image_path) as img_pil:
+            img_pil = img_pil.resize(size, Image.LANCZOS)
+
+        if opacity < 1.0:
+            if img_pil.mode != 'RGBA':
+                img_pil = img_pil.convert('RGBA')
+            alpha = img_pil.split()[3] 
+            alpha = Image.eval(alpha, lambda x: x * opacity) 
+            img_pil.putalpha(alpha) 
+
+        pix = InvoiceGenerator._pixmap_from_pil(img_pil)
+        return pix, pix.stride * pix.height
+
+    @staticmethod
+    def _pixmap_from_pil(img_pil):
+        """ تبدیل تصویر PIL به fitz.Pixmap در فضای رنگ RGB (با کانال آلفا اگر تصویر شفافیت داشته باشد) """
+        has_alpha = 'A' in img_pil.getbands() or 'transparency' in img_pil.info
+        mode = 'RGBA' if has_alpha else 'RGB'
+        if img_pil.mode != mode:
+            img_pil = img_pil.convert(mode)
+        return fitz.Pixmap(fitz.csRGB, img_pil.width, img_pil.height, img_pil.tobytes(), has_alpha)
+
+
+    def _get_service_description(self, ctx, service_id):
+        if ctx.bundle:
+            return ctx.bundle.service_descriptions.get(service_id)
+        return ServiceCatalog.shared().get_description(service_id)
+
+    def _draw_invoice_items_dynamic_table(self, ctx, invoice_items, table):
         """
-        Draws the invoice items table dynamically based on table_config.
+        Draws the invoice items table from a compiled TablePlan.
         This is a preliminary implementation. Full page-break logic and detailed
         item rendering requires a more comprehensive table config from HTML.
         """
-        
-        # Default font for table content if not specified in config
-        table_font_size = 10
-        table_font_bold = False
-        table_align = 'right'
-
-        # Extract table common settings
-        table_x_start = table_config.get('x_start', 50)
-        table_y_start_html = table_config.get('y_start', 400) # HTML top-origin Y
-        table_width = table_config.get('width', 500)
-        row_height = table_config.get('row_height', 20)
-        
-        # Convert HTML top-origin Y to PDF bottom-origin Y
-        table_y_start_pdf = self.A4_HEIGHT - table_y_start_html
-
         # Store current y_cursor to adjust later sections
-        current_y = table_y_start_pdf 
+        current_y = table.y_start 
 
         # Draw Headers
-        header_elements = table_config.get('header_elements', [])
-        for header_el in header_elements:
-            text = header_el.get('text', '')
-            x_offset = header_el.get('x_offset', 0)
-            align = header_el.get('align', table_align)
-            font_size = header_el.get('font_size', table_font_size)
-            font_bold = header_el.get('font_bold', table_font_bold)
-            
-            self._draw_text(self.page, table_x_start + x_offset, current_y, text, 
-                            font_size, align, font_bold)
+        for slot in table.headers:
+            self._draw_slot(ctx.page, slot, slot.fill({}), current_y)
 
-        current_y -= row_height # Move down after headers for first item row
+        current_y -= table.row_height # Move down after headers for first item row
 
         # Draw Items
-        item_field_configs = table_config.get('item_field_configs', [])
+        needs_description = 'item_service_description' in table.item_keys
         for idx, item in enumerate(invoice_items):
             # To handle item-specific placeholders (like {{item_quantity}}),
             # we need to create an item-specific context
             item_context = {
                 'item_row_num': idx + 1,
-                'item_service_description': self.settings_manager.get_service_description_by_id(item.service_id) or "N/A",
                 'item_quantity': f"{item.quantity:g}",
                 'item_unit_price': f"{int(item.unit_price):,}",
                 'item_total_price': f"{int(item.total_price):,}"
             }
+            if needs_description:
+                item_context['item_service_description'] = self._get_service_description(ctx, item.service_id) or "N/A"
             
-            for field_config in item_field_configs:
-                field_name = field_config.get('field', '')
-                x_offset = field_config.get('x_offset', 0)
-                align = field_config.get('align', table_align)
-                font_size = field_config.get('font_size', table_font_size)
-                font_bold = field_config.get('font_bold', table_font_bold)
-                
-                # Get the actual value from item_context
-                text_to_draw = item_context.get(field_name, '')
-
-                self._draw_text(self.page, table_x_start + x_offset, current_y, text_to_draw,
-                                font_size, align, font_bold)
+            for slot in table.cells:
+                self._draw_slot(ctx.page, slot, slot.fill(item_context), current_y)
             
-            current_y -= row_height # Move down for next item
+            current_y -= table.row_height # Move down for next item
 
             # Basic page break check (needs full implementation)
             if current_y < 50: # If approaching bottom of page
-                self.page = self.doc.new_page(width=self.A4_WIDTH, height=self.A4_HEIGHT)
+                ctx.page = ctx.doc.new_page(width=self.A4_WIDTH, height=self.A4_HEIGHT)
+                self._stamp_base_page(ctx) # همان XObject صفحه اول؛ تصاویر دوباره جاسازی نمی‌شوند
                 current_y = self.A4_HEIGHT - 50 # Start near top of new page
                 # TODO: Redraw table headers on new page here
 
-        self.y_cursor = current_y # Update the main y_cursor for subsequent sections
-
+        ctx.y_cursor = current_y # Update the main y_cursor for subsequent sections
 
-    def _draw_signature_section_from_template(self, signature_config, context_data):
-        """ Draws signature blocks based on template config. """
-        seller_x = signature_config.get('seller_signature_x', 150)
-        seller_y = signature_config.get('seller_signature_y', 100)
-        buyer_x = signature_config.get('buyer_signature_x', 450)
-        buyer_y = signature_config.get('buyer_signature_y', 100)
-        
-        font_size = 10
-        
-        self._draw_text(self.page, seller_x, seller_y + 15, "امضا و مهر فروشنده", font_size, 'center', True)
-        self.page.draw_line(fitz.Point(seller_x - 50, seller_y), fitz.Point(seller_x + 50, seller_y))
 
-        self._draw_text(self.page, buyer_x, buyer_y + 15, "امضا و مهر خریدار", font_size, 'center', True)
-        self.page.draw_line(fitz.Point(buyer_x - 50, buyer_y), fitz.Point(buyer_x + 50, buyer_y))
+    def _draw_signature_section_from_template(self, ctx, signature):
+        """ Draws signature blocks from a compiled SignaturePlan. """
+        for slot, (start, end) in zip(signature.labels, signature.lines):
+            self._draw_slot(ctx.page, slot, slot.fill({}))
+            ctx.page.draw_line(fitz.Point(*start), fitz.Point(*end))
 
-        self.y_cursor = min(seller_y, buyer_y) - 20 # Update cursor to below signature lines
+        ctx.y_cursor = signature.y_cursor # Update cursor to below signature lines
 
 
 # --- بلاک تست مستقل ---
 if __name__ == "__main__":
-    from models import AppSettings, Customer, Invoice, InvoiceItem, Service, InvoiceTemplate 
+    from models import AppSettings, Customer, Contract, Invoice, InvoiceItem, Service, InvoiceTemplate 
     from settings_manager import SettingsManager
     from db_manager import DBManager, DATABASE_NAME
     import sys
     from service_manager import ServiceManager 
     from contract_manager import ContractManager # اضافه شد برای تست Contract Data
+    from customer_manager import CustomerManager
 
     temp_db_name_for_test = "test_invoice_generator_v2.db" # Changed DB name to avoid conflicts
     temp_db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), temp_db_name_for_test)
@@ -542,6 +686,13 @@ if __name__ == "__main__":
 
     if success:
         print(f"Sample invoice generated at: {pdf_path}")
+        # همه فونت‌های استفاده شده در محتوای صفحه‌ها باید در /Resources خود صفحه تعریف شده باشند
+        with fitz.open(pdf_path) as generated_doc:
+            font_problems = undefined_font_names(generated_doc)
+        for page_number, font_names in font_problems:
+            print(f"FAIL: page {page_number + 1} uses fonts missing from its resources: {', '.join(font_names)}")
+        if font_problems:
+            sys.exit(1)
         try:
             if sys.platform == "win32":
                 subprocess.run(["start", pdf_path], shell=True) 
@@ -7,10 +7,18 @@ import subprocess
 
 from invoice_manager import InvoiceManager # برای بازیابی لیست صورتحساب‌ها
 from models import Invoice # برای Type Hinting
-from invoice_generator import InvoiceGenerator # برای تولید مجدد PDF در مشاهده/پرینت مجدد
 from settings_manager import SettingsManager # برای پاس دادن به InvoiceGenerator
+from virtual_list import VirtualTreeview, KeysetPageSource
+from live_filter import LiveFilterController
+from change_events import ChangeEventBus, INVOICE, CUSTOMER, INSERT
 
 class InvoiceListUI(ctk.CTkFrame):
+    # ستون جدول -> ستون مرتب‌سازی InvoiceManager.page_invoices
+    SORT_COLUMN_MAP = {
+        "InvoiceNumber": "invoice_number", "CustomerName": "customer_name",
+        "IssueDate": "issue_date", "FinalAmount": "final_amount",
+    }
+
     def __init__(self, parent, db_manager, ui_colors, base_font, heading_font, button_font, nav_button_font):
         super().__init__(parent, fg_color="transparent")
         self.parent = parent
@@ -23,7 +31,7 @@ class InvoiceListUI(ctk.CTkFrame):
 
         self.invoice_manager = InvoiceManager()
         self.settings_manager = SettingsManager() # Instantiate SettingsManager for invoice_generator
-        self.invoice_generator = InvoiceGenerator(self.settings_manager) # Pass settings_manager
+        self._invoice_generator = None
 
         self.create_widgets()
         self.load_invoices_to_table()
@@ -57,6 +65,15 @@ class InvoiceListUI(ctk.CTkFrame):
         tree_scrollbar = ctk.CTkScrollbar(main_frame, command=self.invoice_table.yview)
         tree_scrollbar.grid(row=1, column=1, sticky="ns", padx=(0,10), pady=10)
         self.invoice_table.configure(yscrollcommand=tree_scrollbar.set)
+        # فقط ردیف‌های قابل مشاهده در جدول درج می‌شوند و بقیه هنگام اسکرول صفحه به صفحه خوانده می‌شوند
+        self.invoice_view = VirtualTreeview(self.invoice_table, tree_scrollbar)
+        # شمارش و صفحه اول در نخ کارگر خوانده می‌شوند تا باز شدن صفحه منتظر دیتابیس نماند
+        self.load_controller = LiveFilterController(self.invoice_table, self.fetch_invoice_source,
+                                                    on_result=self.invoice_view.set_source)
+        # صورتحساب‌های جدید/حذف شده و تغییر نام مشتری بدون بارگذاری دوباره کل لیست اعمال می‌شوند
+        bus = ChangeEventBus.shared()
+        bus.subscribe_widget(self.invoice_table, INVOICE, self.on_invoice_changed)
+        bus.subscribe_widget(self.invoice_table, CUSTOMER, self.on_customer_changed)
 
         # Buttons (مثلاً مشاهده جزئیات، پرینت مجدد، حذف)
         button_frame = ctk.CTkFrame(main_frame, fg_color="transparent")
@@ -66,22 +83,48 @@ class InvoiceListUI(ctk.CTkFrame):
         ctk.CTkButton(button_frame, text="حذف", font=self.button_font, fg_color="#dc3545", command=self.delete_selected_invoice).pack(side="right", padx=5)
 
     def load_invoices_to_table(self):
-        for item in self.invoice_table.get_children():
-            self.invoice_table.delete(item)
-        
-        invoices, msg = self.invoice_manager.get_all_invoices()
-        if not invoices:
-            print(msg) # Log message if no invoices
-            return
+        """ بارگذاری صورتحساب‌ها در جدول (در پس‌زمینه) """
+        self.load_controller.refresh(None)
+
+    def fetch_invoice_source(self, _params):
+        """ منبع داده جدول (در نخ کارگر LiveFilterController اجرا می‌شود) """
+        # صورتحساب‌ها صفحه به صفحه (keyset) خوانده می‌شوند و مرتب‌سازی ستون‌ها در SQL انجام می‌شود
+        total, _ = self.invoice_manager.count_invoices()
+        source = KeysetPageSource(self.invoice_manager.page_invoices, total, self.invoice_row_values,
+                                  self.SORT_COLUMN_MAP, ("issue_date", True), sort=self.invoice_view.sort)
+        source.get_rows(0, KeysetPageSource.PAGE_SIZE)
+        return source
+
+    def on_invoice_changed(self, event):
+        """ اعمال یک رویداد تغییر صورتحساب روی جدول """
+        def load_values():
+            invoice, _ = self.invoice_manager.get_invoice_by_id(event.entity_id)
+            return self.invoice_row_values(invoice)[1] if invoice else None
+        if not self.invoice_view.apply_change(event.operation, event.entity_id, load_values):
+            self.load_invoices_to_table()
 
-        for invoice in invoices:
-            formatted_amount = f"{int(invoice.final_amount):,}" if invoice.final_amount is not None else "0"
-            self.invoice_table.insert("", "end", iid=invoice.id, values=(
-                invoice.invoice_number,
-                invoice.customer_name, # فرض می‌کنیم invoice_manager نام مشتری را هم برمی‌گرداند
-                invoice.issue_date,
-                formatted_amount
-            ))
+    def on_customer_changed(self, event):
+        """ ویرایش یا حذف مشتری نام نمایش داده شده در ردیف‌ها را عوض می‌کند """
+        if event.operation != INSERT and not self.invoice_view.invalidate():
+            self.load_invoices_to_table()
+
+    @property
+    def invoice_generator(self):
+        """ InvoiceGenerator برای تولید مجدد PDF؛ اولین بار که صورتحسابی مشاهده/پرینت شود ساخته می‌شود """
+        if self._invoice_generator is None:
+            from invoice_generator import InvoiceGenerator # بارگذاری PyMuPDF و reportlab فقط در صورت نیاز
+            self._invoice_generator = InvoiceGenerator(self.settings_manager)
+        return self._invoice_generator
+
+    @staticmethod
+    def invoice_row_values(invoice):
+        formatted_amount = f"{int(invoice.final_amount):,}" if invoice.final_amount is not None else "0"
+        return invoice.id, (
+            invoice.invoice_number,
+            invoice.customer_name, # فرض می‌کنیم invoice_manager نام مشتری را هم برمی‌گرداند
+            invoice.issue_date,
+            formatted_amount
+        )
 
     def view_selected_invoice(self):
         selected_item_id = self.invoice_table.focus()
@@ -90,28 +133,23 @@ class InvoiceListUI(ctk.CTkFrame):
             return
         
         invoice_id = int(selected_item_id)
-        invoice, msg = self.invoice_manager.get_invoice_by_id(invoice_id)
-        if not invoice:
+        # صورتحساب، مشتری، قرارداد، آیتم‌ها و تنظیمات با یک فراخوانی روی یک اتصال خوانده می‌شوند
+        bundle, msg = self.invoice_manager.get_invoice_bundle(invoice_id)
+        if not bundle:
             messagebox.showerror("خطا", f"صورتحساب با شناسه {invoice_id} یافت نشد: {msg}", master=self)
             return
-        
-        customer, msg_cust = self.invoice_manager.customer_manager.get_customer_by_id(invoice.customer_id)
-        if not customer:
-            messagebox.showerror("خطا", f"مشتری صورتحساب یافت نشد: {msg_cust}", master=self)
-            return
+        invoice = bundle.invoice
 
-        invoice_items, msg_items = self.invoice_manager.get_invoice_items_by_invoice_id(invoice_id)
-        if not invoice_items:
-            messagebox.showwarning("هشدار", f"آیتم‌های صورتحساب یافت نشدند: {msg_items}", master=self)
+        if not bundle.items:
+            messagebox.showwarning("هشدار", "آیتم‌های صورتحساب یافت نشدند.", master=self)
             # می‌توانیم ادامه دهیم یا خطا دهیم
-            invoice_items = []
 
         # تولید مجدد PDF و نمایش آن
         # از invoice_generator که در __init__ این کلاس تعریف شده استفاده می‌کنیم
         # نیازی به ایمپورت InvoiceDetailsWindow اینجا نیست چون فقط برای نمایش استفاده میشه
         
         temp_pdf_path = os.path.join(os.path.expanduser("~"), "Documents", "EasyInvoice_Invoices", f"Preview_{invoice.invoice_number}.pdf")
-        success, _ = self.invoice_generator.create_invoice_pdf(invoice, customer, invoice_items, temp_pdf_path)
+        success, _ = self.invoice_generator.create_invoice_pdf_from_bundle(bundle, temp_pdf_path)
 
         if success:
             try:
@@ -139,7 +177,6 @@ class InvoiceListUI(ctk.CTkFrame):
             success, msg = self.invoice_manager.delete_invoice(invoice_id)
             if success:
                 messagebox.showinfo("موفقیت", "صورتحساب با موفقیت حذف شد.", master=self)
-                self.load_invoices_to_table() # رفرش جدول
             else:
                 messagebox.showerror("خطا", f"خطا در حذف صورتحساب: {msg}", master=self)
 
@@ -2,15 +2,24 @@
 import customtkinter as ctk
 from tkinter import messagebox, ttk
 import os
-import jdatetime
 import json
 
 from contract_manager import ContractManager
 from invoice_details_window import InvoiceDetailsWindow
 from models import Contract, InvoiceTemplate
 from invoice_template_manager import InvoiceTemplateManager
+from live_filter import LiveFilterController
+from virtual_list import VirtualTreeview, KeysetPageSource, ListPageSource
 
 class ContractSelectionWindow(ctk.CTkToplevel):
+    SEARCH_LIMIT = 200 # حداکثر تعداد نتایج جستجو در پنجره انتخاب قرارداد
+    TABLE_COLUMNS = ("ContractNumber", "CustomerName", "Title", "ContractDate")
+    # ستون جدول -> ستون مرتب‌سازی ContractManager.page_contracts
+    SORT_COLUMN_MAP = {
+        "ContractNumber": "contract_number", "CustomerName": "customer_name",
+        "Title": "title", "ContractDate": "contract_date",
+    }
+
     def __init__(self, master, opener_frame, db_manager, ui_colors, base_font, heading_font, button_font):
         super().__init__(master)
         self.master = master
@@ -69,7 +78,7 @@ class ContractSelectionWindow(ctk.CTkToplevel):
         filter_entry.bind("<KeyRelease>", self.apply_filter)
 
         # Treeview برای نمایش قراردادها
-        self.contract_table = ttk.Treeview(main_frame, columns=("ContractNumber", "CustomerName", "Title", "ContractDate"), show="headings")
+        self.contract_table = ttk.Treeview(main_frame, columns=self.TABLE_COLUMNS, show="headings")
         self.contract_table.heading("ContractNumber", text="شماره قرارداد", anchor="e")
         self.contract_table.heading("CustomerName", text="نام مشتری", anchor="e")
         self.contract_table.heading("Title", text="عنوان", anchor="e")
@@ -88,6 +97,9 @@ class ContractSelectionWindow(ctk.CTkToplevel):
         tree_scrollbar = ctk.CTkScrollbar(main_frame, command=self.contract_table.yview)
         tree_scrollbar.grid(row=2, column=1, sticky="ns", padx=(0,10), pady=10)
         self.contract_table.configure(yscrollcommand=tree_scrollbar.set)
+        self.contract_view = VirtualTreeview(self.contract_table, tree_scrollbar)
+        self.filter_controller = LiveFilterController(self.contract_table, self.fetch_contract_source,
+                                                      on_result=self.contract_view.set_source)
 
         # Style for Treeview
         tree_style = ttk.Style()
@@ -109,41 +121,31 @@ class ContractSelectionWindow(ctk.CTkToplevel):
                                    command=self.destroy)
         cancel_btn.pack(side="right", padx=5)
 
-    def load_contracts_to_table(self, contracts_to_display=None):
-        for item in self.contract_table.get_children():
-            self.contract_table.delete(item)
+    def load_contracts_to_table(self):
+        """ بارگذاری همه قراردادها (در پس‌زمینه؛ جدول فقط ردیف‌های قابل مشاهده را نگه می‌دارد) """
+        self.filter_controller.refresh("")
 
-        if contracts_to_display is None:
-            contracts, _ = self.contract_manager.get_all_contracts()
-        else:
-            contracts = contracts_to_display
-            
-        contracts.sort(key=lambda c: c.contract_number, reverse=True) # Sort by number descending
-
-        for contract in contracts:
-            self.contract_table.insert("", "end", iid=contract.id, values=(
-                contract.contract_number,
-                contract.customer_name if contract.customer_name else "نامشخص",
-                contract.title if contract.title else "بدون عنوان",
-                contract.contract_date if contract.contract_date else ""
-            ))
+    def fetch_contract_source(self, search_term):
+        """ منبع داده جدول برای عبارت جستجو (در نخ کارگر LiveFilterController اجرا می‌شود) """
+        if search_term:
+            contracts, _ = self.contract_manager.search(search_term, limit=self.SEARCH_LIMIT) # به ترتیب رتبه
+            return ListPageSource([self.contract_row(contract) for contract in contracts], self.TABLE_COLUMNS)
+        # همه قراردادها به ترتیب نزولی شماره، صفحه به صفحه
+        total, _ = self.contract_manager.count_contracts()
+        source = KeysetPageSource(self.contract_manager.page_contracts, total, self.contract_row,
+                                  self.SORT_COLUMN_MAP, ("contract_number", True), sort=self.contract_view.sort)
+        source.get_rows(0, KeysetPageSource.PAGE_SIZE)
+        return source
+
+    @staticmethod
+    def contract_row(contract):
+        return contract.id, (contract.contract_number,
+                             contract.customer_name if contract.customer_name else "نامشخص",
+                             contract.title if contract.title else "بدون عنوان",
+                             contract.contract_date if contract.contract_date else "")
 
     def apply_filter(self, event=None):
-        search_term = self.filter_var.get().strip().lower()
-        all_contracts, _ = self.contract_manager.get_all_contracts()
-        
-        filtered_contracts = []
-        if search_term:
-            for contract in all_contracts:
-                if (search_term in str(contract.contract_number).lower() or
-                    search_term in str(contract.customer_name).lower() or
-                    search_term in str(contract.title).lower() or
-                    search_term in str(contract.contract_date).lower()):
-                    filtered_contracts.append(contract)
-        else:
-            filtered_contracts = all_contracts
-        
-        self.load_contracts_to_table(filtered_contracts)
+        self.filter_controller.request(self.filter_var.get().strip())
 
     def on_contract_select(self, event):
         selected_item_id = self.contract_table.focus()
@@ -319,6 +321,7 @@ class InvoiceMainUI(ctk.CTkFrame):
 
 # --- بلاک تست مستقل ---
 if __name__ == "__main__":
+    import jdatetime
     root = ctk.CTk()
     root.title("تب صدور صورتحساب (تست مستقل)")
     root.geometry("800x600")
@@ -2,9 +2,10 @@
 import sqlite3
 import os
 import json # برای serializing/deserializing
-from db_manager import DBManager, DATABASE_NAME
-from models import Invoice, InvoiceItem, Customer, Service # Customer و Service هم ایمپورت شدند برای JOIN
+from db_manager import DBManager, DATABASE_NAME, keyset_clause
+from models import Invoice, InvoiceItem, Customer, Service, Contract, AppSettings, InvoiceBundle # Customer و Service هم ایمپورت شدند برای JOIN
 from customer_manager import CustomerManager # برای دسترسی به اطلاعات مشتری
+from change_events import ChangeEventBus, INVOICE, INSERT, DELETE
 from settings_manager import SettingsManager # برای دسترسی به تنظیمات (مثلاً توضیحات سرویس)
 
 class InvoiceManager:
@@ -14,64 +15,71 @@ class InvoiceManager:
         self.customer_manager = CustomerManager() # برای بازیابی اطلاعات مشتری
         self.settings_manager = SettingsManager() # برای بازیابی توضیحات سرویس از طریق SettingsManager
 
-    def add_invoice(self, invoice: Invoice, invoice_items: list[InvoiceItem]):
-        """ اضافه کردن یک صورتحساب جدید و آیتم‌های آن به دیتابیس. """
+    _INVOICE_INSERT_QUERY = """
+    INSERT INTO Invoices (
+        invoice_number, customer_id, contract_id, issue_date, due_date,
+        total_amount, discount_percentage, tax_percentage, final_amount, description
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    _ITEM_INSERT_QUERY = """
+    INSERT INTO InvoiceItems (
+        invoice_id, service_id, quantity, unit_price, total_price
+    ) VALUES (?, ?, ?, ?, ?)
+    """
+
+    def add_invoice(self, invoice: Invoice | list[tuple[Invoice, list[InvoiceItem]]], invoice_items: list[InvoiceItem] = None):
+        """
+        اضافه کردن یک صورتحساب جدید و آیتم‌های آن به دیتابیس.
+        برای درج دسته‌ای، به جای invoice لیستی از زوج‌های (صورتحساب، آیتم‌ها) پاس داده می‌شود.
+        شناسه‌های تولید شده روی آبجکت‌های صورتحساب و آیتم ست می‌شوند.
+        """
+        batch = invoice if isinstance(invoice, list) else [(invoice, invoice_items or [])]
         if not self.db_manager.connect():
             return False, "خطا در اتصال به دیتابیس."
         
         try:
-            # شروع تراکنش
-            self.db_manager.conn.execute("BEGIN TRANSACTION;")
-
-            # 1. اضافه کردن صورتحساب اصلی
-            invoice_query = """
-            INSERT INTO Invoices (
-                invoice_number, customer_id, contract_id, issue_date, due_date,
-                total_amount, discount_percentage, tax_percentage, final_amount, description
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            invoice_params = (
-                invoice.invoice_number, invoice.customer_id, invoice.contract_id,
-                invoice.issue_date, invoice.due_date, invoice.total_amount,
-                invoice.discount_percentage, invoice.tax_percentage, invoice.final_amount,
-                invoice.description
-            )
-            invoice_cursor = self.db_manager.execute_query(invoice_query, invoice_params)
-            
-            if not invoice_cursor:
-                raise sqlite3.Error("Failed to insert invoice.")
-            
-            invoice_id = invoice_cursor.lastrowid
-
-            # 2. اضافه کردن آیتم‌های صورتحساب
-            item_query = """
-            INSERT INTO InvoiceItems (
-                invoice_id, service_id, quantity, unit_price, total_price
-            ) VALUES (?, ?, ?, ?, ?)
-            """
-            for item in invoice_items:
-                item_params = (
-                    invoice_id, item.service_id, item.quantity,
-                    item.unit_price, item.total_price
-                )
-                item_cursor = self.db_manager.execute_query(item_query, item_params)
-                if not item_cursor:
-                    raise sqlite3.Error(f"Failed to insert invoice item for service ID {item.service_id}.")
-            
-            # کامیت تراکنش
-            self.db_manager.conn.commit()
+            # همه درج‌ها در یک تراکنش اتمیک با یک کامیت انجام می‌شوند
+            with self.db_manager.transaction():
+                # 1. اضافه کردن صورتحساب‌های اصلی
+                invoice_ids = self.db_manager.insert_many(self._INVOICE_INSERT_QUERY, [
+                    (
+                        inv.invoice_number, inv.customer_id, inv.contract_id,
+                        inv.issue_date, inv.due_date, inv.total_amount,
+                        inv.discount_percentage, inv.tax_percentage, inv.final_amount,
+                        inv.description
+                    )
+                    for inv, _ in batch
+                ])
+
+                # 2. اضافه کردن همه آیتم‌ها با یک executemany
+                all_items = []
+                for (inv, items), invoice_id in zip(batch, invoice_ids):
+                    inv.id = invoice_id
+                    for item in items:
+                        item.invoice_id = invoice_id
+                        all_items.append(item)
+                item_ids = self.db_manager.insert_many(self._ITEM_INSERT_QUERY, [
+                    (item.invoice_id, item.service_id, item.quantity, item.unit_price, item.total_price)
+                    for item in all_items
+                ])
+                for item, item_id in zip(all_items, item_ids):
+                    item.id = item_id
+
             self.db_manager.close()
-            return True, "صورتحساب با موفقیت ذخیره شد."
+            bus = ChangeEventBus.shared()
+            for invoice_id in invoice_ids:
+                bus.publish(INVOICE, invoice_id, INSERT)
+            if len(batch) == 1:
+                return True, "صورتحساب با موفقیت ذخیره شد."
+            return True, f"{len(batch)} صورتحساب با موفقیت ذخیره شد."
 
         except sqlite3.IntegrityError as e:
-            self.db_manager.conn.rollback() # برگشت تراکنش در صورت خطا
             self.db_manager.close()
             if "UNIQUE constraint failed: Invoices.invoice_number" in str(e):
                 return False, "شماره صورتحساب تکراری است. لطفاً شماره دیگری را وارد کنید."
             else:
                 return False, f"خطای تکراری بودن داده: {e}"
         except Exception as e:
-            self.db_manager.conn.rollback() # برگشت تراکنش در صورت خطا
             self.db_manager.close()
             return False, f"خطای ناشناخته در ذخیره صورتحساب: {e}"
 
@@ -101,6 +109,112 @@ class InvoiceManager:
         self.db_manager.close()
         return invoices, "صورتحساب‌ها با موفقیت بازیابی شدند."
 
+    _LIST_COLUMNS = """
+        i.id, i.invoice_number, i.customer_id, i.contract_id, i.issue_date, i.due_date,
+        i.total_amount, i.discount_percentage, i.tax_percentage, i.final_amount, i.description,
+        c.name as customer_name"""
+    _LIST_FROM = """
+    FROM Invoices i
+    JOIN Customers c ON i.customer_id = c.id
+    """
+    _LIST_SELECT = f"SELECT {_LIST_COLUMNS} {_LIST_FROM}"
+
+    @staticmethod
+    def _invoice_from_row(row):
+        invoice_data = dict(row)
+        customer_name = invoice_data.pop('customer_name')
+        invoice_obj = Invoice.from_dict(invoice_data)
+        invoice_obj.customer_name = customer_name
+        return invoice_obj
+
+    def list_invoices(self, after=None, limit=500):
+        """
+        صفحه‌بندی keyset صورتحساب‌ها به ترتیب issue_date نزولی و سپس id نزولی (مثل get_all_invoices).
+        after: (issue_date, id) آخرین صورتحساب صفحه قبل یا None برای صفحه اول.
+        """
+        if not self.db_manager.connect():
+            return [], "خطا در اتصال به دیتابیس."
+        if after is None:
+            where, params = "", ()
+        else:
+            where, params = "WHERE (i.issue_date, i.id) < (?, ?)", tuple(after)
+        cursor = self.db_manager.execute_query(
+            f"{self._LIST_SELECT} {where} ORDER BY i.issue_date DESC, i.id DESC LIMIT ?",
+            params + (limit,)
+        )
+        invoices = []
+        if cursor:
+            invoices = [self._invoice_from_row(row) for row in cursor.fetchall()]
+        self.db_manager.close()
+        return invoices, "صورتحساب‌ها با موفقیت بازیابی شدند."
+
+    def iter_invoices(self, batch_size=500):
+        """ پیمایش جریانی همه صورتحساب‌ها (با fetchmany) بدون نگه داشتن کل جدول در حافظه """
+        query = f"{self._LIST_SELECT} ORDER BY i.issue_date DESC, i.id DESC"
+        for row in self.db_manager.iter_query(query, batch_size=batch_size):
+            yield self._invoice_from_row(row)
+
+    def get_invoice_ids(self, start_date=None, end_date=None):
+        """
+        شناسه صورتحساب‌هایی که تاریخ صدورشان در بازه [start_date, end_date] است (هر دو اختیاری، به فرمت
+        YYYY/MM/DD شمسی که به صورت رشته‌ای قابل مقایسه است)، به ترتیب تاریخ و شناسه؛ برای تولید دسته‌ای PDF.
+        """
+        conditions, params = [], []
+        if start_date:
+            conditions.append("issue_date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("issue_date <= ?")
+            params.append(end_date)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if not self.db_manager.connect():
+            return [], "خطا در اتصال به دیتابیس."
+        cursor = self.db_manager.execute_query(f"SELECT id FROM Invoices {where} ORDER BY issue_date, id", tuple(params))
+        invoice_ids = [row[0] for row in cursor.fetchall()] if cursor else []
+        self.db_manager.close()
+        return invoice_ids, "شناسه صورتحساب‌ها با موفقیت بازیابی شد."
+
+    # ستون‌های قابل مرتب‌سازی در page_invoices و عبارت SQL هر کدام (بدون NULL، برای مقایسه keyset)
+    SORT_COLUMNS = {
+        "id": "i.id", "invoice_number": "i.invoice_number", "customer_name": "c.name COLLATE NOCASE",
+        "issue_date": "i.issue_date", "final_amount": "i.final_amount",
+    }
+
+    def count_invoices(self):
+        """ تعداد کل صورتحساب‌ها (همان ردیف‌هایی که لیست صورتحساب‌ها نشان می‌دهد) """
+        if not self.db_manager.connect():
+            return 0, "خطا در اتصال به دیتابیس."
+        cursor = self.db_manager.execute_query(f"SELECT COUNT(*) {self._LIST_FROM}")
+        count = cursor.fetchone()[0] if cursor else 0
+        self.db_manager.close()
+        return count, "تعداد صورتحساب‌ها با موفقیت بازیابی شد."
+
+    def page_invoices(self, sort="issue_date", descending=True, after=None, before=None, offset=0, limit=200):
+        """
+        یک صفحه از صورتحساب‌ها با مرتب‌سازی دلخواه (برای لیست مجازی)، به صورت keyset.
+        after/before: کلید آخرین ردیف صفحه قبل / اولین ردیف صفحه بعد؛ offset: تعداد ردیف‌هایی که بعد از آن رد می‌شوند.
+        خروجی: ([(key, Invoice)], پیام) که key کلید keyset همان ردیف است.
+        """
+        if sort not in self.SORT_COLUMNS:
+            return [], f"ستون مرتب‌سازی نامعتبر: {sort}"
+        sort_expr = self.SORT_COLUMNS[sort]
+        clause, params, reverse = keyset_clause(sort_expr, "i.id", descending, after, before, offset, limit)
+        if not self.db_manager.connect():
+            return [], "خطا در اتصال به دیتابیس."
+        cursor = self.db_manager.execute_query(
+            f"SELECT {sort_expr} AS sort_key, {self._LIST_COLUMNS} {self._LIST_FROM} {clause}", params
+        )
+        rows = []
+        if cursor:
+            for row in cursor.fetchall():
+                invoice_data = dict(row)
+                sort_key = invoice_data.pop('sort_key')
+                rows.append(((sort_key, invoice_data['id']), self._invoice_from_row(invoice_data)))
+        self.db_manager.close()
+        if reverse:
+            rows.reverse()
+        return rows, "صورتحساب‌ها با موفقیت بازیابی شدند."
+
     def get_invoice_by_id(self, invoice_id: int):
         """ بازیابی یک صورتحساب بر اساس شناسه. """
         if not self.db_manager.connect():
@@ -146,28 +260,96 @@ class InvoiceManager:
         self.db_manager.close()
         return items, "آیتم‌های صورتحساب با موفقیت بازیابی شدند."
 
+    _BUNDLE_QUERY = """
+    SELECT
+        i.id, i.invoice_number, i.customer_id, i.contract_id, i.issue_date, i.due_date,
+        i.total_amount, i.discount_percentage, i.tax_percentage, i.final_amount, i.description,
+        c.customer_code AS c_customer_code, c.name AS c_name, c.customer_type AS c_customer_type,
+        c.address AS c_address, c.phone AS c_phone, c.phone2 AS c_phone2, c.mobile AS c_mobile,
+        c.email AS c_email, c.tax_id AS c_tax_id, c.postal_code AS c_postal_code, c.notes AS c_notes,
+        c.registration_date AS c_registration_date,
+        ct.contract_number AS ct_contract_number, ct.contract_date AS ct_contract_date,
+        ct.total_amount AS ct_total_amount, ct.description AS ct_description, ct.title AS ct_title,
+        ct.payment_method AS ct_payment_method, ct.scanned_pages AS ct_scanned_pages
+    FROM Invoices i
+    JOIN Customers c ON i.customer_id = c.id
+    LEFT JOIN Contracts ct ON i.contract_id = ct.id
+    WHERE i.id = ?
+    """
+    _BUNDLE_ITEMS_QUERY = """
+    SELECT
+        ii.id, ii.invoice_id, ii.service_id, ii.quantity, ii.unit_price, ii.total_price,
+        s.description AS service_description
+    FROM InvoiceItems ii
+    LEFT JOIN Services s ON ii.service_id = s.id
+    WHERE ii.invoice_id = ?
+    ORDER BY ii.id
+    """
+
+    def get_invoice_bundle(self, invoice_id: int):
+        """
+        بازیابی صورتحساب به همراه مشتری، قرارداد، آیتم‌ها، توضیحات خدمات و تنظیمات فروشنده
+        با چند کوئری JOIN روی یک اتصال (برای نمایش و چاپ مجدد).
+        """
+        if not self.db_manager.connect():
+            return None, "خطا در اتصال به دیتابیس."
+
+        try:
+            row = self.db_manager.execute(self._BUNDLE_QUERY, (invoice_id,)).fetchone()
+            if not row:
+                self.db_manager.close()
+                return None, "صورتحساب یافت نشد."
+            data = dict(row)
+
+            customer_data = {key[2:]: data.pop(key) for key in list(data) if key.startswith('c_')}
+            customer = Customer.from_dict(dict(customer_data, id=data['customer_id']))
+            contract_data = {key[3:]: data.pop(key) for key in list(data) if key.startswith('ct_')}
+            contract = None
+            if data['contract_id'] and contract_data['contract_number'] is not None:
+                contract = Contract.from_dict(dict(contract_data, id=data['contract_id'], customer_id=data['customer_id']))
+                contract.customer_name = customer.name
+            invoice = Invoice.from_dict(data)
+            invoice.customer_name = customer.name
+
+            items = []
+            service_descriptions = {}
+            for item_row in self.db_manager.execute(self._BUNDLE_ITEMS_QUERY, (invoice_id,)).fetchall():
+                item_data = dict(item_row)
+                description = item_data.pop('service_description')
+                if description is not None:
+                    service_descriptions[item_data['service_id']] = description
+                items.append(InvoiceItem.from_dict(item_data))
+
+            settings_row = self.db_manager.execute("SELECT * FROM AppSettings WHERE id = 1").fetchone()
+            settings = AppSettings.from_dict(dict(settings_row)) if settings_row else AppSettings()
+
+            self.db_manager.close()
+            bundle = InvoiceBundle(invoice, customer, contract, items, service_descriptions, settings)
+            return bundle, "صورتحساب با موفقیت بازیابی شد."
+        except Exception as e:
+            self.db_manager.close()
+            return None, f"خطا در بازیابی صورتحساب: {e}"
+
     def delete_invoice(self, invoice_id: int):
         """ حذف یک صورتحساب و تمام آیتم‌های مربوط به آن. """
         if not self.db_manager.connect():
             return False, "خطا در اتصال به دیتابیس."
         
         try:
-            self.db_manager.conn.execute("BEGIN TRANSACTION;")
-            
-            # حذف آیتم‌های صورتحساب (CASCADE ON DELETE در تعریف جدول)
-            # cursor_items = self.db_manager.execute_query("DELETE FROM InvoiceItems WHERE invoice_id = ?", (invoice_id,))
-            
-            # حذف صورتحساب اصلی
-            cursor_invoice = self.db_manager.execute_query("DELETE FROM Invoices WHERE id = ?", (invoice_id,))
-            
-            if not cursor_invoice or cursor_invoice.rowcount == 0:
-                raise sqlite3.Error("Invoice not found or failed to delete.")
+            with self.db_manager.transaction():
+                # حذف آیتم‌های صورتحساب (foreign_keys روی اتصال فعال نیست، پس CASCADE اجرا نمی‌شود)
+                self.db_manager.execute("DELETE FROM InvoiceItems WHERE invoice_id = ?", (invoice_id,))
+                
+                # حذف صورتحساب اصلی
+                cursor_invoice = self.db_manager.execute("DELETE FROM Invoices WHERE id = ?", (invoice_id,))
+                
+                if cursor_invoice.rowcount == 0:
+                    raise sqlite3.Error("Invoice not found or failed to delete.")
             
-            self.db_manager.conn.commit()
             self.db_manager.close()
+            ChangeEventBus.shared().publish(INVOICE, invoice_id, DELETE)
             return True, "صورتحساب با موفقیت حذف شد."
         except Exception as e:
-            self.db_manager.conn.rollback()
             self.db_manager.close()
             return False, f"خطا در حذف صورتحساب: {e}"
 
@@ -2,12 +2,15 @@
 import customtkinter as ctk
 from tkinter import messagebox
 import os
-
-# Import the individual UI components for invoices
-from invoice_main_ui import InvoiceMainUI
-from invoice_list_ui import InvoiceListUI
+import importlib
 
 class InvoiceManagerUI(ctk.CTkFrame):
+    # زیرصفحه‌ها (و ماژول‌هایشان) اولین بار که نمایش داده شوند بارگذاری می‌شوند (نام زیرصفحه -> (ماژول، کلاس))
+    SUB_PAGE_FACTORIES = {
+        "create_invoice": ("invoice_main_ui", "InvoiceMainUI"),
+        "list_invoices": ("invoice_list_ui", "InvoiceListUI"),
+    }
+
     def __init__(self, parent, db_manager, ui_colors, base_font, heading_font, button_font, nav_button_font):
         super().__init__(parent, fg_color="transparent")
         self.parent = parent
@@ -23,7 +26,6 @@ class InvoiceManagerUI(ctk.CTkFrame):
         self.current_active_sub_page_name = None
 
         self.create_widgets()
-        self.init_sub_frames()
         
         # Default to showing the "Create Invoice" page
         self.after(100, lambda: self.on_sub_nav_button_click("create_invoice", self.create_invoice_btn))
@@ -77,23 +79,21 @@ class InvoiceManagerUI(ctk.CTkFrame):
         self.invoice_content_frame.grid_rowconfigure(0, weight=1)
         self.invoice_content_frame.grid_columnconfigure(0, weight=1)
 
-    def init_sub_frames(self):
-        """ مقداردهی اولیه فریم‌های زیرمجموعه مدیریت صورتحساب. """
-        # Instance of InvoiceMainUI (for creating invoices, now using 'contract-based' main UI)
-        create_invoice_page = InvoiceMainUI(self.invoice_content_frame, self.db_manager, self.ui_colors,
-                                            self.base_font, self.heading_font, self.button_font, self.nav_button_font)
-        self.frames["create_invoice"] = create_invoice_page
-        create_invoice_page.grid(row=0, column=0, sticky="nsew")
-
-        # Instance of InvoiceListUI
-        list_invoices_page = InvoiceListUI(self.invoice_content_frame, self.db_manager, self.ui_colors,
-                                          self.base_font, self.heading_font, self.button_font, self.nav_button_font)
-        self.frames["list_invoices"] = list_invoices_page
-        list_invoices_page.grid(row=0, column=0, sticky="nsew")
+    def get_sub_frame(self, page_name):
+        """ فریم یک زیرصفحه؛ در اولین درخواست از روی SUB_PAGE_FACTORIES ساخته می‌شود """
+        frame = self.frames.get(page_name)
+        if frame is None and page_name in self.SUB_PAGE_FACTORIES:
+            module_name, class_name = self.SUB_PAGE_FACTORIES[page_name]
+            page_class = getattr(importlib.import_module(module_name), class_name)
+            frame = page_class(self.invoice_content_frame, self.db_manager, self.ui_colors,
+                               self.base_font, self.heading_font, self.button_font, self.nav_button_font)
+            frame.grid(row=0, column=0, sticky="nsew")
+            self.frames[page_name] = frame
+        return frame
 
     def show_sub_frame(self, page_name):
         """ نمایش یک فریم زیرمجموعه خاص در مدیریت صورتحساب‌ها """
-        frame = self.frames.get(page_name)
+        frame = self.get_sub_frame(page_name)
         if frame:
             frame.tkraise()
             self.current_active_sub_page_name = page_name
@@ -112,7 +112,7 @@ class InvoiceManagerUI(ctk.CTkFrame):
         هندل کردن کلیک روی دکمه‌های منوی داخلی مدیریت صورتحساب‌ها.
         صفحه مورد نظر را نمایش داده و استایل دکمه فعال را تغییر می‌دهد.
         """
-        target_frame = self.frames.get(page_name)
+        target_frame = self.get_sub_frame(page_name)
 
         if target_frame:
             if self.current_active_sub_button:
@@ -4,32 +4,76 @@ import os
 import json
 from db_manager import DBManager, DATABASE_NAME
 from models import InvoiceTemplate
+from change_events import ChangeEventBus, INVOICE_TEMPLATE, INSERT, UPDATE, DELETE
+from template_compiler import validate_template_settings
 
 class InvoiceTemplateManager:
+    _INSERT_QUERY = """
+    INSERT INTO InvoiceTemplates (
+        template_name, template_type, required_fields, template_settings, is_active,
+        header_image_path, footer_image_path, background_image_path, background_opacity
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    MAX_VALIDATION_MESSAGES = 10 # حداکثر تعداد ایرادهای نمایش داده شده برای هر قالب
+
     def __init__(self):
         db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATABASE_NAME)
         self.db_manager = DBManager(db_path)
 
-    def add_template(self, template: InvoiceTemplate):
+    def _insert_params(self, template: InvoiceTemplate):
+        return (
+            template.template_name, template.template_type, 
+            json.dumps(template.required_fields), json.dumps(template.template_settings), # تغییر از default_settings به template_settings
+            template.is_active,
+            template.header_image_path, template.footer_image_path, template.background_image_path, template.background_opacity
+        )
+
+    def _format_issues(self, issues):
+        shown = issues[:self.MAX_VALIDATION_MESSAGES]
+        if len(issues) > len(shown):
+            shown.append(f"... و {len(issues) - len(shown)} ایراد دیگر")
+        return "\n".join(shown)
+
+    def _validate(self, templates):
+        """
+        کامپایل آزمایشی template_settings هر قالب. خروجی: (پیام خطا برای اولین قالب با خطای ساختاری یا None،
+        متن هشدارهای غیرمانع مثل فیلد ناشناخته که ذخیره را متوقف نمی‌کنند و فقط به کاربر نشان داده می‌شوند).
+        """
+        notes = []
+        for template in templates:
+            errors, warnings = validate_template_settings(template.template_settings)
+            if errors:
+                return f"تنظیمات قالب «{template.template_name}» نامعتبر است:\n" + self._format_issues(errors), ""
+            if warnings:
+                notes.append(f"هشدار برای قالب «{template.template_name}» (قالب ذخیره شد):\n"
+                             + self._format_issues(warnings))
+        return None, "\n\n".join(notes)
+
+    def add_template(self, template: InvoiceTemplate | list[InvoiceTemplate]):
+        """ اضافه کردن یک قالب (یا لیستی از قالب‌ها به صورت دسته‌ای با executemany). """
+        validation_error, warnings = self._validate(template if isinstance(template, list) else [template])
+        if validation_error:
+            return False, validation_error
+        notice = f"\n\n{warnings}" if warnings else ""
         if not self.db_manager.connect():
             return False, "خطا در اتصال به دیتابیس."
         try:
-            query = """
-            INSERT INTO InvoiceTemplates (
-                template_name, template_type, required_fields, template_settings, is_active,
-                header_image_path, footer_image_path, background_image_path, background_opacity
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            params = (
-                template.template_name, template.template_type, 
-                json.dumps(template.required_fields), json.dumps(template.template_settings), # تغییر از default_settings به template_settings
-                template.is_active,
-                template.header_image_path, template.footer_image_path, template.background_image_path, template.background_opacity
-            )
-            cursor = self.db_manager.execute_query(query, params)
+            if isinstance(template, list):
+                new_ids = self.db_manager.insert_many(self._INSERT_QUERY, [self._insert_params(t) for t in template])
+                for t, new_id in zip(template, new_ids):
+                    t.id = new_id
+                self.db_manager.close()
+                bus = ChangeEventBus.shared()
+                for new_id in new_ids:
+                    bus.publish(INVOICE_TEMPLATE, new_id, INSERT)
+                return True, f"{len(template)} قالب صورتحساب با موفقیت اضافه شد.{notice}"
+
+            cursor = self.db_manager.execute_query(self._INSERT_QUERY, self._insert_params(template))
             self.db_manager.close()
             if cursor:
-                return True, "قالب صورتحساب با موفقیت اضافه شد."
+                template.id = cursor.lastrowid
+                ChangeEventBus.shared().publish(INVOICE_TEMPLATE, template.id, INSERT)
+                return True, f"قالب صورتحساب با موفقیت اضافه شد.{notice}"
             else:
                 return False, "خطا در اضافه کردن قالب صورتحساب."
         except sqlite3.IntegrityError as e:
@@ -87,6 +131,10 @@ class InvoiceTemplateManager:
         return template, "قالب صورتحساب با موفقیت بازیابی شد."
 
     def update_template(self, template: InvoiceTemplate):
+        validation_error, warnings = self._validate([template])
+        if validation_error:
+            return False, validation_error
+        notice = f"\n\n{warnings}" if warnings else ""
         if not self.db_manager.connect():
             return False, "خطا در اتصال به دیتابیس."
         try:
@@ -107,7 +155,8 @@ class InvoiceTemplateManager:
             cursor = self.db_manager.execute_query(query, params)
             self.db_manager.close()
             if cursor and cursor.rowcount > 0:
-                return True, "قالب صورتحساب با موفقیت بروزرسانی شد."
+                ChangeEventBus.shared().publish(INVOICE_TEMPLATE, template.id, UPDATE)
+                return True, f"قالب صورتحساب با موفقیت بروزرسانی شد.{notice}"
             else:
                 return False, "قالب صورتحساب مورد نظر یافت نشد یا تغییری اعمال نشد."
         except sqlite3.IntegrityError as e:
@@ -126,6 +175,7 @@ class InvoiceTemplateManager:
         cursor = self.db_manager.execute_query("DELETE FROM InvoiceTemplates WHERE id = ?", (template_id,))
         self.db_manager.close()
         if cursor and cursor.rowcount > 0:
+            ChangeEventBus.shared().publish(INVOICE_TEMPLATE, template_id, DELETE)
             return True, "قالب صورتحساب با موفقیت حذف شد."
         else:
             return False, "قالب صورتحساب مورد نظر یافت نشد."
\ No newline at end of file
@@ -9,6 +9,7 @@ import subprocess
 from db_manager import DBManager, DATABASE_NAME # برای تست مستقل
 from customer_manager import CustomerManager
 from service_manager import ServiceManager # اصلاح شد: services_manager به service_manager
+from service_catalog import ServiceCatalog # کش مشترک خدمات
 from models import Invoice, InvoiceItem, Customer, Service
 from settings_manager import SettingsManager # برای پاس دادن به InvoiceGenerator
 from invoice_generator import InvoiceGenerator
@@ -206,7 +207,7 @@ class InvoiceUI(ctk.CTkFrame):
             self.on_customer_selected(customer_names[0])
 
         # Load Services
-        services, _ = self.service_manager.get_all_services()
+        services = ServiceCatalog.shared().get_all_services()
         services.sort(key=lambda s: s.description)
         service_descriptions = []
         self.service_data_map = {}
@@ -357,7 +358,7 @@ class InvoiceUI(ctk.CTkFrame):
             self.invoice_items_tree.delete(item)
         
         for idx, item in enumerate(self.invoice_items_list):
-            service_description = self.settings_manager.get_service_description_by_id(item.service_id)
+            service_description = ServiceCatalog.shared().get_description(item.service_id)
             if not service_description:
                 service_description = "خدمت نامشخص" # Fallback if service not found
             self.invoice_items_tree.insert("", "end", iid=str(idx), values=(
@@ -0,0 +1,145 @@
+# live_filter.py
+import queue
+import threading
+import tkinter as tk
+
+
+class LiveFilterController:
+    """
+    فیلتر زنده پس‌زمینه برای یک Treeview.
+    هر تایپ کاربر فقط یک تایمر debounce را از نو تنظیم می‌کند؛ بعد از مکث، کوئری در یک نخ کارگر
+    اجرا می‌شود و نتیجه با after() به نخ Tk برمی‌گردد. هر درخواست یک شماره ترتیبی دارد و نتیجه‌هایی که
+    تا رسیدنشان درخواست جدیدتری ثبت شده دور ریخته می‌شوند.
+
+    fetch(params) در نخ کارگر اجرا می‌شود و نباید به ویجت‌های Tk دست بزند؛ خروجی آن (مثلاً یک منبع داده
+    VirtualTreeview) در نخ Tk به on_result داده می‌شود.
+    """
+    DEFAULT_DELAY_MS = 250 # مکث لازم بعد از آخرین کلید قبل از اجرای کوئری
+    POLL_INTERVAL_MS = 30 # فاصله بررسی رسیدن نتیجه از نخ کارگر
+
+    def __init__(self, tree, fetch, on_result, delay_ms=DEFAULT_DELAY_MS):
+        self.tree = tree
+        self.fetch = fetch
+        self.on_result = on_result
+        self.delay_ms = delay_ms
+        self._sequence = 0 # شماره آخرین درخواست ثبت شده (فقط در نخ Tk تغییر می‌کند)
+        self._dispatched = 0 # شماره آخرین درخواستی که به نخ کارگر داده شده
+        self._completed = 0 # شماره آخرین درخواستی که نتیجه‌اش برگشته
+        self._debounce_id = None
+        self._poll_id = None
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._worker = None
+        self.tree.bind("<Destroy>", self._on_destroy, add="+")
+
+    def request(self, params):
+        """ ثبت یک فیلتر جدید با debounce (برای رویداد تایپ کاربر) """
+        self._sequence += 1
+        self._cancel_after("_debounce_id")
+        self._debounce_id = self.tree.after(self.delay_ms, self._dispatch, self._sequence, params)
+
+    def refresh(self, params):
+        """ اجرای فوری فیلتر بدون debounce (بارگذاری اولیه یا بعد از افزودن/ویرایش/حذف) """
+        self._sequence += 1
+        self._cancel_after("_debounce_id")
+        self._dispatch(self._sequence, params)
+
+    def cancel(self):
+        """ لغو درخواست‌های در جریان؛ برای وقتی که جدول بیرون از کنترلر پر می‌شود """
+        self._sequence += 1
+        self._cancel_after("_debounce_id")
+
+    def stop(self):
+        """ لغو همه کارها و پایان نخ کارگر """
+        self.cancel()
+        self._cancel_after("_poll_id")
+        if self._worker is not None:
+            self._requests.put((None, None))
+            self._worker = None
+
+    def _on_destroy(self, event):
+        if event.widget is self.tree:
+            self.stop()
+
+    def _cancel_after(self, attr):
+        after_id = getattr(self, attr)
+        if after_id is not None:
+            try:
+                self.tree.after_cancel(after_id)
+            except tk.TclError:
+                pass
+            setattr(self, attr, None)
+
+    def _dispatch(self, sequence, params):
+        self._debounce_id = None
+        if sequence != self._sequence:
+            return
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._worker_loop, name="LiveFilterWorker", daemon=True)
+            self._worker.start()
+        self._dispatched = sequence
+        self._requests.put((sequence, params))
+        if self._poll_id is None:
+            self._poll_id = self.tree.after(self.POLL_INTERVAL_MS, self._poll)
+
+    def _worker_loop(self):
+        while True:
+            sequence, params = self._requests.get()
+            # از درخواست‌های صف شده فقط جدیدترین اجرا می‌شود
+            while sequence is not None:
+                try:
+                    sequence, params = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+            if sequence is None:
+                return
+            result = None
+            if sequence == self._sequence: # درخواست‌های کهنه اصلاً اجرا نمی‌شوند
+                try:
+                    result = self.fetch(params)
+                except Exception as e:
+                    print(f"Error running live filter query: {e}")
+            self._results.put((sequence, result))
+
+    def _poll(self):
+        self._poll_id = None
+        latest = None
+        while True:
+            try:
+                latest = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._completed = max(self._completed, latest[0])
+        if latest is not None and latest[0] == self._sequence and latest[1] is not None:
+            self.on_result(latest[1])
+        if self._completed < self._dispatched:
+            self._poll_id = self.tree.after(self.POLL_INTERVAL_MS, self._poll)
+
+
+def load_in_background(widget, fetch, on_result, poll_ms=LiveFilterController.POLL_INTERVAL_MS):
+    """
+    اجرای یک‌باره fetch() در یک نخ کارگر و دادن نتیجه به on_result(result) در نخ Tk؛ برای بارگذاری
+    اولیه داده‌های یک صفحه بدون قفل شدن رابط کاربری. اگر ویجت تا رسیدن نتیجه از بین رفته باشد یا
+    fetch خطا بدهد، on_result فراخوانی نمی‌شود. fetch نباید به ویجت‌های Tk دست بزند.
+    """
+    results = queue.Queue(maxsize=1)
+
+    def work():
+        try:
+            results.put((True, fetch()))
+        except Exception as e:
+            print(f"Error loading data in background: {e}")
+            results.put((False, None))
+
+    def poll():
+        try:
+            ok, result = results.get_nowait()
+        except queue.Empty:
+            if widget.winfo_exists():
+                widget.after(poll_ms, poll)
+            return
+        if ok and widget.winfo_exists():
+            on_result(result)
+
+    threading.Thread(target=work, name="BackgroundLoad", daemon=True).start()
+    widget.after(poll_ms, poll)
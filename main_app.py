@@ -1,27 +1,51 @@
 # main_app.py
+from startup_tracer import StartupTracer, PROCESS_START # قبل از بقیه ایمپورت‌ها تا زمان ایمپورت‌ها هم اندازه‌گیری شود
 import customtkinter as ctk
 from tkinter import messagebox
 import os
 import sys
 import configparser
-from PIL import Image, ImageTk 
+import importlib
+import multiprocessing
+import threading
+import time
 
 from db_manager import DBManager, DATABASE_NAME
-from settings_ui import SettingsUI 
-from customer_ui import CustomerUI
-from contract_ui import ContractUI 
-from invoice_manager_ui import InvoiceManagerUI # تغییر: Import InvoiceManagerUI بجای دوتا فایل جداگانه
 from settings_manager import SettingsManager 
 from invoice_template_manager import InvoiceTemplateManager # اضافه شد
+from stall_watchdog import StallWatchdog
+
+StartupTracer.shared().record("imports", PROCESS_START)
 
 class MainApplication(ctk.CTk):
+    # صفحه‌های اصلی به صورت تنبل ساخته می‌شوند: هر صفحه اولین بار که دکمه‌اش زده شود (نام صفحه -> (ماژول، کلاس)).
+    # ماژول‌های UI (و از طریق آن‌ها PyMuPDF، PIL، jdatetime و ...) هم در شروع برنامه ایمپورت نمی‌شوند.
+    PAGE_FACTORIES = {
+        "settings": ("settings_ui", "SettingsUI"),
+        "customers": ("customer_ui", "CustomerUI"),
+        "contracts": ("contract_ui", "ContractUI"),
+        "invoice_manager": ("invoice_manager_ui", "InvoiceManagerUI"),
+    }
+    # ماژول‌هایی که بعد از نمایش پنجره در یک نخ پس‌زمینه پیش‌بارگذاری می‌شوند تا اولین کلیک روی صفحه‌ها سریع باشد
+    PRELOAD_MODULES = (
+        "jdatetime", "PIL.Image", "PIL.ImageTk", "fitz",
+        "reportlab.pdfbase.pdfmetrics", "reportlab.pdfbase.ttfonts", "bs4",
+        "customer_ui", "contract_ui", "settings_ui", "invoice_generator",
+        "invoice_list_ui", "invoice_details_window", "invoice_main_ui", "invoice_manager_ui",
+    )
+    PRELOAD_DELAY_MS = 500
+
     def __init__(self):
-        super().__init__()
+        tracer = StartupTracer.shared()
+        with tracer.phase("tk_window"):
+            super().__init__()
         
         self.version_config_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "version.ini")
         
-        self.settings_manager = SettingsManager() 
-        self.app_version_string = self._get_and_increment_build_version()
+        with tracer.phase("settings_manager"):
+            self.settings_manager = SettingsManager() 
+        with tracer.phase("version_file"):
+            self.app_version_string = self._get_and_increment_build_version()
         self.title(f"سیستم آسان‌فاکتور (Easy Invoice) - {self.app_version_string}")
 
         self.update_idletasks() 
@@ -74,14 +98,19 @@ class MainApplication(ctk.CTk):
         }
         
         self.app_logo_label = None 
-        self.create_widgets()
+        with tracer.phase("create_widgets"):
+            self.create_widgets()
         self.frames = {}
-        self.init_frames()
         self.current_active_top_button = None 
         self.current_active_top_page_name = None 
         
-        self.show_reports_page_on_start()
-        self.load_and_display_logo() 
+        with tracer.phase("reports_page"):
+            self.show_reports_page_on_start()
+        with tracer.phase("logo"):
+            self.load_and_display_logo() 
+        self.after(self.PRELOAD_DELAY_MS, self.preload_modules_in_background)
+        # نگهبان قفل شدن حلقه رویداد؛ در __main__ و درست قبل از mainloop شروع می‌شود
+        self.stall_watchdog = StallWatchdog(self)
 
     def _read_version_data(self):
         """ مقادیر ورژن را از فایل version.ini می‌خواند. """
@@ -162,6 +191,7 @@ class MainApplication(ctk.CTk):
 
         if logo_path and os.path.exists(logo_path):
             try:
+                from PIL import Image # PIL فقط وقتی لوگویی تنظیم شده باشد در شروع برنامه بارگذاری می‌شود
                 image_pil = Image.open(logo_path)
                 image_pil = image_pil.resize((50, 50), Image.LANCZOS) 
                 ctk_image = ctk.CTkImage(light_image=image_pil, dark_image=image_pil, size=(50, 50))
@@ -264,35 +294,35 @@ class MainApplication(ctk.CTk):
         self.content_frame.grid_rowconfigure(0, weight=1)
         self.content_frame.grid_columnconfigure(0, weight=1)
 
-    def init_frames(self):
-        """ مقداردهی اولیه فریم‌های UI مختلف و ذخیره آن‌ها در دیکشنری frames """
-        settings_page = SettingsUI(self.content_frame, self.db_manager, self.ui_colors, 
-                                   self.base_font, self.heading_font, self.button_font, self.nav_button_font)
-        self.frames["settings"] = settings_page
-        settings_page.grid(row=0, column=0, sticky="nsew")
-
-        customer_page = CustomerUI(self.content_frame, self.db_manager, self.ui_colors,
-                                   self.base_font, self.heading_font, self.button_font, self.nav_button_font)
-        self.frames["customers"] = customer_page
-        customer_page.grid(row=0, column=0, sticky="nsew")
-
-        contract_page = ContractUI(self.content_frame, self.db_manager, self.ui_colors,
-                                   self.base_font, self.heading_font, self.button_font, self.nav_button_font)
-        self.frames["contracts"] = contract_page
-        contract_page.grid(row=0, column=0, sticky="nsew")
-
-        # اضافه شده: فریم UI مدیریت صورتحساب (که شامل زیرتب‌ها می‌شود)
-        invoice_manager_page = InvoiceManagerUI(self.content_frame, self.db_manager, self.ui_colors,
+    def get_frame(self, page_name):
+        """
+        فریم یک صفحه؛ صفحه‌های PAGE_FACTORIES در اولین درخواست ساخته می‌شوند تا شروع برنامه فقط هزینه
+        صفحه نمایش داده شده را بپردازد (بارگذاری اولیه داده‌های هر صفحه هم در پس‌زمینه انجام می‌شود).
+        """
+        frame = self.frames.get(page_name)
+        if frame is None and page_name in self.PAGE_FACTORIES:
+            module_name, class_name = self.PAGE_FACTORIES[page_name]
+            with StartupTracer.shared().phase(f"page:{page_name}"):
+                page_class = getattr(importlib.import_module(module_name), class_name)
+                frame = page_class(self.content_frame, self.db_manager, self.ui_colors,
                                    self.base_font, self.heading_font, self.button_font, self.nav_button_font)
-        self.frames["invoice_manager"] = invoice_manager_page
-        invoice_manager_page.grid(row=0, column=0, sticky="nsew")
-        
-        # فریم‌های invoice_main_ui و invoice_list_ui دیگر اینجا به صورت مستقیم مقداردهی اولیه نمی‌شوند
-
+            frame.grid(row=0, column=0, sticky="nsew")
+            self.frames[page_name] = frame
+        return frame
+
+    def preload_modules_in_background(self):
+        """ ایمپورت ماژول‌های سنگین در یک نخ پس‌زمینه بعد از نمایش پنجره (فقط ایمپورت؛ بدون کار با Tk) """
+        def preload():
+            for module_name in self.PRELOAD_MODULES:
+                try:
+                    importlib.import_module(module_name)
+                except Exception as e:
+                    print(f"Warning: preloading module {module_name} failed: {e}")
+        threading.Thread(target=preload, name="ModulePreload", daemon=True).start()
 
     def show_frame(self, page_name):
         """ نمایش یک فریم خاص بر اساس نام آن """
-        frame = self.frames.get(page_name)
+        frame = self.get_frame(page_name)
         if frame:
             frame.tkraise()
             self.current_active_top_page_name = page_name 
@@ -302,7 +332,7 @@ class MainApplication(ctk.CTk):
         هندل کردن کلیک روی دکمه‌های نویگیشن اصلی.
         صفحه مورد نظر را نمایش داده و استایل دکمه فعال را تغییر می‌دهد.
         """
-        target_frame = self.frames.get(page_name)
+        target_frame = self.get_frame(page_name)
 
         if target_frame:
             if self.current_active_top_button:
@@ -351,7 +381,8 @@ class MainApplication(ctk.CTk):
     def on_closing(self):
         """ تابعی که هنگام بسته شدن برنامه فراخالی می‌شود """
         if messagebox.askokcancel("خروج از برنامه", "آیا مطمئنید می‌خواهید خارج شوید؟", master=self):
-            self.db_manager.close() 
+            self.stall_watchdog.stop()
+            self.db_manager.close_all() # بستن اتصال‌های استخر مشترک
             self.destroy()
 
     def _initialize_database(self):
@@ -364,8 +395,10 @@ class MainApplication(ctk.CTk):
                 messagebox.showerror("خطا در اتصال به دیتابیس", "امکان اتصال به دیتابیس وجود ندارد! برنامه بسته خواهد شد.", master=self)
                 return False
             
-            self.db_manager.create_tables()
-            self.db_manager.migrate_database()
+            if not self.db_manager.initialize_database():
+                self.db_manager.close()
+                messagebox.showerror("خطای راه‌اندازی دیتابیس", "ساخت جداول دیتابیس ممکن نشد! برنامه بسته خواهد شد.", master=self)
+                return False
             self.db_manager.close() 
             return True
         except Exception as e:
@@ -373,12 +406,26 @@ class MainApplication(ctk.CTk):
             return False
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # پروسه‌های کارگر batch_renderer در نسخه exe
+    tracer = StartupTracer.shared()
+    tracer.enable_from_args(sys.argv) # python main_app.py --trace-startup
     app = MainApplication()
     
     # قبل از تنظیم پروتکل یا شروع mainloop، دیتابیس را راه‌اندازی کن
-    if not app._initialize_database():
+    with tracer.phase("database_init"):
+        database_ready = app._initialize_database()
+    if not database_ready:
         # اگر راه‌اندازی دیتابیس موفقیت آمیز نبود، برنامه را بدون خطا بستن
         sys.exit(1) # یا app.quit() اگر نیاز به مدیریت خاص‌تر بود
 
     app.protocol("WM_DELETE_WINDOW", app.on_closing)
+    # شروع برنامه با اولین idle حلقه رویداد (بعد از رسم پنجره) تمام می‌شود
+    mainloop_start = time.perf_counter()
+    def finish_startup_trace():
+        tracer.record("first_idle", mainloop_start)
+        tracer.finish(app.app_version_string)
+    app.after_idle(finish_startup_trace)
+    # ثبت پشته نخ اصلی وقتی حلقه رویداد بیش از آستانه قفل بماند (EASYINVOICE_STALL_MS یا --stall-ms=N؛ 0 = خاموش)
+    app.stall_watchdog.configure_from_args(sys.argv)
+    app.stall_watchdog.start()
     app.mainloop()
\ No newline at end of file
@@ -1,4 +1,5 @@
 # models.py
+import hashlib
 import json 
 
 class AppSettings:
@@ -224,6 +225,18 @@ class InvoiceItem:
         return cls(**data)
 
 
+class InvoiceBundle:
+    """ همه داده‌های لازم برای نمایش/چاپ مجدد یک صورتحساب که یک‌جا از دیتابیس خوانده می‌شوند """
+    def __init__(self, invoice=None, customer=None, contract=None, items=None,
+                 service_descriptions=None, settings=None):
+        self.invoice = invoice
+        self.customer = customer
+        self.contract = contract # اگر صورتحساب قرارداد نداشته باشد None است
+        self.items = items if items is not None else []
+        self.service_descriptions = service_descriptions if service_descriptions is not None else {} # service_id -> description
+        self.settings = settings
+
+
 # اضافه شد: مدل InvoiceTemplate
 class InvoiceTemplate:
     """ مدل داده‌ای برای قالب‌های صورتحساب """
@@ -275,6 +288,18 @@ class InvoiceTemplate:
             "background_opacity": self.background_opacity
         }
 
+    def version_key(self):
+        """ اثر انگشت محتوای قالب (تنظیمات، تصاویر و شفافیت)؛ با هر ویرایش قالب عوض می‌شود و کلید کش‌های رندر است """
+        content = {
+            "template_settings": self.template_settings,
+            "header_image_path": self.header_image_path,
+            "footer_image_path": self.footer_image_path,
+            "background_image_path": self.background_image_path,
+            "background_opacity": self.background_opacity,
+        }
+        serialized = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(serialized.encode("utf-8")).hexdigest()
+
     @classmethod
     def from_dict(cls, data):
         # مطمئن شوید که فیلدهای JSON به درستی از رشته به دیکشنری/لیست تبدیل می‌شوند
@@ -0,0 +1,62 @@
+# service_catalog.py
+import os
+import threading
+from db_manager import DBManager, DATABASE_NAME
+from models import Service
+from change_events import ChangeEventBus, SERVICE
+
+class ServiceCatalog:
+    """
+    کش مشترک خدمات (شناسه -> Service) برای کل برنامه.
+    هر رویداد تغییر خدمت (ChangeEventBus) نسخه را افزایش می‌دهد و کش در اولین خواندن بعدی
+    با یک کوئری دوباره بارگذاری می‌شود.
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), DATABASE_NAME)
+        self.db_manager = DBManager(db_path)
+        self._lock = threading.Lock()
+        self._services = {}
+        self._version = 0
+        self._loaded_version = None
+
+    @classmethod
+    def shared(cls):
+        """ نمونه مشترک کش در کل پروسه """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+                ChangeEventBus.shared().subscribe(SERVICE, cls._shared.invalidate)
+            return cls._shared
+
+    def invalidate(self, event=None):
+        """ علامت‌گذاری کش به عنوان منقضی (بعد از تغییر جدول Services) """
+        with self._lock:
+            self._version += 1
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._loaded_version == self._version:
+                return self._services
+            version = self._version
+            if not self.db_manager.connect():
+                return self._services
+            cursor = self.db_manager.execute_query("SELECT id, service_code, description FROM Services ORDER BY id")
+            if cursor:
+                self._services = {row['id']: Service.from_dict(dict(row)) for row in cursor.fetchall()}
+                self._loaded_version = version
+            self.db_manager.close()
+            return self._services
+
+    def get_service(self, service_id):
+        return self._ensure_loaded().get(service_id)
+
+    def get_description(self, service_id):
+        service = self.get_service(service_id)
+        return service.description if service else None
+
+    def get_all_services(self):
+        """ لیست همه خدمات (مرتب بر اساس شناسه، مثل خروجی ServiceManager.get_all_services) """
+        return list(self._ensure_loaded().values())
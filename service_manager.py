@@ -4,6 +4,7 @@ import os
 import sqlite3
 from db_manager import DBManager, DATABASE_NAME
 from models import Service
+from change_events import ChangeEventBus, SERVICE, INSERT, UPDATE, DELETE
 
 class ServiceManager:
     def __init__(self):
@@ -24,8 +25,10 @@ class ServiceManager:
         self.db_manager.close()
         return next_code
 
-    def add_service(self, service: Service):
-        """ اضافه کردن یک خدمت جدید به دیتابیس """
+    def add_service(self, service: Service | list[Service]):
+        """ اضافه کردن یک خدمت جدید (یا لیستی از خدمات به صورت دسته‌ای) به دیتابیس """
+        if isinstance(service, list):
+            return self._add_services_batch(service)
         if not self.db_manager.connect():
             return False, "خطا در اتصال به دیتابیس."
         try:
@@ -46,18 +49,60 @@ class ServiceManager:
             )
             self.db_manager.close()
             if cursor:
+                service.id = cursor.lastrowid
+                ChangeEventBus.shared().publish(SERVICE, service.id, INSERT)
                 return True, "خدمت با موفقیت اضافه شد."
             else:
                 return False, "خطا در اضافه کردن خدمت."
         except sqlite3.IntegrityError as e:
             self.db_manager.close()
-            # unique constraint failed: Services.description, Services.settlement_type
-            if "UNIQUE constraint failed: Services.description" in str(e): # اصلاح شد
-                return False, "این شرح خدمت قبلاً ثبت شده است."
-            elif "UNIQUE constraint failed: Services.service_code" in str(e):
-                return False, "کد خدمت وارد شده تکراری است."
-            else:
-                return False, f"خطای تکراری بودن داده: {e}"
+            return False, self._integrity_error_message(e)
+        except Exception as e:
+            self.db_manager.close()
+            return False, f"خطای ناشناخته در اضافه کردن خدمت: {e}"
+
+    def _integrity_error_message(self, e):
+        """ پیام کاربرپسند برای خطای UNIQUE جدول Services """
+        # unique constraint failed: Services.description, Services.settlement_type
+        if "UNIQUE constraint failed: Services.description" in str(e): # اصلاح شد
+            return "این شرح خدمت قبلاً ثبت شده است."
+        elif "UNIQUE constraint failed: Services.service_code" in str(e):
+            return "کد خدمت وارد شده تکراری است."
+        else:
+            return f"خطای تکراری بودن داده: {e}"
+
+    def _add_services_batch(self, services):
+        """
+        درج دسته‌ای خدمات با executemany در یک تراکنش.
+        برای خدمات بدون کد، کدها پشت سر هم تولید می‌شوند و شناسه‌های جدید روی آبجکت‌ها ست می‌شوند.
+        """
+        if not services:
+            return True, "خدمتی برای افزودن وجود ندارد."
+        if not self.db_manager.connect():
+            return False, "خطا در اتصال به دیتابیس."
+        try:
+            with self.db_manager.transaction():
+                row = self.db_manager.execute("SELECT MAX(service_code) FROM Services").fetchone()
+                next_code = int(row[0]) + 1 if row and row[0] is not None else 1001
+                params_seq = []
+                for service in services:
+                    if service.service_code is None:
+                        service.service_code = next_code
+                        next_code += 1
+                    params_seq.append((service.service_code, service.description))
+                new_ids = self.db_manager.insert_many(
+                    "INSERT INTO Services (service_code, description) VALUES (?, ?)", params_seq
+                )
+            for service, new_id in zip(services, new_ids):
+                service.id = new_id
+            self.db_manager.close()
+            bus = ChangeEventBus.shared()
+            for new_id in new_ids:
+                bus.publish(SERVICE, new_id, INSERT)
+            return True, f"{len(services)} خدمت با موفقیت اضافه شد."
+        except sqlite3.IntegrityError as e:
+            self.db_manager.close()
+            return False, self._integrity_error_message(e)
         except Exception as e:
             self.db_manager.close()
             return False, f"خطای ناشناخته در اضافه کردن خدمت: {e}"
@@ -75,6 +120,29 @@ class ServiceManager:
         self.db_manager.close()
         return services, "خدمات با موفقیت بازیابی شد."
 
+    def list_services(self, after=None, limit=500):
+        """
+        صفحه‌بندی keyset خدمات به ترتیب id.
+        after: id آخرین خدمت صفحه قبل یا None برای صفحه اول.
+        """
+        if not self.db_manager.connect():
+            return [], "خطا در اتصال به دیتابیس."
+        cursor = self.db_manager.execute_query(
+            "SELECT id, service_code, description FROM Services WHERE id > ? ORDER BY id LIMIT ?",
+            (after if after is not None else -1, limit)
+        )
+        services = []
+        if cursor:
+            services = [Service.from_dict(dict(row)) for row in cursor.fetchall()]
+        self.db_manager.close()
+        return services, "خدمات با موفقیت بازیابی شد."
+
+    def iter_services(self, batch_size=500):
+        """ پیمایش جریانی همه خدمات (با fetchmany) بدون نگه داشتن کل جدول در حافظه """
+        query = "SELECT id, service_code, description FROM Services ORDER BY id"
+        for row in self.db_manager.iter_query(query, batch_size=batch_size):
+            yield Service.from_dict(dict(row))
+
     def get_service_by_id(self, service_id: int):
         """ بازیابی یک خدمت بر اساس شناسه """
         if not self.db_manager.connect():
@@ -100,18 +168,13 @@ class ServiceManager:
             )
             self.db_manager.close()
             if cursor and cursor.rowcount > 0:
+                ChangeEventBus.shared().publish(SERVICE, service.id, UPDATE)
                 return True, "خدمت با موفقیت بروزرسانی شد."
             else:
                 return False, "خدمت مورد نظر یافت نشد یا تغییری اعمال نشد."
         except sqlite3.IntegrityError as e:
             self.db_manager.close()
-            # UNIQUE constraint failed: Services.description, Services.settlement_type
-            if "UNIQUE constraint failed: Services.description" in str(e): # اصلاح شد
-                return False, "این شرح خدمت قبلاً ثبت شده است."
-            elif "UNIQUE constraint failed: Services.service_code" in str(e):
-                return False, "کد خدمت وارد شده تکراری است."
-            else:
-                return False, f"خطای تکراری بودن داده: {e}"
+            return False, self._integrity_error_message(e)
         except Exception as e:
             self.db_manager.close()
             return False, f"خطای ناشناخته در بروزرسانی خدمت: {e}"
@@ -123,6 +186,7 @@ class ServiceManager:
         cursor = self.db_manager.execute_query("DELETE FROM Services WHERE id = ?", (service_id,))
         self.db_manager.close()
         if cursor and cursor.rowcount > 0:
+            ChangeEventBus.shared().publish(SERVICE, service_id, DELETE)
             return True, "خدمت با موفقیت حذف شد."
         else:
             return False, "خدمت مورد نظر یافت نشد."
@@ -4,6 +4,7 @@ import sys
 
 from db_manager import DBManager, DATABASE_NAME, DATABASE_SCHEMA_VERSION 
 from models import AppSettings, Service # Service اضافه شد تا بتونیم در متد جدید ازش استفاده کنیم
+from service_catalog import ServiceCatalog
 
 class SettingsManager:
     def __init__(self):
@@ -53,19 +54,8 @@ class SettingsManager:
     # تا invoice_generator و invoice_ui بتوانند توضیحات سرویس را بخوانند
     # اگرچه از نظر معماری ایده آل نیست، اما در حال حاضر مشکل را حل می‌کند.
     def get_service_description_by_id(self, service_id: int):
-        """ بازیابی توضیحات سرویس بر اساس شناسه سرویس. """
-        if not self.db_manager.connect():
-            return None
-        
-        query = "SELECT description FROM Services WHERE id = ?"
-        cursor = self.db_manager.execute_query(query, (service_id,))
-        description = None
-        if cursor:
-            row = cursor.fetchone()
-            if row:
-                description = row['description']
-        self.db_manager.close()
-        return description
+        """ بازیابی توضیحات سرویس بر اساس شناسه سرویس (از کش مشترک خدمات). """
+        return ServiceCatalog.shared().get_description(service_id)
 
 
 # --- بلاک تست مستقل ---
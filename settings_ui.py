@@ -2,9 +2,7 @@
 import customtkinter as ctk
 from tkinter import messagebox, filedialog, ttk
 import os
-from PIL import Image, ImageTk 
 import json
-from bs4 import BeautifulSoup 
 import re 
 from collections import defaultdict 
 
@@ -13,6 +11,8 @@ from service_manager import ServiceManager
 from models import AppSettings, Service, InvoiceTemplate 
 from db_manager import DBManager, DATABASE_NAME
 from invoice_template_manager import InvoiceTemplateManager 
+from change_events import ChangeEventBus, SERVICE, INVOICE_TEMPLATE, DELETE
+from startup_tracer import StartupTracer
 
 class InvoiceTemplatePreviewWindow(ctk.CTkToplevel):
     def __init__(self, master, template: InvoiceTemplate, ui_colors, base_font, heading_font):
@@ -54,6 +54,7 @@ class InvoiceTemplatePreviewWindow(ctk.CTkToplevel):
         close_btn.pack(pady=5)
 
     def draw_preview(self):
+        from PIL import Image, ImageTk # فقط هنگام پیش‌نمایش قالب لازم است
         self.canvas.delete("all")
         self.canvas_image_refs = [] # Clear image references
 
@@ -329,6 +330,7 @@ class SettingsUI(ctk.CTkFrame):
         sub_buttons_container.grid_columnconfigure(0, weight=0)
         sub_buttons_container.grid_columnconfigure(1, weight=0)
         sub_buttons_container.grid_columnconfigure(2, weight=0) 
+        sub_buttons_container.grid_columnconfigure(3, weight=0)
         sub_buttons_container.grid_rowconfigure(0, weight=1)
         
         self.seller_info_btn = ctk.CTkButton(sub_buttons_container, text="اطلاعات فروشنده", 
@@ -338,7 +340,7 @@ class SettingsUI(ctk.CTkFrame):
                                               hover_color=self.ui_colors["hover_light_blue"],
                                               corner_radius=8,
                                               command=lambda: self.on_sub_nav_button_click("seller_info", self.seller_info_btn))
-        self.seller_info_btn.grid(row=0, column=2, padx=5, pady=10)
+        self.seller_info_btn.grid(row=0, column=3, padx=5, pady=10)
 
         self.service_types_btn = ctk.CTkButton(sub_buttons_container, text="انواع خدمات", 
                                                 font=self.nav_button_font, 
@@ -347,7 +349,7 @@ class SettingsUI(ctk.CTkFrame):
                                                 hover_color=self.ui_colors["hover_light_blue"],
                                                 corner_radius=8,
                                                 command=lambda: self.on_sub_nav_button_click("service_types", self.service_types_btn))
-        self.service_types_btn.grid(row=0, column=1, padx=5, pady=10)
+        self.service_types_btn.grid(row=0, column=2, padx=5, pady=10)
 
         self.invoice_templates_btn = ctk.CTkButton(sub_buttons_container, text="مدیریت قالب صورتحساب", 
                                                 font=self.nav_button_font, 
@@ -356,7 +358,16 @@ class SettingsUI(ctk.CTkFrame):
                                                 hover_color=self.ui_colors["hover_light_blue"],
                                                 corner_radius=8,
                                                 command=lambda: self.on_sub_nav_button_click("invoice_templates", self.invoice_templates_btn))
-        self.invoice_templates_btn.grid(row=0, column=0, padx=5, pady=10)
+        self.invoice_templates_btn.grid(row=0, column=1, padx=5, pady=10)
+
+        self.startup_trace_btn = ctk.CTkButton(sub_buttons_container, text="زمان شروع برنامه", 
+                                                font=self.nav_button_font, 
+                                                fg_color=self.ui_colors["white"], 
+                                                text_color=self.ui_colors["text_medium_gray"],
+                                                hover_color=self.ui_colors["hover_light_blue"],
+                                                corner_radius=8,
+                                                command=lambda: self.on_sub_nav_button_click("startup_trace", self.startup_trace_btn))
+        self.startup_trace_btn.grid(row=0, column=0, padx=5, pady=10)
 
 
         self.settings_content_frame = ctk.CTkFrame(settings_card_frame, fg_color="white") 
@@ -376,6 +387,10 @@ class SettingsUI(ctk.CTkFrame):
         self.frames["invoice_templates"] = self.invoice_templates_page
         self.invoice_templates_page.grid(row=0, column=0, sticky="nsew")
 
+        self.startup_trace_page = self.create_startup_trace_view(self.settings_content_frame)
+        self.frames["startup_trace"] = self.startup_trace_page
+        self.startup_trace_page.grid(row=0, column=0, sticky="nsew")
+
 
         self.show_sub_frame("seller_info")
 
@@ -546,6 +561,8 @@ class SettingsUI(ctk.CTkFrame):
         tree_style.configure("Treeview.Heading", font=self.button_font) 
         tree_style.layout("Treeview", [('Treeview.treearea', {'sticky': 'nsew'})]) 
 
+        # بعد از افزودن/ویرایش/حذف فقط همان ردیف جدول به‌روز می‌شود
+        ChangeEventBus.shared().subscribe_widget(self.service_table, SERVICE, self.on_service_changed)
         self.load_services_to_table() 
         
         return service_types_frame 
@@ -712,11 +729,67 @@ class SettingsUI(ctk.CTkFrame):
         tree_style.configure("Treeview.Heading", font=self.button_font) 
         tree_style.layout("Treeview", [('Treeview.treearea', {'sticky': 'nsew'})]) 
 
+        ChangeEventBus.shared().subscribe_widget(self.template_table, INVOICE_TEMPLATE, self.on_template_changed)
         self.load_invoice_templates_to_table()
         self.clear_template_form()
         
         return template_types_frame
 
+    def create_startup_trace_view(self, parent_frame):
+        """ خلاصه زمان‌بندی شروع برنامه: مراحل اجرای فعلی و تاریخچه اجراهای ردیابی شده (StartupTracer) """
+        trace_frame = ctk.CTkFrame(parent_frame, fg_color="white")
+        trace_frame.grid_columnconfigure(0, weight=1)
+        trace_frame.grid_rowconfigure(2, weight=1)
+        trace_frame.grid_rowconfigure(4, weight=1)
+
+        self.startup_trace_status_label = ctk.CTkLabel(trace_frame, text="", font=self.base_font, justify="right",
+                                                       text_color=self.ui_colors["text_dark_gray"])
+        self.startup_trace_status_label.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="e")
+
+        ctk.CTkLabel(trace_frame, text="مراحل شروع برنامه در این اجرا", font=self.button_font,
+                     text_color=self.ui_colors["text_dark_gray"]).grid(row=1, column=0, padx=10, pady=5, sticky="e")
+        self.startup_phase_table = ttk.Treeview(trace_frame, columns=("Duration", "Start", "Phase"), show="headings", height=8)
+        self.startup_phase_table.heading("Duration", text="مدت (ms)", anchor="e")
+        self.startup_phase_table.heading("Start", text="شروع (ms)", anchor="e")
+        self.startup_phase_table.heading("Phase", text="مرحله", anchor="e")
+        self.startup_phase_table.column("Duration", width=100, anchor="e", stretch=False)
+        self.startup_phase_table.column("Start", width=100, anchor="e", stretch=False)
+        self.startup_phase_table.column("Phase", width=250, anchor="e", stretch=True)
+        self.startup_phase_table.grid(row=2, column=0, padx=10, pady=5, sticky="nsew")
+
+        ctk.CTkLabel(trace_frame, text="تاریخچه اجراهای ردیابی شده", font=self.button_font,
+                     text_color=self.ui_colors["text_dark_gray"]).grid(row=3, column=0, padx=10, pady=5, sticky="e")
+        self.startup_history_table = ttk.Treeview(trace_frame, columns=("Total", "Version", "RecordedAt"), show="headings", height=6)
+        self.startup_history_table.heading("Total", text="کل (ms)", anchor="e")
+        self.startup_history_table.heading("Version", text="نسخه", anchor="e")
+        self.startup_history_table.heading("RecordedAt", text="زمان اجرا", anchor="e")
+        self.startup_history_table.column("Total", width=100, anchor="e", stretch=False)
+        self.startup_history_table.column("Version", width=120, anchor="e", stretch=False)
+        self.startup_history_table.column("RecordedAt", width=200, anchor="e", stretch=True)
+        self.startup_history_table.grid(row=4, column=0, padx=10, pady=5, sticky="nsew")
+
+        return trace_frame
+
+    def load_startup_trace(self):
+        """ پر کردن جدول‌های خلاصه زمان‌بندی شروع برنامه """
+        tracer = StartupTracer.shared()
+        total_text = f"{tracer.total_ms:,.0f} ms" if tracer.total_ms is not None else "نامشخص"
+        if tracer.enabled:
+            status = f"زمان شروع این اجرا: {total_text}\nگزارش JSON: {tracer.report_path}"
+        else:
+            status = (f"زمان شروع این اجرا: {total_text}\nبرای ذخیره گزارش JSON و تاریخچه، برنامه را با "
+                      f"{StartupTracer.CLI_FLAG} یا متغیر محیطی {StartupTracer.ENV_VAR}=1 اجرا کنید.")
+        self.startup_trace_status_label.configure(text=status)
+
+        self.startup_phase_table.delete(*self.startup_phase_table.get_children())
+        for phase in tracer.phases:
+            self.startup_phase_table.insert("", "end", values=(f"{phase['duration_ms']:,.1f}", f"{phase['start_ms']:,.1f}", phase["name"]))
+
+        self.startup_history_table.delete(*self.startup_history_table.get_children())
+        for entry in tracer.load_history():
+            total = f"{entry['total_ms']:,.0f}" if entry.get("total_ms") is not None else ""
+            self.startup_history_table.insert("", "end", values=(total, entry.get("version") or "", entry.get("recorded_at") or ""))
+
     def select_image_file(self, target_var):
         """ باز کردن دیالوگ انتخاب فایل برای تصاویر (هدر، فوتر، بک‌گراند) """
         file_path = filedialog.askopenfilename(
@@ -742,6 +815,7 @@ class SettingsUI(ctk.CTkFrame):
 
     def display_logo_preview(self, file_path):
         """ نمایش پیش‌نمایش لوگو در UI (متد موجود) """
+        from PIL import Image
         try:
             image_pil = Image.open(file_path)
             image_pil = image_pil.resize((50, 50), Image.LANCZOS)
@@ -818,14 +892,41 @@ class SettingsUI(ctk.CTkFrame):
         for item in self.service_table.get_children():
             self.service_table.delete(item) 
 
-        services, message = self.service_manager.get_all_services()
-        if not services:
-            pass 
-
-        for service in services:
+        # خدمات به صورت جریانی خوانده می‌شوند تا کل جدول یک‌جا در حافظه ساخته نشود
+        for service in self.service_manager.iter_services():
             self.service_table.insert("", "end", iid=service.id, 
                                      values=(service.id, service.service_code, service.description))
 
+    def on_service_changed(self, event):
+        """ اعمال یک رویداد تغییر خدمت روی همان ردیف جدول (بدون بارگذاری دوباره کل جدول) """
+        service = None
+        if event.operation != DELETE:
+            service, _ = self.service_manager.get_service_by_id(event.entity_id)
+        values = (service.id, service.service_code, service.description) if service else None
+        self.apply_row_change(self.service_table, event.entity_id, values) # خدمات به ترتیب id نمایش داده می‌شوند
+
+    @staticmethod
+    def apply_row_change(table, iid, values, sort_index=None):
+        """
+        درج، ویرایش یا حذف یک ردیف جدول؛ values=None یعنی ردیف حذف شده است.
+        sort_index: اندیس ستونی که جدول بر اساس آن مرتب است (None یعنی ردیف جدید در انتها درج می‌شود).
+        """
+        iid = str(iid)
+        if values is None:
+            if table.exists(iid):
+                table.delete(iid)
+            return
+        index = "end"
+        if sort_index is not None:
+            key = str(values[sort_index])
+            index = sum(1 for child in table.get_children()
+                        if child != iid and str(table.item(child, "values")[sort_index]) < key)
+        if table.exists(iid):
+            table.item(iid, values=values)
+            table.move(iid, "", index)
+        else:
+            table.insert("", index, iid=iid, values=values)
+
     def clear_service_form(self):
         """ پاک کردن فیلدهای فرم خدمات و غیرفعال کردن دکمه حذف """
         self.service_description_var.set("")
@@ -863,7 +964,6 @@ class SettingsUI(ctk.CTkFrame):
         if success:
             messagebox.showinfo("موفقیت", message, master=self)
             self.clear_service_form()
-            self.load_services_to_table() 
         else:
             messagebox.showerror("خطا", message, master=self)
 
@@ -876,7 +976,6 @@ class SettingsUI(ctk.CTkFrame):
                 if success:
                     messagebox.showinfo("موفقیت", message, master=self)
                     self.clear_service_form()
-                    self.load_services_to_table()
                 else:
                     messagebox.showerror("خطا", message, master=self)
         else:
@@ -935,6 +1034,7 @@ class SettingsUI(ctk.CTkFrame):
         Returns:
             dict: دیکشنری شامل template_settings در قالب JSON.
         """
+        from bs4 import BeautifulSoup # فقط هنگام وارد کردن قالب HTML بارگذاری می‌شود
         soup = BeautifulSoup(html_content, 'html.parser')
         
         static_text_elements = []
@@ -1128,9 +1228,21 @@ class SettingsUI(ctk.CTkFrame):
             pass
 
         for template in templates:
-            is_active_text = "بله" if template.is_active == 1 else "خیر"
-            self.template_table.insert("", "end", iid=template.id, 
-                                       values=(template.id, template.template_name, template.template_type, is_active_text))
+            self.template_table.insert("", "end", iid=template.id, values=self.template_row_values(template))
+
+    @staticmethod
+    def template_row_values(template):
+        """ مقادیر یک ردیف جدول قالب‌ها به ترتیب ستون‌های Treeview """
+        is_active_text = "بله" if template.is_active == 1 else "خیر"
+        return (template.id, template.template_name, template.template_type, is_active_text)
+
+    def on_template_changed(self, event):
+        """ اعمال یک رویداد تغییر قالب روی همان ردیف جدول (قالب‌ها به ترتیب نام نمایش داده می‌شوند) """
+        template = None
+        if event.operation != DELETE:
+            template, _ = self.invoice_template_manager.get_template_by_id(event.entity_id)
+        self.apply_row_change(self.template_table, event.entity_id,
+                              self.template_row_values(template) if template else None, sort_index=1)
 
     def clear_template_form(self):
         """ پاک کردن فیلدهای فرم قالب صورتحساب و غیرفعال کردن دکمه حذف و پیش نمایش """
@@ -1213,7 +1325,6 @@ class SettingsUI(ctk.CTkFrame):
         if success:
             messagebox.showinfo("موفقیت", message, master=self)
             self.clear_template_form()
-            self.load_invoice_templates_to_table()
         else:
             messagebox.showerror("خطا", message, master=self)
 
@@ -1226,7 +1337,6 @@ class SettingsUI(ctk.CTkFrame):
                 if success:
                     messagebox.showinfo("موفقیت", message, master=self)
                     self.clear_template_form()
-                    self.load_invoice_templates_to_table()
                 else:
                     messagebox.showerror("خطا", message, master=self)
         else:
@@ -1315,6 +1425,8 @@ class SettingsUI(ctk.CTkFrame):
             elif page_name == "invoice_templates":
                 self.load_invoice_templates_to_table()
                 self.clear_template_form()
+            elif page_name == "startup_trace":
+                self.load_startup_trace()
         else:
             messagebox.showwarning("زیرصفحه هنوز پیاده‌سازی نشده", f"زیرصفحه '{page_name}' هنوز در دست ساخت است.", master=self)
 
@@ -1369,6 +1481,14 @@ class SettingsUI(ctk.CTkFrame):
                         border_color=self.ui_colors["active_sub_button_border"]
                     )
                     self.current_active_sub_button = self.invoice_templates_btn
+                elif self.current_active_sub_page_name == "startup_trace":
+                    self.startup_trace_btn.configure(
+                        fg_color=self.ui_colors["active_sub_button_bg"],
+                        text_color=self.ui_colors["active_sub_button_text"],
+                        border_width=2,
+                        border_color=self.ui_colors["active_sub_button_border"]
+                    )
+                    self.current_active_sub_button = self.startup_trace_btn
 
 
 # --- بلاک تست مستقل UI ---
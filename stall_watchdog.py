@@ -0,0 +1,154 @@
+# stall_watchdog.py
+import os
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+
+
+class StallWatchdog:
+    """
+    نگهبان قفل شدن حلقه رویداد Tk.
+    نخ Tk هر HEARTBEAT_MS با after() یک ضربان ثبت می‌کند و یک نخ پس‌زمینه فاصله از آخرین ضربان را
+    بررسی می‌کند. اگر حلقه رویداد بیشتر از آستانه جواب ندهد (کار همگام طولانی روی نخ Tk)، پشته پایتون نخ
+    اصلی با sys._current_frames گرفته و در stall_log.txt (و خروجی کنسول) نوشته می‌شود؛ تا وقتی قفل ادامه
+    دارد هر بار که یک آستانه دیگر می‌گذرد دوباره نمونه گرفته می‌شود و بعد از آزاد شدن، مدت کل قفل هم ثبت می‌شود.
+    آستانه با متغیر محیطی EASYINVOICE_STALL_MS یا پرچم --stall-ms=N تنظیم می‌شود؛ 0 یعنی غیرفعال.
+    """
+    ENV_VAR = "EASYINVOICE_STALL_MS"
+    CLI_FLAG = "--stall-ms"
+    DEFAULT_THRESHOLD_MS = 500
+    HEARTBEAT_MS = 100 # فاصله ضربان‌های حلقه رویداد
+    CHECK_INTERVAL_MS = 50 # فاصله بررسی نخ نگهبان
+    MAX_SAMPLES_PER_STALL = 5 # حداکثر تعداد نمونه پشته در یک قفل طولانی
+    LOG_FILE = "stall_log.txt"
+
+    def __init__(self, root, threshold_ms=None, log_dir=None):
+        self.root = root
+        if threshold_ms is None:
+            threshold_ms = self._threshold_from_env()
+        self.threshold_ms = max(0, threshold_ms)
+        if log_dir is None:
+            if getattr(sys, 'frozen', False):
+                log_dir = os.path.dirname(sys.executable)
+            else:
+                log_dir = os.path.dirname(os.path.abspath(__file__))
+        self.log_path = os.path.join(log_dir, self.LOG_FILE)
+        self.stall_count = 0
+        self._main_thread_id = None
+        self._last_beat = None # زمان monotonic آخرین ضربان (فقط در نخ Tk نوشته می‌شود)
+        self._after_id = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def _threshold_from_env(cls):
+        value = os.environ.get(cls.ENV_VAR, "").strip()
+        if not value:
+            return cls.DEFAULT_THRESHOLD_MS
+        try:
+            return int(value)
+        except ValueError:
+            print(f"Invalid {cls.ENV_VAR} value: {value!r}; using {cls.DEFAULT_THRESHOLD_MS} ms")
+            return cls.DEFAULT_THRESHOLD_MS
+
+    def configure_from_args(self, argv):
+        """ خواندن آستانه از پرچم --stall-ms=N یا --stall-ms N در آرگومان‌های خط فرمان """
+        for index, arg in enumerate(argv):
+            value = None
+            if arg.startswith(self.CLI_FLAG + "="):
+                value = arg.split("=", 1)[1]
+            elif arg == self.CLI_FLAG and index + 1 < len(argv):
+                value = argv[index + 1]
+            if value is not None:
+                try:
+                    self.threshold_ms = max(0, int(value))
+                except ValueError:
+                    print(f"Invalid {self.CLI_FLAG} value: {value!r}")
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def start(self):
+        """ شروع ضربان و نخ نگهبان؛ باید از نخ Tk (نخی که mainloop را اجرا می‌کند) فراخوانی شود """
+        if not self.enabled or self._thread is not None:
+            return
+        self._main_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._beat()
+        self._thread = threading.Thread(target=self._watch, name="StallWatchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._after_id is not None:
+            try:
+                self.root.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+        self._thread = None
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+        try:
+            self._after_id = self.root.after(self.HEARTBEAT_MS, self._beat)
+        except Exception: # پنجره بسته شده
+            self._stop.set()
+
+    def _watch(self):
+        threshold = self.threshold_ms / 1000
+        heartbeat = self.HEARTBEAT_MS / 1000
+        stall_beat = None # آخرین ضربان قبل از قفل فعلی
+        samples = []
+        next_sample = threshold
+        while not self._stop.wait(self.CHECK_INTERVAL_MS / 1000):
+            last_beat = self._last_beat
+            if stall_beat is not None and last_beat != stall_beat:
+                # حلقه رویداد دوباره ضربان زده: قفل تمام شده است
+                self._log_stall_end(last_beat - stall_beat - heartbeat, samples)
+                stall_beat = None
+            # تأخیر عادی یک ضربان جزء قفل حساب نمی‌شود
+            lag = time.monotonic() - last_beat - heartbeat
+            if lag < threshold:
+                continue
+            if stall_beat is None:
+                stall_beat = last_beat
+                samples = []
+                next_sample = threshold
+                self.stall_count += 1
+            if lag >= next_sample and len(samples) < self.MAX_SAMPLES_PER_STALL:
+                site, stack = self._main_thread_stack()
+                samples.append(site)
+                self._log_sample(lag, stack, len(samples))
+                next_sample += threshold
+
+    def _main_thread_stack(self):
+        """ (محل فعلی اجرا در نخ اصلی، متن کامل پشته) """
+        frame = sys._current_frames().get(self._main_thread_id)
+        if frame is None:
+            return "?", "<main thread stack unavailable>\n"
+        site = f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        return site, "".join(traceback.format_stack(frame))
+
+    def _log_sample(self, lag, stack, sample_number):
+        header = (f"[{datetime.now().isoformat(timespec='milliseconds')}] Tk event loop stalled for "
+                  f"{lag * 1000:.0f} ms (stall #{self.stall_count}, sample {sample_number}); main thread stack:")
+        self._write(f"{header}\n{stack}")
+
+    def _log_stall_end(self, duration, samples):
+        sites = list(dict.fromkeys(samples)) # محل‌های تکراری یک بار
+        self._write(f"[{datetime.now().isoformat(timespec='milliseconds')}] stall #{self.stall_count} ended after "
+                    f"{duration * 1000:.0f} ms; blocking site(s): {' | '.join(sites)}\n")
+
+    def _write(self, text):
+        print(text, end="" if text.endswith("\n") else "\n")
+        with self._write_lock:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(text if text.endswith("\n") else text + "\n")
+            except OSError as e:
+                print(f"Error writing stall log to {self.log_path}: {e}")
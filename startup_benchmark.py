@@ -0,0 +1,112 @@
+# startup_benchmark.py
+"""
+بنچمارک زمان ایمپورت در شروع برنامه.
+main_app را چند بار با `python -X importtime` ایمپورت می‌کند (بدون باز کردن پنجره) و در این حالت‌ها
+با کد خروج 1 شکست می‌خورد:
+  - زمان تجمعی ایمپورت main_app از بودجه (یا از baseline ذخیره شده به اضافه تلورانس) بیشتر شود؛
+  - یکی از ماژول‌های سنگینی که باید تنبل بارگذاری شوند در مسیر شروع برنامه ایمپورت شود.
+
+مثال:
+    python startup_benchmark.py
+    python startup_benchmark.py --runs 10 --budget-ms 400
+    python startup_benchmark.py --update-baseline   # ذخیره نتیجه فعلی در startup_baseline.json
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+MAIN_MODULE = "main_app"
+DEFAULT_RUNS = 5
+DEFAULT_BUDGET_MS = 600
+DEFAULT_TOLERANCE = 0.20 # افزایش مجاز نسبت به baseline
+BASELINE_FILE = "startup_baseline.json"
+# این ماژول‌ها نباید در مسیر شروع برنامه ایمپورت شوند (بعد از نمایش پنجره در پس‌زمینه بارگذاری می‌شوند)
+DEFERRED_MODULES = (
+    "fitz", "PIL", "reportlab", "jdatetime", "bs4",
+    "settings_ui", "customer_ui", "contract_ui", "invoice_manager_ui",
+    "invoice_main_ui", "invoice_list_ui", "invoice_details_window", "invoice_generator",
+)
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)\s*$")
+
+
+def run_importtime(module_name=MAIN_MODULE):
+    """ یک بار ایمپورت ماژول در یک پروسه تازه؛ خروجی: {نام ماژول: (self_us, cumulative_us)} """
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        cwd=app_dir, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module_name} failed:\n{result.stderr[-2000:]}")
+    timings = {}
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            timings[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    if module_name not in timings:
+        raise RuntimeError(f"no importtime data for {module_name}")
+    return timings
+
+
+def find_deferred(timings):
+    """ ماژول‌های DEFERRED_MODULES (یا زیرماژول‌هایشان) که در مسیر شروع ایمپورت شده‌اند """
+    return sorted(name for name in timings
+                  if any(name == deferred or name.startswith(deferred + ".") for deferred in DEFERRED_MODULES))
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("cumulative_ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if EasyInvoice cold-start import time regresses.")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="number of fresh interpreter runs (min is used)")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="absolute import time budget")
+    parser.add_argument("--baseline", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), BASELINE_FILE))
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed growth over the baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="store the measured time as the new baseline")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest modules to print")
+    args = parser.parse_args(argv)
+
+    runs = [run_importtime() for _ in range(max(args.runs, 1))]
+    best = min(runs, key=lambda timings: timings[MAIN_MODULE][1])
+    cumulative_ms = best[MAIN_MODULE][1] / 1000
+
+    print(f"{MAIN_MODULE} cumulative import time: {cumulative_ms:.1f} ms (best of {len(runs)})")
+    print("slowest modules by self time:")
+    for name, (self_us, cumulative_us) in sorted(best.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {cumulative_us / 1000:8.1f} ms  {name}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"module": MAIN_MODULE, "cumulative_ms": round(cumulative_ms, 1)}, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    failures = []
+    deferred = find_deferred(best)
+    if deferred:
+        failures.append("modules that should load lazily were imported at startup: " + ", ".join(deferred))
+    if cumulative_ms > args.budget_ms:
+        failures.append(f"import time {cumulative_ms:.1f} ms exceeds the budget of {args.budget_ms:.0f} ms")
+    baseline_ms = load_baseline(args.baseline)
+    if baseline_ms is not None and cumulative_ms > baseline_ms * (1 + args.tolerance):
+        failures.append(f"import time {cumulative_ms:.1f} ms regressed more than {args.tolerance:.0%} "
+                        f"over the baseline of {baseline_ms:.1f} ms")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
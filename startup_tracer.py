@@ -0,0 +1,145 @@
+# startup_tracer.py
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# زمان شروع پروسه (تقریبی): main_app این ماژول را قبل از بقیه ایمپورت‌ها ایمپورت می‌کند
+PROCESS_START = time.perf_counter()
+
+
+class StartupTracer:
+    """
+    ثبت مراحل نام‌دار شروع برنامه با زمان‌های monotonic (time.perf_counter) نسبت به شروع پروسه.
+    مراحل همیشه در حافظه ثبت می‌شوند (هزینه ناچیز) تا خلاصه‌شان در صفحه تنظیمات دیده شود. گزارش JSON
+    فقط وقتی نوشته می‌شود که ردیابی با متغیر محیطی EASYINVOICE_TRACE_STARTUP یا پرچم --trace-startup
+    فعال شده باشد؛ خلاصه هر گزارش به startup_history.jsonl هم اضافه می‌شود تا زمان شروع نسخه‌های
+    مختلف برنامه با هم مقایسه شود.
+    """
+    ENV_VAR = "EASYINVOICE_TRACE_STARTUP"
+    CLI_FLAG = "--trace-startup"
+    REPORT_FILE = "startup_trace.json"
+    HISTORY_FILE = "startup_history.jsonl"
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, output_dir=None):
+        if output_dir is None:
+            if getattr(sys, 'frozen', False):
+                output_dir = os.path.dirname(sys.executable)
+            else:
+                output_dir = os.path.dirname(os.path.abspath(__file__))
+        self.report_path = os.path.join(output_dir, self.REPORT_FILE)
+        self.history_path = os.path.join(output_dir, self.HISTORY_FILE)
+        self.enabled = os.environ.get(self.ENV_VAR, "").strip().lower() not in ("", "0", "false", "no")
+        self.version = None
+        self.recorded_at = None
+        self.total_ms = None # زمان رسیدن به اولین idle حلقه رویداد؛ None یعنی شروع برنامه هنوز تمام نشده
+        self._lock = threading.Lock()
+        self._phases = []
+
+    @classmethod
+    def shared(cls):
+        """ نمونه مشترک ردیاب در کل پروسه """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def enable_from_args(self, argv):
+        """ فعال کردن ردیابی در صورت وجود پرچم --trace-startup در آرگومان‌های خط فرمان """
+        if self.CLI_FLAG in argv:
+            self.enabled = True
+
+    @staticmethod
+    def _ms(timestamp):
+        return round((timestamp - PROCESS_START) * 1000, 1)
+
+    def record(self, name, start, end=None):
+        """ ثبت یک مرحله با زمان‌های perf_counter شروع و پایان (پیش‌فرض: الان) """
+        end = time.perf_counter() if end is None else end
+        phase = {"name": name, "start_ms": self._ms(start), "duration_ms": round((end - start) * 1000, 1)}
+        with self._lock:
+            self._phases.append(phase)
+            finished = self.total_ms is not None
+        if finished and self.enabled:
+            self._write_report() # مراحل بعد از شروع (مثلاً ساخت تنبل صفحه‌ها) هم در گزارش می‌آیند
+
+    @contextmanager
+    def phase(self, name):
+        """ اندازه‌گیری یک مرحله: with tracer.phase("database_init"): ... """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+    @property
+    def phases(self):
+        with self._lock:
+            return list(self._phases)
+
+    def finish(self, version=None):
+        """ پایان شروع برنامه (اولین idle حلقه رویداد)؛ در حالت فعال، گزارش و تاریخچه نوشته می‌شوند """
+        with self._lock:
+            if self.total_ms is not None:
+                return
+            self.total_ms = self._ms(time.perf_counter())
+            self.version = version
+            self.recorded_at = datetime.now().isoformat(timespec="seconds")
+        if self.enabled:
+            self._write_report()
+            self._append_history()
+
+    def report(self):
+        """ گزارش کامل به صورت dict (همان محتوای فایل JSON) """
+        return {
+            "version": self.version,
+            "recorded_at": self.recorded_at,
+            "python": sys.version.split()[0],
+            "platform": sys.platform,
+            "frozen": bool(getattr(sys, 'frozen', False)),
+            "total_ms": self.total_ms,
+            "phases": self.phases,
+        }
+
+    def _write_report(self):
+        try:
+            with open(self.report_path, "w", encoding="utf-8") as f:
+                json.dump(self.report(), f, indent=2, ensure_ascii=False)
+        except OSError as e:
+            print(f"Error writing startup trace to {self.report_path}: {e}")
+
+    def _append_history(self):
+        report = self.report()
+        entry = {
+            "version": report["version"], "recorded_at": report["recorded_at"], "total_ms": report["total_ms"],
+            "phases": {phase["name"]: phase["duration_ms"] for phase in report["phases"]},
+        }
+        try:
+            with open(self.history_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Error appending startup history to {self.history_path}: {e}")
+
+    def load_history(self, limit=20):
+        """ آخرین اجراهای ثبت شده در startup_history.jsonl (جدیدترین اول) """
+        if not os.path.exists(self.history_path):
+            return []
+        entries = []
+        try:
+            with open(self.history_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            entries.append(json.loads(line))
+                        except json.JSONDecodeError:
+                            continue # خط ناقص (مثلاً بسته شدن برنامه وسط نوشتن)
+        except OSError as e:
+            print(f"Error reading startup history from {self.history_path}: {e}")
+        return entries[-limit:][::-1]
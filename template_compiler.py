@@ -0,0 +1,315 @@
+# template_compiler.py
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+# کلیدهایی که InvoiceGenerator._populate_template_data برای متن‌های قالب پر می‌کند
+CONTEXT_FIELDS = frozenset((
+    'invoice_number', 'issue_date', 'due_date', 'total_amount', 'discount_percentage', 'tax_percentage',
+    'final_amount', 'invoice_description',
+    'customer_name', 'customer_type', 'customer_address', 'customer_phone', 'customer_phone2', 'customer_mobile',
+    'customer_email', 'customer_tax_id', 'customer_postal_code', 'customer_notes',
+    'seller_name', 'seller_address', 'seller_phone', 'seller_tax_id', 'seller_economic_code', 'seller_logo_path',
+    'contract_number', 'contract_title', 'contract_date', 'contract_total_amount', 'contract_description',
+    'contract_payment_method',
+))
+# فیلدهای هر ردیف جدول آیتم‌ها
+ITEM_FIELDS = frozenset((
+    'item_row_num', 'item_service_description', 'item_quantity', 'item_unit_price', 'item_total_price',
+))
+# ضریب جابجایی x نسبت به عرض متن برای هر تراز (مقدار ناشناخته مثل قبل بدون جابجایی رسم می‌شود)
+ALIGN_ANCHORS = {'left': 0.0, 'center': 0.5, 'right': 1.0}
+
+_PLACEHOLDER_RE = re.compile(r'\{\{([a-zA-Z0-9_]+)\}\}')
+
+
+class TemplateError(ValueError):
+    """ خطای ساختاری template_settings که رندر قالب را غیرممکن می‌کند """
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__("\n".join(self.errors))
+
+
+class TextSlot(namedtuple("TextSlot", "segments keys x y anchor font_size fontname")):
+    """
+    یک متن کامپایل شده: segments زوج‌های (متن ثابت، کلید فیلد یا None) و keys کلیدهای لازم برای پر کردن آن است.
+    x نقطه مرجع تراز و anchor ضریب عرض متن است که از x کم می‌شود؛ فونت از قبل حل شده است.
+    """
+    __slots__ = ()
+
+    @property
+    def is_static(self):
+        return not self.keys
+
+    def fill(self, context):
+        """ متن نهایی با مقادیر context (کلید نبودن = رشته خالی، مثل رفتار قبلی قالب‌ها) """
+        parts = []
+        for literal, key in self.segments:
+            parts.append(literal)
+            if key is not None:
+                value = context.get(key)
+                parts.append('' if value is None else str(value))
+        return "".join(parts)
+
+
+TablePlan = namedtuple("TablePlan", "y_start row_height headers cells item_keys")
+SignaturePlan = namedtuple("SignaturePlan", "labels lines y_cursor")
+
+
+class RenderPlan(namedtuple("RenderPlan", "static_texts dynamic_texts table signature context_keys")):
+    """
+    نقشه رندر تغییرناپذیر یک قالب: static_texts (بدون فیلد، برای صفحه پایه)، dynamic_texts، جدول آیتم‌ها،
+    بلوک امضا و مجموعه کلیدهای context که متن‌ها لازم دارند. رندر یک صورتحساب فقط پر کردن جای خالی‌هاست.
+    """
+    __slots__ = ()
+
+
+EMPTY_PLAN = RenderPlan((), (), None, None, frozenset())
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _Compiler:
+    """ یک بار عبور روی template_settings؛ خطاهای ساختاری در errors و ایرادهای غیرمانع در warnings جمع می‌شوند """
+    def __init__(self, regular_font, bold_font, page_height):
+        self.regular_font = regular_font
+        self.bold_font = bold_font
+        self.page_height = page_height
+        self.errors = []
+        self.warnings = []
+
+    def number(self, config, key, default, where, positive=False):
+        value = config.get(key, default)
+        if not _is_number(value):
+            self.errors.append(f"{where}.{key}: مقدار باید عدد باشد ({value!r}).")
+            return default
+        if positive and value <= 0:
+            self.errors.append(f"{where}.{key}: مقدار باید بزرگتر از صفر باشد ({value!r}).")
+            return default
+        return value
+
+    def anchor(self, config, default, where):
+        align = config.get('align', default)
+        if align not in ALIGN_ANCHORS:
+            self.warnings.append(f"{where}.align: تراز ناشناخته {align!r} (left، right یا center).")
+            return 0.0
+        return ALIGN_ANCHORS[align]
+
+    def font(self, config, default_bold):
+        return self.bold_font if config.get('font_bold', default_bold) else self.regular_font
+
+    def segments(self, text, placeholders, where):
+        """ تقسیم متن به قطعه‌های ثابت و فیلدها؛ فقط placeholderهای اعلام شده جایگزین می‌شوند (مثل قبل) """
+        segments = []
+        keys = []
+        literal = []
+        position = 0
+        for match in _PLACEHOLDER_RE.finditer(text):
+            literal.append(text[position:match.start()])
+            position = match.end()
+            name = match.group(1)
+            if name in placeholders:
+                segments.append(("".join(literal), name))
+                literal = []
+                if name not in keys:
+                    keys.append(name)
+            else:
+                literal.append(match.group(0))
+        literal.append(text[position:])
+        tail = "".join(literal)
+        if tail or not segments:
+            segments.append((tail, None))
+        for name in placeholders:
+            if name not in keys:
+                self.warnings.append(f"{where}: فیلد {name!r} در متن به صورت {{{{{name}}}}} نیامده است.")
+        return tuple(segments), tuple(keys)
+
+    def text_element(self, config, index):
+        where = f"static_text_elements[{index}]"
+        if not isinstance(config, dict):
+            self.errors.append(f"{where}: هر المان متن باید یک شیء JSON باشد.")
+            return None
+        text = config.get('text', '')
+        if not isinstance(text, str):
+            self.errors.append(f"{where}.text: متن باید رشته باشد.")
+            return None
+        placeholders = config.get('field_placeholders', []) or []
+        if not isinstance(placeholders, list) or not all(isinstance(name, str) for name in placeholders):
+            self.errors.append(f"{where}.field_placeholders: باید لیستی از نام فیلدها باشد.")
+            return None
+        for name in placeholders:
+            if name not in CONTEXT_FIELDS:
+                self.warnings.append(f"{where}: فیلد ناشناخته {name!r}.")
+        segments, keys = self.segments(text, placeholders, where)
+        return TextSlot(
+            segments, keys,
+            self.number(config, 'x_pos', 0, where), self.number(config, 'y_pos', 0, where),
+            self.anchor(config, 'right', where), self.number(config, 'font_size', 12, where, positive=True),
+            self.font(config, False),
+        )
+
+    def table(self, table_config):
+        where = "table_configs.invoice_items_table"
+        if not isinstance(table_config, dict):
+            self.errors.append(f"{where}: باید یک شیء JSON باشد.")
+            return None
+        x_start = self.number(table_config, 'x_start', 50, where)
+        y_start = self.page_height - self.number(table_config, 'y_start', 400, where) # HTML top-origin -> PDF
+        self.number(table_config, 'width', 500, where)
+        row_height = self.number(table_config, 'row_height', 20, where, positive=True)
+
+        headers = []
+        for index, header_el in enumerate(self.config_list(table_config, 'header_elements', where)):
+            el_where = f"{where}.header_elements[{index}]"
+            if not isinstance(header_el, dict):
+                self.errors.append(f"{el_where}: باید یک شیء JSON باشد.")
+                continue
+            text = header_el.get('text', '')
+            if not isinstance(text, str):
+                self.errors.append(f"{el_where}.text: متن باید رشته باشد.")
+                continue
+            headers.append(TextSlot(
+                ((text, None),), (), x_start + self.number(header_el, 'x_offset', 0, el_where), y_start,
+                self.anchor(header_el, 'right', el_where), self.number(header_el, 'font_size', 10, el_where, positive=True),
+                self.font(header_el, False),
+            ))
+
+        cells = []
+        for index, field_config in enumerate(self.config_list(table_config, 'item_field_configs', where)):
+            el_where = f"{where}.item_field_configs[{index}]"
+            if not isinstance(field_config, dict):
+                self.errors.append(f"{el_where}: باید یک شیء JSON باشد.")
+                continue
+            field_name = field_config.get('field', '')
+            if not isinstance(field_name, str):
+                self.errors.append(f"{el_where}.field: نام فیلد باید رشته باشد.")
+                continue
+            if field_name not in ITEM_FIELDS:
+                self.warnings.append(f"{el_where}: فیلد ناشناخته ردیف جدول {field_name!r}.")
+            cells.append(TextSlot(
+                (("", field_name),), (field_name,), x_start + self.number(field_config, 'x_offset', 0, el_where), None,
+                self.anchor(field_config, 'right', el_where), self.number(field_config, 'font_size', 10, el_where, positive=True),
+                self.font(field_config, False),
+            ))
+        item_keys = frozenset(cell.keys[0] for cell in cells)
+        return TablePlan(y_start, row_height, tuple(headers), tuple(cells), item_keys)
+
+    def config_list(self, config, key, where):
+        value = config.get(key, [])
+        if not isinstance(value, list):
+            self.errors.append(f"{where}.{key}: باید لیست باشد.")
+            return []
+        return value
+
+    def signature(self, signature_config):
+        where = "signature_block_config"
+        if not isinstance(signature_config, dict):
+            self.errors.append(f"{where}: باید یک شیء JSON باشد.")
+            return None
+        seller_x = self.number(signature_config, 'seller_signature_x', 150, where)
+        seller_y = self.number(signature_config, 'seller_signature_y', 100, where)
+        buyer_x = self.number(signature_config, 'buyer_signature_x', 450, where)
+        buyer_y = self.number(signature_config, 'buyer_signature_y', 100, where)
+        anchor = ALIGN_ANCHORS['center']
+        labels = (
+            TextSlot((("امضا و مهر فروشنده", None),), (), seller_x, seller_y + 15, anchor, 10, self.bold_font),
+            TextSlot((("امضا و مهر خریدار", None),), (), buyer_x, buyer_y + 15, anchor, 10, self.bold_font),
+        )
+        lines = (
+            ((seller_x - 50, seller_y), (seller_x + 50, seller_y)),
+            ((buyer_x - 50, buyer_y), (buyer_x + 50, buyer_y)),
+        )
+        return SignaturePlan(labels, lines, min(seller_y, buyer_y) - 20)
+
+    def compile(self, template_settings):
+        if not template_settings:
+            return EMPTY_PLAN
+        if not isinstance(template_settings, dict):
+            self.errors.append("template_settings باید یک شیء JSON باشد.")
+            return EMPTY_PLAN
+        static_texts, dynamic_texts = [], []
+        for index, element_config in enumerate(self.config_list(template_settings, 'static_text_elements', "template_settings")):
+            slot = self.text_element(element_config, index)
+            if slot is not None:
+                (static_texts if slot.is_static else dynamic_texts).append(slot)
+
+        table = None
+        table_configs = template_settings.get('table_configs', {})
+        if not isinstance(table_configs, dict):
+            self.errors.append("table_configs: باید یک شیء JSON باشد.")
+        elif 'invoice_items_table' in table_configs:
+            table = self.table(table_configs['invoice_items_table'])
+
+        signature = None
+        if 'signature_block_config' in template_settings:
+            signature = self.signature(template_settings['signature_block_config'])
+
+        context_keys = frozenset(key for slot in dynamic_texts for key in slot.keys)
+        return RenderPlan(tuple(static_texts), tuple(dynamic_texts), table, signature, context_keys)
+
+
+def compile_template(template_settings, regular_font, bold_font, page_height):
+    """
+    کامپایل template_settings به RenderPlan. خطاهای ساختاری (مثلاً موقعیت غیر عددی) TemplateError می‌دهند؛
+    ایرادهایی که رندر را متوقف نمی‌کنند (فیلد ناشناخته، تراز نامعتبر) مثل قبل نادیده گرفته می‌شوند.
+    """
+    compiler = _Compiler(regular_font, bold_font, page_height)
+    plan = compiler.compile(template_settings)
+    if compiler.errors:
+        raise TemplateError(compiler.errors)
+    return plan
+
+
+def validate_template_settings(template_settings, page_height=842):
+    """
+    ایرادهای template_settings به صورت (errors, warnings): خطاهای ساختاری که قالب را غیرقابل رندر می‌کنند،
+    و ایرادهای غیرمانع (فیلد یا تراز ناشناخته) که با مقدار خالی یا تراز پیش‌فرض رندر می‌شوند.
+    """
+    compiler = _Compiler("regular", "bold", page_height)
+    compiler.compile(template_settings)
+    return compiler.errors, compiler.warnings
+
+
+class TemplatePlanCache:
+    """
+    کش مشترک RenderPlan قالب‌ها بر اساس (شناسه قالب، InvoiceTemplate.version_key، فونت‌ها، ارتفاع صفحه).
+    با ویرایش قالب version_key عوض می‌شود و نقشه قدیمی دیگر استفاده نمی‌شود تا با LRU بیرون برود.
+    """
+    MAX_ENTRIES = 32
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._plans = OrderedDict()
+
+    @classmethod
+    def shared(cls):
+        """ نمونه مشترک کش در کل پروسه """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def get(self, invoice_template, regular_font, bold_font, page_height, version_key=None):
+        """
+        نقشه رندر قالب (در صورت نبودن در کش کامپایل می‌شود؛ خطای ساختاری TemplateError می‌دهد).
+        version_key نسخه از قبل محاسبه شده قالب است (RenderContext.template_version) تا برای هر رندر دوباره ساخته نشود.
+        """
+        if invoice_template is None:
+            return EMPTY_PLAN
+        key = (invoice_template.id, version_key or invoice_template.version_key(), regular_font, bold_font, page_height)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+        plan = compile_template(invoice_template.template_settings, regular_font, bold_font, page_height)
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > self.MAX_ENTRIES:
+                self._plans.popitem(last=False)
+        return plan
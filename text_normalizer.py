@@ -0,0 +1,29 @@
+# text_normalizer.py
+import re
+
+# یکسان‌سازی حروف و ارقامی که با صفحه‌کلید عربی/فارسی به چند شکل تایپ می‌شوند
+_TRANSLATION_TABLE = str.maketrans({
+    "\u064a": "\u06cc", # ي عربی
+    "\u0649": "\u06cc", # الف مقصوره
+    "\u0643": "\u06a9", # ك عربی
+    "\u200c": " ", # نیم‌فاصله (ZWNJ) مثل فاصله در نظر گرفته می‌شود
+    "\u200f": None, # علامت راست‌به‌چپ
+    "\u200e": None, # علامت چپ‌به‌راست
+    "\u0640": None, # کشیده (تطویل)
+    **{chr(0x064B + i): None for i in range(8)}, # اعراب (فتحه، کسره، ضمه، تنوین، تشدید، سکون)
+    **{chr(0x06F0 + i): str(i) for i in range(10)}, # ارقام فارسی ۰-۹
+    **{chr(0x0660 + i): str(i) for i in range(10)}, # ارقام عربی ٠-٩
+})
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_search_text(text):
+    """
+    کلید جستجوی نرمال شده برای یک متن: ی/ک عربی به فارسی، ارقام فارسی و عربی به لاتین،
+    نیم‌فاصله به فاصله، حذف اعراب و کشیده، یکی کردن فاصله‌ها و حروف کوچک.
+    روی داده‌ها فقط یک بار هنگام نوشتن (وقتی مدیرها ایندکس متنی را به‌روز می‌کنند) و روی عبارت جستجو اجرا می‌شود.
+    """
+    if text is None:
+        return None
+    text = str(text).translate(_TRANSLATION_TABLE)
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
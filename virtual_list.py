@@ -0,0 +1,387 @@
+# virtual_list.py
+from collections import OrderedDict
+from tkinter import ttk
+from change_events import INSERT, UPDATE, DELETE
+
+
+def _natural_key(value):
+    """ کلید مرتب‌سازی یک مقدار نمایشی: عددها (حتی با جداکننده هزارگان) عددی و بقیه متنی """
+    if isinstance(value, (int, float)):
+        return (0, value, "")
+    text = str(value)
+    try:
+        return (0, float(text.replace(",", "")), "")
+    except ValueError:
+        return (1, 0, text.lower())
+
+
+class ListPageSource:
+    """
+    منبع داده در حافظه برای VirtualTreeview (مثلاً نتایج محدود جستجو).
+    rows: لیست (iid, values) به ترتیب پیش‌فرض؛ columns: شناسه ستون‌های Treeview به ترتیب values.
+    مرتب‌سازی روی ستون‌ها در پایتون انجام می‌شود.
+    """
+    def __init__(self, rows, columns):
+        self._original = [(str(iid), tuple(values)) for iid, values in rows]
+        self._rows = self._original
+        self.columns = tuple(columns)
+        self.sort = None
+
+    @property
+    def total(self):
+        return len(self._rows)
+
+    def can_sort(self, column_id):
+        return column_id in self.columns
+
+    def set_sort(self, sort):
+        """ sort: (شناسه ستون، نزولی) یا None برای ترتیب اصلی """
+        if sort == self.sort:
+            return
+        self.sort = sort
+        self._apply_sort()
+
+    def _apply_sort(self):
+        if self.sort is None:
+            self._rows = self._original
+        else:
+            column_id, descending = self.sort
+            index = self.columns.index(column_id)
+            self._rows = sorted(self._original, key=lambda row: _natural_key(row[1][index]), reverse=descending)
+
+    def get_rows(self, start, stop):
+        return self._rows[start:stop]
+
+    def apply_change(self, operation, iid, load_values, columns=None):
+        """
+        اعمال تغییر یک ردیف (change_events.INSERT/UPDATE/DELETE). load_values() مقدار جدید ردیف یا None
+        (اگر دیگر وجود ندارد) را برمی‌گرداند. ردیف جدید ممکن است با جستجوی فعلی جور باشد یا نباشد، پس
+        برای INSERT مقدار False برمی‌گردد تا جستجو دوباره اجرا شود.
+        """
+        if operation == INSERT:
+            return False
+        index = next((i for i, (row_iid, _) in enumerate(self._original) if row_iid == iid), None)
+        if index is None:
+            return True # ردیف در نتایج فعلی نیست
+        values = load_values() if operation == UPDATE else None
+        if values is None:
+            del self._original[index]
+        else:
+            self._original[index] = (iid, tuple(values))
+        self._apply_sort()
+        return True
+
+    def invalidate(self):
+        """ داده‌های وابسته (مثلاً نام مشتری در ردیف‌ها) تغییر کرده‌اند؛ نتایج باید دوباره جستجو شوند """
+        return False
+
+
+class KeysetPageSource:
+    """
+    منبع داده صفحه‌بندی شده از دیتابیس برای VirtualTreeview.
+    fetch_page: متد page_* یک مدیر با امضای (sort, descending, after, before, offset, limit) که
+    ([(key, obj)], پیام) برمی‌گرداند. row_values(obj) مقدار (iid, values) ردیف را می‌سازد.
+    sort_columns: شناسه ستون Treeview -> نام ستون مرتب‌سازی مدیر؛ default_sort: (نام ستون مدیر، نزولی).
+    صفحه‌ها با کلید صفحه همسایه (keyset) خوانده می‌شوند و فقط برای پرش‌های دور از offset استفاده می‌شود.
+    filtered: منبع نتایج یک جستجو است (fetch_page مثلاً page_search با عبارت جستجو)، پس درج و حذف و
+    ویرایش‌ها ممکن است عضویت ردیف‌ها در نتایج را عوض کنند.
+    """
+    PAGE_SIZE = 200
+    MAX_CACHED_PAGES = 50
+
+    def __init__(self, fetch_page, total, row_values, sort_columns, default_sort, sort=None, filtered=False):
+        self.fetch_page = fetch_page
+        self.total = total
+        self.row_values = row_values
+        self.sort_columns = dict(sort_columns)
+        self.default_sort = default_sort
+        self.filtered = filtered
+        self.sort = None
+        self._pages = OrderedDict() # شماره صفحه -> [(key, (iid, values))]، به ترتیب آخرین استفاده
+        self.set_sort(sort)
+
+    def can_sort(self, column_id):
+        return column_id in self.sort_columns
+
+    def _sort_column_id(self):
+        """ شناسه ستون Treeview که ترتیب فعلی بر اساس آن است (None اگر ستون پیش‌فرض در جدول نیست) """
+        if self.sort is not None:
+            return self.sort[0]
+        return next((column_id for column_id, name in self.sort_columns.items() if name == self.default_sort[0]), None)
+
+    def apply_change(self, operation, iid, load_values, columns):
+        """
+        اعمال تغییر یک ردیف (change_events.INSERT/UPDATE/DELETE) بدون بارگذاری دوباره کل جدول.
+        ویرایشی که ستون مرتب‌سازی را عوض نکند در همان صفحه کش شده جایگزین می‌شود؛ در بقیه حالت‌ها
+        (درج، حذف یا جابجا شدن ردیف) فقط تعداد کل اصلاح و کش صفحه‌ها خالی می‌شود تا صفحه‌های
+        قابل مشاهده با کلید تازه خوانده شوند. columns: شناسه ستون‌های Treeview به ترتیب values.
+        در منبع filtered، مثل ListPageSource، درج و حذف و ویرایشی که در جا انجام نشود False برمی‌گرداند
+        تا جستجو (و تعداد نتایج) دوباره گرفته شود.
+        """
+        if operation == UPDATE and self._replace_row(iid, load_values, columns):
+            return True
+        if self.filtered:
+            return False
+        if operation == INSERT:
+            self.total += 1
+        elif operation == DELETE:
+            self.total = max(self.total - 1, 0)
+        self._pages.clear()
+        return True
+
+    def _replace_row(self, iid, load_values, columns):
+        """ جایگزینی ردیف ویرایش شده در صفحه کش شده، اگر مقدار ستون مرتب‌سازی‌اش عوض نشده باشد """
+        column_id = self._sort_column_id()
+        sort_index = columns.index(column_id) if column_id in columns else None
+        for page in self._pages.values():
+            for position, (key, (row_iid, old_values)) in enumerate(page):
+                if row_iid != iid:
+                    continue
+                values = load_values()
+                if values is not None and sort_index is not None and values[sort_index] == old_values[sort_index]:
+                    page[position] = (key, (iid, tuple(values)))
+                    return True
+                return False
+        return False
+
+    def invalidate(self):
+        """
+        خالی کردن کش صفحه‌ها (مثلاً بعد از تغییر نام مشتری که در ردیف‌ها نمایش داده می‌شود). در منبع filtered
+        نتایج ممکن است عوض شده باشند، پس مثل ListPageSource مقدار False برمی‌گردد تا جستجو دوباره اجرا شود.
+        """
+        self._pages.clear()
+        return not self.filtered
+
+    def set_sort(self, sort):
+        """ sort: (شناسه ستون، نزولی) یا None برای مرتب‌سازی پیش‌فرض """
+        if sort is not None and not self.can_sort(sort[0]):
+            sort = None
+        if sort == self.sort:
+            return
+        self.sort = sort
+        self._pages.clear()
+
+    def get_rows(self, start, stop):
+        stop = min(stop, self.total)
+        rows = []
+        if start >= stop:
+            return rows
+        size = self.PAGE_SIZE
+        for number in range(start // size, (stop - 1) // size + 1):
+            page = self._page(number)
+            rows.extend(row for _, row in page[max(start - number * size, 0):stop - number * size])
+        return rows
+
+    def _page(self, number):
+        page = self._pages.get(number)
+        if page is not None:
+            self._pages.move_to_end(number)
+            return page
+        if self.sort is None:
+            sort, descending = self.default_sort
+        else:
+            sort, descending = self.sort_columns[self.sort[0]], self.sort[1]
+        size = self.PAGE_SIZE
+        # نزدیک‌ترین صفحه کش شده در هر طرف؛ خواندن از کلید آن فقط فاصله بین دو صفحه را پیمایش می‌کند
+        below = max((n for n, rows in self._pages.items() if n < number and rows), default=None)
+        above = min((n for n, rows in self._pages.items() if n > number and rows), default=None)
+        if below is not None and (above is None or number - below <= above - number):
+            position = dict(after=self._pages[below][-1][0], offset=(number - below - 1) * size)
+        elif above is not None:
+            position = dict(before=self._pages[above][0][0], offset=(above - number - 1) * size)
+        else:
+            position = dict(offset=number * size)
+        rows, _ = self.fetch_page(sort, descending, limit=size, **position)
+        page = []
+        for key, obj in rows:
+            iid, values = self.row_values(obj)
+            page.append((key, (str(iid), tuple(values)))) # Treeview شناسه‌ها را به صورت رشته برمی‌گرداند
+        self._pages[number] = page
+        while len(self._pages) > self.MAX_CACHED_PAGES:
+            self._pages.popitem(last=False)
+        return page
+
+
+class VirtualTreeview:
+    """
+    نمایش مجازی برای یک ttk.Treeview موجود: فقط ردیف‌های قابل مشاهده در جدول درج می‌شوند و با
+    اسکرول (اسکرول‌بار، چرخ ماوس، کلیدهای جهت) از منبع داده (KeysetPageSource یا ListPageSource)
+    خوانده می‌شوند. کلیک روی سربرگ ستون مرتب‌سازی را به منبع داده می‌سپارد (در KeysetPageSource یعنی SQL).
+    باید بعد از تنظیم سربرگ‌ها و اسکرول‌بار جدول ساخته شود.
+    """
+    SORT_ARROWS = {False: " ▲", True: " ▼"}
+    WHEEL_ROWS = 3 # تعداد ردیف‌های هر گام چرخ ماوس
+
+    def __init__(self, tree, scrollbar):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.source = None
+        self.top = 0 # اندیس اولین ردیف نمایش داده شده در منبع داده
+        self.sort = None # (شناسه ستون، نزولی) انتخاب شده توسط کاربر
+        self.visible_rows = max(int(tree.cget("height")), 1)
+        self._render_id = None
+        self.columns = tuple(tree["columns"])
+        self._headings = {column_id: tree.heading(column_id, "text") for column_id in self.columns}
+        for column_id in tree["columns"]:
+            tree.heading(column_id, command=lambda column_id=column_id: self.sort_by(column_id))
+        tree.configure(yscrollcommand="")
+        scrollbar.configure(command=self._on_scrollbar)
+        tree.bind("<Configure>", self._on_configure, add="+")
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            tree.bind(sequence, self._on_mousewheel, add="+")
+        for sequence in ("<Up>", "<Down>", "<Prior>", "<Next>", "<Home>", "<End>"):
+            tree.bind(sequence, self._on_key, add="+")
+
+    @property
+    def total(self):
+        return self.source.total if self.source is not None else 0
+
+    def set_source(self, source):
+        """ نمایش یک منبع داده جدید از ابتدای لیست، با حفظ مرتب‌سازی انتخاب شده کاربر در صورت امکان """
+        if self.sort is not None and not source.can_sort(self.sort[0]):
+            self.sort = None
+        source.set_sort(self.sort)
+        self.source = source
+        self.top = 0
+        self._update_headings()
+        self.render()
+
+    def sort_by(self, column_id):
+        """ مرتب‌سازی بر اساس یک ستون؛ کلیک دوباره روی همان ستون جهت را برعکس می‌کند """
+        if self.source is None or not self.source.can_sort(column_id):
+            return
+        descending = not self.sort[1] if self.sort is not None and self.sort[0] == column_id else False
+        self.sort = (column_id, descending)
+        self.source.set_sort(self.sort)
+        self.top = 0
+        self._update_headings()
+        self.render()
+
+    def scroll_to(self, top):
+        """ تغییر اولین ردیف نمایش داده شده؛ رسم در after_idle انجام می‌شود تا رویدادهای پشت سر هم یکی شوند """
+        top = max(min(top, self.total - self.visible_rows), 0)
+        if top == self.top:
+            return
+        self.top = top
+        self._update_scrollbar()
+        if self._render_id is None:
+            self._render_id = self.tree.after_idle(self.render)
+
+    def apply_change(self, operation, iid, load_values):
+        """
+        اعمال تغییر یک ردیف (change_events.INSERT/UPDATE/DELETE) روی منبع داده و رسم دوباره پنجره فعلی.
+        load_values() فقط در صورت نیاز فراخوانی می‌شود و values جدید ردیف (یا None) را برمی‌گرداند.
+        خروجی False یعنی منبع داده نمی‌تواند تغییر را اعمال کند و باید دوباره ساخته شود.
+        """
+        if self.source is None:
+            return True
+        applied = self.source.apply_change(operation, str(iid), load_values, self.columns)
+        if applied:
+            self._schedule_refresh()
+        return applied
+
+    def invalidate(self):
+        """ خواندن دوباره ردیف‌های قابل مشاهده از منبع داده؛ خروجی مانند apply_change """
+        if self.source is None:
+            return True
+        applied = self.source.invalidate()
+        if applied:
+            self._schedule_refresh()
+        return applied
+
+    def _schedule_refresh(self):
+        # چند تغییر پشت سر هم (مثلاً درج دسته‌ای) فقط یک بار رسم می‌شوند
+        self.top = max(min(self.top, self.total - self.visible_rows), 0)
+        self._update_scrollbar()
+        if self._render_id is None:
+            self._render_id = self.tree.after_idle(self.render)
+
+    def render(self):
+        """ همگام کردن ردیف‌های جدول با پنجره فعلی منبع داده (فقط تفاوت‌ها اعمال می‌شوند) """
+        if self._render_id is not None:
+            self.tree.after_cancel(self._render_id)
+            self._render_id = None
+        rows = self.source.get_rows(self.top, self.top + self.visible_rows) if self.source is not None else []
+        new_ids = {iid for iid, _ in rows}
+        stale = [iid for iid in self.tree.get_children() if iid not in new_ids]
+        if stale:
+            self.tree.delete(*stale)
+        for index, (iid, values) in enumerate(rows):
+            if self.tree.exists(iid):
+                self.tree.item(iid, values=values)
+                self.tree.move(iid, "", index)
+            else:
+                self.tree.insert("", index, iid=iid, values=values)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        total = self.total
+        if total <= self.visible_rows:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.top / total, min((self.top + self.visible_rows) / total, 1.0))
+
+    def _update_headings(self):
+        for column_id, text in self._headings.items():
+            if self.sort is not None and self.sort[0] == column_id:
+                text += self.SORT_ARROWS[self.sort[1]]
+            self.tree.heading(column_id, text=text)
+
+    def _row_height(self):
+        try:
+            return int(ttk.Style().lookup(self.tree.cget("style") or "Treeview", "rowheight")) or 20
+        except (ValueError, TypeError):
+            return 20
+
+    def _on_configure(self, event):
+        # یک ردیف برای سربرگ کم می‌شود تا ردیف آخر نیمه پنهان نماند و جدول خودش اسکرول نکند
+        visible_rows = max(event.height // self._row_height() - 1, 1)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.top = max(min(self.top, self.total - visible_rows), 0)
+            self.render()
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(round(float(value) * self.total))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll_to(self.top + int(value) * step)
+
+    def _on_mousewheel(self, event):
+        if event.num == 4:
+            delta = -self.WHEEL_ROWS
+        elif event.num == 5:
+            delta = self.WHEEL_ROWS
+        elif abs(event.delta) >= 120: # ویندوز: مضرب 120
+            delta = -(event.delta // 120) * self.WHEEL_ROWS
+        else: # macOS: گام‌های کوچک
+            delta = -event.delta
+        self.scroll_to(self.top + delta)
+        return "break"
+
+    def _on_key(self, event):
+        children = self.tree.get_children()
+        if not children:
+            return None
+        focus = self.tree.focus()
+        current = self.top + (children.index(focus) if focus in children else 0)
+        targets = {
+            "Up": current - 1, "Down": current + 1,
+            "Prior": current - self.visible_rows, "Next": current + self.visible_rows,
+            "Home": 0, "End": self.total - 1,
+        }
+        target = max(min(targets[event.keysym], self.total - 1), 0)
+        if event.keysym in ("Up", "Down") and self.top <= target < self.top + len(children):
+            return None # حرکت داخل پنجره فعلی با رفتار پیش‌فرض Treeview
+        if target < self.top:
+            self.scroll_to(target)
+        elif target >= self.top + self.visible_rows:
+            self.scroll_to(target - self.visible_rows + 1)
+        self.render()
+        children = self.tree.get_children()
+        if 0 <= target - self.top < len(children):
+            iid = children[target - self.top]
+            self.tree.selection_set(iid)
+            self.tree.focus(iid)
+        return "break"